@@ -0,0 +1,97 @@
+import math
+from datetime import datetime
+
+from sqlalchemy import insert, select, func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import Incident, IncidentRollup
+
+# --- ESTATÍSTICAS DE OCORRÊNCIAS ---
+# Em vez de varrer "incidents" para montar mapa de calor e tendência,
+# mantemos incident_rollups: uma linha por (célula do mapa, hora, status).
+# Cada pânico soma 1 em OPEN; cada fechamento tira 1 de OPEN e soma 1 em
+# CLOSED, na mesma transação que grava a ocorrência. As consultas só leem
+# a tabela de contagens, que não cresce com o número de chamados.
+
+ROLLUP_CELL_DEG = 0.01  # ~1,1 km, mesma grade do despacho (geo_index.py)
+
+
+def cell_of(lat: float, lng: float):
+    return math.floor(lat / ROLLUP_CELL_DEG), math.floor(lng / ROLLUP_CELL_DEG)
+
+
+def hour_of(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert(dialect_name):
+    return postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+
+
+async def bump(db, lat: float, lng: float, opened_at: datetime, status: str, delta: int = 1):
+    # Chamar antes do commit da ocorrência: a contagem entra na mesma transação
+    if lat is None or lng is None or opened_at is None:
+        return
+    row, col = cell_of(lat, lng)
+    insert = _upsert(db.bind.dialect.name)
+    stmt = insert(IncidentRollup).values(cell_row=row, cell_col=col, hour=hour_of(opened_at),
+                                         status=status, count=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["cell_row", "cell_col", "hour", "status"],
+        set_={"count": IncidentRollup.count + delta})
+    await db.execute(stmt)
+
+
+def rebuild_rollups(conn):
+    # Migração: banco antigo sem contagens -> monta tudo uma vez a partir de incidents.
+    # Pelas colunas tipadas (como em bump): no SQLite a hora vira texto e o
+    # formato tem que ser o mesmo para a chave bater no upsert
+    if conn.execute(select(IncidentRollup.hour).limit(1)).first():
+        return
+    counts = {}
+    rows = conn.execute(select(Incident.latitude, Incident.longitude, Incident.opened_at, Incident.status)
+                        .where(Incident.opened_at.is_not(None)))
+    for lat, lng, opened_at, status in rows:
+        if lat is None or lng is None:
+            continue
+        key = (*cell_of(lat, lng), hour_of(opened_at), status)
+        counts[key] = counts.get(key, 0) + 1
+    if counts:
+        conn.execute(insert(IncidentRollup), [
+            {"cell_row": row, "cell_col": col, "hour": hour, "status": status, "count": count}
+            for (row, col, hour, status), count in counts.items()])
+
+
+def _window(stmt, since, until, status):
+    if since:
+        stmt = stmt.where(IncidentRollup.hour >= hour_of(since))
+    if until:
+        stmt = stmt.where(IncidentRollup.hour < until)
+    if status:
+        stmt = stmt.where(IncidentRollup.status == status)
+    return stmt
+
+
+async def heatmap(db, since=None, until=None, status=None):
+    total = func.sum(IncidentRollup.count)
+    stmt = select(IncidentRollup.cell_row, IncidentRollup.cell_col, total).group_by(
+        IncidentRollup.cell_row, IncidentRollup.cell_col).having(total > 0)
+    rows = (await db.execute(_window(stmt, since, until, status))).all()
+    half = ROLLUP_CELL_DEG / 2
+    return [{
+        "lat": round(row * ROLLUP_CELL_DEG + half, 6),  # Centro da célula
+        "lng": round(col * ROLLUP_CELL_DEG + half, 6),
+        "count": count,
+    } for row, col, count in rows]
+
+
+async def trend(db, since=None, until=None, status=None, bucket="hour"):
+    stmt = select(IncidentRollup.hour, func.sum(IncidentRollup.count)).group_by(IncidentRollup.hour)
+    rows = (await db.execute(_window(stmt, since, until, status))).all()
+    series = {}
+    for hour, count in rows:
+        if isinstance(hour, str):
+            hour = datetime.fromisoformat(hour)
+        key = hour.replace(hour=0) if bucket == "day" else hour
+        series[key] = series.get(key, 0) + count
+    return [{"time": key.isoformat(), "count": series[key]} for key in sorted(series)]
@@ -1,9 +1,12 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
+from sqlalchemy import Float, cast, text, tuple_
 from datetime import datetime
 from decimal import Decimal
+import json
+import math
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
 from dotenv import load_dotenv
@@ -54,9 +57,15 @@ class Ocorrencia(db.Model):
     latitude = db.Column(db.Numeric(10,8))
     longitude = db.Column(db.Numeric(11,8))
     status = db.Column(db.String(30), default='nova')
-    criado_em = db.Column(db.DateTime)
+    criado_em = db.Column(db.DateTime, default=datetime.now)
     atualizado_em = db.Column(db.DateTime)
 
+    __table_args__ = (
+        db.Index('ix_ocorrencias_status_criado_em', 'status', 'criado_em', 'id'),  # Lista por status, mais novas primeiro
+        db.Index('ix_ocorrencias_criado_em', 'criado_em', 'id'),                   # Lista sem filtro de status
+        db.Index('ix_ocorrencias_lat_lng', 'latitude', 'longitude'),               # Filtro por área do mapa
+    )
+
 
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -111,30 +120,94 @@ def criar_ocorrencia():
     db.session.add(ocorrencia)
     db.session.commit()
     
-    # Notifica painel via socket
-    socketio.emit('nova_ocorrencia', {
+    # Notifica o painel e só os agentes da área (e das áreas vizinhas)
+    evento = {
         'id': ocorrencia.id,
         'titulo': ocorrencia.titulo,
-        'latitude': str(ocorrencia.latitude),
-        'longitude': str(ocorrencia.longitude)
-    })
+        'latitude': float(ocorrencia.latitude),
+        'longitude': float(ocorrencia.longitude)
+    }
+    for sala in ['painel'] + salas_vizinhas(evento['latitude'], evento['longitude']):
+        socketio.emit('nova_ocorrencia', evento, room=sala)
     
     return jsonify({'id': ocorrencia.id, 'status': 'criada'}), 201
 
-# Rota painel: GET /ocorrencias
+# --- LISTAGEM (PAGINADA POR CURSOR) ---
+# Ordem: mais novas primeiro (criado_em, id). O cursor é "criado_em|id" da
+# última linha da página e vem no cabeçalho X-Next-Cursor; a próxima página
+# continua dali pelo índice, sem OFFSET (custa o mesmo na página 1 ou 1000).
+# Filtros: ?status=nova  ?bbox=sul,oeste,norte,leste  ?limit=100
+# ?formato=ndjson devolve tudo o que bate com o filtro, uma linha por ocorrência
+# (com ?limit, só as primeiras `limit`, como na lista).
+LIMITE_PADRAO = 100
+LIMITE_MAXIMO = 500
+NDJSON_LOTE = 1000
+
+def consulta_ocorrencias(status=None, bbox=None):
+    consulta = db.session.query(
+        Ocorrencia.id, Ocorrencia.titulo, Ocorrencia.status, Ocorrencia.cidadao_id, Ocorrencia.agente_id,
+        cast(Ocorrencia.latitude, Float), cast(Ocorrencia.longitude, Float), Ocorrencia.criado_em)
+    if status:
+        consulta = consulta.filter(Ocorrencia.status == status)
+    if bbox:
+        sul, oeste, norte, leste = bbox
+        consulta = consulta.filter(Ocorrencia.latitude.between(sul, norte), Ocorrencia.longitude.between(oeste, leste))
+    return consulta.order_by(Ocorrencia.criado_em.desc(), Ocorrencia.id.desc())
+
+def ocorrencia_json(linha):
+    return {
+        'id': linha[0],
+        'titulo': linha[1],
+        'status': linha[2],
+        'cidadao_id': linha[3],
+        'agente_id': linha[4],
+        'latitude': linha[5],
+        'longitude': linha[6],
+        'criado_em': linha[7].isoformat() if linha[7] else None
+    }
+
+def ler_bbox(valor):
+    if not valor:
+        return None
+    partes = [float(v) for v in valor.split(',')]
+    if len(partes) != 4:
+        raise ValueError
+    return partes
+
 @app.route('/ocorrencias', methods=['GET'])
 @jwt_required()
 def listar_ocorrencias():
-    ocorrencias = Ocorrencia.query.all()
-    return jsonify([{
-        'id': o.id,
-        'titulo': o.titulo,
-        'status': o.status,
-        'cidadao_id': o.cidadao_id,
-        'agente_id': o.agente_id,
-        'latitude': str(o.latitude),
-        'longitude': str(o.longitude)
-    } for o in ocorrencias])
+    try:
+        bbox = ler_bbox(request.args.get('bbox'))
+        limite = min(int(request.args.get('limit', LIMITE_PADRAO)), LIMITE_MAXIMO)
+        if limite < 1:
+            raise ValueError('limit')
+    except ValueError:
+        return jsonify({'erro': 'bbox deve ser sul,oeste,norte,leste e limit um número positivo'}), 400
+    consulta = consulta_ocorrencias(request.args.get('status'), bbox)
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            criado_em, ultimo_id = cursor.rsplit('|', 1)
+            consulta = consulta.filter(tuple_(Ocorrencia.criado_em, Ocorrencia.id) <
+                                       tuple_(datetime.fromisoformat(criado_em), int(ultimo_id)))
+        except ValueError:
+            return jsonify({'erro': 'cursor inválido'}), 400
+
+    if request.args.get('formato') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', ''):
+        linhas = consulta.limit(limite) if 'limit' in request.args else consulta
+        def gerar():
+            # yield_per: o banco manda aos poucos, a memória não cresce com a tabela
+            for linha in linhas.yield_per(NDJSON_LOTE):
+                yield json.dumps(ocorrencia_json(linha), ensure_ascii=False) + '\n'
+        return Response(stream_with_context(gerar()), mimetype='application/x-ndjson')
+
+    linhas = consulta.limit(limite).all()
+    resposta = jsonify([ocorrencia_json(linha) for linha in linhas])
+    # criado_em nulo não tem como virar cursor (preparar_banco preenche as antigas)
+    if len(linhas) == limite and linhas[-1][7] is not None:
+        resposta.headers['X-Next-Cursor'] = f'{linhas[-1][7].isoformat()}|{linhas[-1][0]}'
+    return resposta
 
 # Rota atribuir
 @app.route('/ocorrencias/<int:id>/atribuir', methods=['PATCH'])
@@ -154,12 +227,54 @@ def atribuir_ocorrencia(id):
     
     return jsonify({'status': 'atribuida'})
 
+# --- SALAS POR ÁREA ---
+# O mapa é dividido em células de AREA_GRAUS (~5,5 km). Cada agente fica na
+# sala da célula onde está ('area_<linha>_<coluna>') e uma ocorrência nova vai
+# para a célula dela e as 8 vizinhas, além da sala 'painel'.
+AREA_GRAUS = float(os.getenv('AREA_GRAUS', '0.05'))
+area_do_socket = {}  # sid -> sala de área atual
+
+def sala_da_area(linha, coluna):
+    return f'area_{linha}_{coluna}'
+
+def celula(latitude, longitude):
+    return math.floor(latitude / AREA_GRAUS), math.floor(longitude / AREA_GRAUS)
+
+def salas_vizinhas(latitude, longitude):
+    linha, coluna = celula(latitude, longitude)
+    return [sala_da_area(linha + dl, coluna + dc) for dl in (-1, 0, 1) for dc in (-1, 0, 1)]
+
+def mudar_area(latitude, longitude):
+    nova = sala_da_area(*celula(float(latitude), float(longitude)))
+    antiga = area_do_socket.get(request.sid)
+    if antiga != nova:
+        if antiga:
+            leave_room(antiga)
+        join_room(nova)
+        area_do_socket[request.sid] = nova
+
 # Socket events
+# Agente: io(url, {query: {agente_id: 7, latitude: .., longitude: ..}})
+# Painel: sem agente_id (entra na sala 'painel' e recebe todas as ocorrências)
 @socketio.on('connect')
 def handle_connect():
     agente_id = request.args.get('agente_id')
     if agente_id:
+        join_room(f'agente_{agente_id}')
+        if request.args.get('latitude') and request.args.get('longitude'):
+            mudar_area(request.args['latitude'], request.args['longitude'])
         emit('conectado', {'msg': 'Pronto para receber'})
+    else:
+        join_room('painel')
+
+# O app do agente manda a posição quando muda de lugar: {latitude, longitude}
+@socketio.on('atualizar_posicao')
+def handle_atualizar_posicao(data):
+    mudar_area(data['latitude'], data['longitude'])
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    area_do_socket.pop(request.sid, None)
 
 from flask import render_template
 
@@ -168,8 +283,21 @@ def painel():
     return render_template('index.html')
 
 
+def preparar_banco():
+    db.create_all()
+    # create_all não mexe em tabela que já existe: cria os índices que faltam
+    for indice in Ocorrencia.__table__.indexes:
+        indice.create(db.engine, checkfirst=True)
+    # Linhas antigas sem criado_em ficariam fora da paginação
+    db.session.execute(text("UPDATE ocorrencias SET criado_em = COALESCE(atualizado_em, CURRENT_TIMESTAMP) "
+                            "WHERE criado_em IS NULL"))
+    db.session.commit()
+
+# Ao importar, e não só no __main__: gunicorn/flask run também passam por aqui
+with app.app_context():
+    preparar_banco()
+
+
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
     socketio.run(app, debug=True)
 
@@ -0,0 +1,208 @@
+import asyncio
+import gzip
+import json
+import os
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+
+from database import SessionLocal
+from models import ArchivedIncident, ChatMessage, Incident, IncidentResponder, User
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos (lá roda um worker só)
+    fcntl = None
+
+# --- ARQUIVO MORTO (OCORRÊNCIAS FECHADAS ANTIGAS) ---
+# Ocorrências fechadas há mais de ARCHIVE_AFTER_DAYS saem das tabelas
+# quentes (incidents, chat_messages, incident_responders) e vão para um
+# arquivo por mês de fechamento, uma ocorrência por linha em JSON:
+#     archive/2026-01.jsonl.gz
+#     {"incident": {...}, "messages": [...], "responders": [...]}
+# Cada rodada acrescenta um bloco gzip novo no fim do arquivo (gzip aceita
+# vários blocos seguidos). A tabela archived_incidents guarda, por
+# ocorrência, o mês e o byte onde o bloco começa: achar uma ocorrência ou
+# filtrar por vítima/período descompacta só os blocos necessários.
+#
+# O arquivo é gravado (com fsync) antes da transação que apaga as linhas e
+# grava o índice. Se o processo cair no meio, a próxima rodada grava de novo
+# e o bloco antigo fica órfão (o índice nunca aponta para ele).
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))  # 0 desliga
+ARCHIVE_EVERY_S = int(os.getenv("ARCHIVE_EVERY_S", "3600"))
+ARCHIVE_BATCH = 500  # Ocorrências por transação (e por bloco gzip)
+READ_CHUNK = 64 * 1024
+
+
+def partition_of(closed_at: datetime) -> str:
+    return closed_at.strftime("%Y-%m")
+
+
+def partition_path(partition: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"{partition}.jsonl.gz")
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+# --- GRAVAÇÃO ---
+def _append_block(partition: str, records) -> int:
+    # Devolve o byte onde o bloco começa
+    data = gzip.compress("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode())
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with open(partition_path(partition), "ab") as f:
+        offset = f.tell()
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return offset
+
+
+def archive_batch(older_than: datetime, limit: int = ARCHIVE_BATCH):
+    # Uma rodada (síncrona, rodar numa thread). Devolve os ids arquivados.
+    with SessionLocal() as db:
+        incidents = db.scalars(select(Incident)
+                               .where(Incident.status == "CLOSED", Incident.closed_at < older_than)
+                               .order_by(Incident.closed_at).limit(limit)).all()
+        if not incidents:
+            return []
+        ids = [incident.id for incident in incidents]
+        names = dict(db.execute(select(User.id, User.full_name)
+                                .where(User.id.in_({incident.user_id for incident in incidents}))).all())
+        messages = {}
+        for m in db.scalars(select(ChatMessage).where(ChatMessage.incident_id.in_(ids)).order_by(ChatMessage.id)):
+            messages.setdefault(m.incident_id, []).append({
+                "id": m.id, "sender_name": m.sender_name, "content": m.content,
+                "timestamp": m.timestamp, "sent_at": _iso(m.sent_at),
+            })
+        responders = {}
+        for incident_id, agent_id in db.execute(select(IncidentResponder.incident_id, IncidentResponder.agent_id)
+                                                .where(IncidentResponder.incident_id.in_(ids))):
+            responders.setdefault(incident_id, []).append(agent_id)
+
+        by_partition = {}
+        for incident in incidents:
+            by_partition.setdefault(partition_of(incident.closed_at), []).append({
+                "incident": {
+                    "id": incident.id, "user_id": incident.user_id, "victim_name": names.get(incident.user_id),
+                    "status": incident.status, "latitude": incident.latitude, "longitude": incident.longitude,
+                    "created_at": incident.created_at, "opened_at": _iso(incident.opened_at),
+                    "closed_at": _iso(incident.closed_at),
+                },
+                "messages": messages.get(incident.id, []),
+                "responders": responders.get(incident.id, []),
+            })
+        for partition, records in by_partition.items():
+            offset = _append_block(partition, records)
+            db.add_all(ArchivedIncident(incident_id=r["incident"]["id"], user_id=r["incident"]["user_id"],
+                                        opened_at=datetime.fromisoformat(r["incident"]["opened_at"])
+                                        if r["incident"]["opened_at"] else None,
+                                        closed_at=datetime.fromisoformat(r["incident"]["closed_at"]),
+                                        partition=partition, block_offset=offset) for r in records)
+        db.execute(delete(ChatMessage).where(ChatMessage.incident_id.in_(ids)))
+        db.execute(delete(IncidentResponder).where(IncidentResponder.incident_id.in_(ids)))
+        db.execute(delete(Incident).where(Incident.id.in_(ids)))
+        db.commit()
+        return ids
+
+
+# --- LEITURA ---
+def read_block(partition: str, offset: int):
+    # Descompacta só o bloco gzip que começa em "offset"
+    decoder = zlib.decompressobj(wbits=31)
+    data = bytearray()
+    with open(partition_path(partition), "rb") as f:
+        f.seek(offset)
+        while not decoder.eof:
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                break
+            data += decoder.decompress(chunk)
+    return [json.loads(line) for line in data.decode().splitlines() if line]
+
+
+def _matches(record, text):
+    if not text:
+        return True
+    text = text.lower()
+    return any(text in (m["content"] or "").lower() for m in record["messages"]) \
+        or text in (record["incident"]["victim_name"] or "").lower()
+
+
+async def search(db, since=None, until=None, user_id=None, text=None, limit=None):
+    # Gera as ocorrências arquivadas que batem com o filtro, em ordem de
+    # fechamento; cada bloco é lido uma vez só, numa thread
+    stmt = select(ArchivedIncident.incident_id, ArchivedIncident.partition,
+                  ArchivedIncident.block_offset)
+    if since:
+        stmt = stmt.where(ArchivedIncident.closed_at >= since)
+    if until:
+        stmt = stmt.where(ArchivedIncident.closed_at < until)
+    if user_id is not None:
+        stmt = stmt.where(ArchivedIncident.user_id == user_id)
+    rows = (await db.execute(stmt.order_by(ArchivedIncident.closed_at, ArchivedIncident.incident_id))).all()
+    blocks = {}  # (mês, byte) -> ids, na ordem em que aparecem
+    for incident_id, partition, offset in rows:
+        blocks.setdefault((partition, offset), set()).add(incident_id)
+    sent = 0
+    for (partition, offset), wanted in blocks.items():
+        for record in await asyncio.to_thread(read_block, partition, offset):
+            if record["incident"]["id"] in wanted and _matches(record, text):
+                yield record
+                sent += 1
+                if limit and sent >= limit:
+                    return
+
+
+async def get(db, incident_id: int):
+    row = await db.get(ArchivedIncident, incident_id)
+    if row is None:
+        return None
+    for record in await asyncio.to_thread(read_block, row.partition, row.block_offset):
+        if record["incident"]["id"] == incident_id:
+            return record
+    return None
+
+
+# --- ROTINA ---
+class ArchiveJob:
+    def __init__(self, on_archived):
+        self.on_archived = on_archived  # async fn(ids): avisa os workers (feed em memória)
+        self.task = None
+
+    def start(self):
+        if ARCHIVE_AFTER_DAYS > 0:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    async def run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Erro ao arquivar ocorrências: {e}")
+            await asyncio.sleep(ARCHIVE_EVERY_S)
+
+    async def run_once(self, now: datetime = None):
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        older_than = (now or datetime.now()) - timedelta(days=ARCHIVE_AFTER_DAYS)
+        with open(os.path.join(ARCHIVE_DIR, ".lock"), "w") as lock:
+            try:  # Com vários workers só um arquiva por vez
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            total = 0
+            while True:
+                ids = await asyncio.to_thread(archive_batch, older_than)
+                if not ids:
+                    return total
+                total += len(ids)
+                await self.on_archived(ids)
@@ -0,0 +1,217 @@
+"""Teste de carga do /ws/monitor e /api/panic contra um servidor rodando.
+
+Simula N agentes e M vítimas mandando GPS no intervalo real dos apps,
+disparando pânicos, conversando no chat e pedindo despacho, e mede:
+  - pânico -> entrega (POST /api/panic até o NEW_PANIC_ALERT chegar nos agentes)
+  - despacho (DISPATCH_NEAREST até DISPATCH_CONFIRMED)
+  - chat (SEND_CHAT_MESSAGE até o eco NEW_CHAT_MESSAGE)
+  - mensagens recebidas por segundo
+  - memória do servidor por conexão (com --server-pid)
+
+Uso:
+    uvicorn main:app --port 8000 &
+    python benchmarks/load_test.py --agents 500 --victims 200 --duration 60 --server-pid $!
+
+Dependências extras: pip install -r benchmarks/requirements.txt
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+import httpx
+import websockets
+
+CITY = (-16.05, -48.15, -15.60, -47.70)
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {"panic_delivery": [], "dispatch": [], "chat": []}
+        self.received = 0
+        self.errors = 0
+
+    def add(self, name, seconds):
+        self.latencies[name].append(seconds * 1000)
+
+    def report(self, elapsed):
+        print(f"\n{'métrica':18} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for name, values in self.latencies.items():
+            if not values:
+                print(f"{name:18} {0:7}")
+                continue
+            values = sorted(values)
+            pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]  # noqa: E731
+            print(f"{name:18} {len(values):7} {pick(0.50):9.1f} {pick(0.95):9.1f} {pick(0.99):9.1f} {values[-1]:9.1f}")
+        print(f"\nmensagens recebidas: {self.received} ({self.received / elapsed:.0f}/s), erros: {self.errors}")
+
+
+def random_point(rng):
+    south, west, north, east = CITY
+    return rng.uniform(south, north), rng.uniform(west, east)
+
+
+def server_rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+async def ensure_user(http, username, role):
+    # Cria (ou reaproveita) um usuário de teste e devolve o id
+    await http.post("/register", json={"username": username, "password": "bench", "role": role, "full_name": username})
+    r = await http.post("/token", data={"username": username, "password": "bench"})
+    r.raise_for_status()
+    return r.json()["user_id"]
+
+
+async def agent(ws_url, user_id, args, stats, panic_sent, stop):
+    rng = random.Random(user_id)
+    lat, lng = random_point(rng)
+    async with websockets.connect(ws_url, max_queue=None) as ws:
+        await ws.send(json.dumps({"type": "SUBSCRIBE", "topics": ["role:AGENT", f"agent:{user_id}"]}))
+
+        async def gps():
+            nonlocal lat, lng
+            await asyncio.sleep(rng.uniform(0, args.interval))  # Espalha os envios
+            while not stop.is_set():
+                lat += rng.uniform(-0.001, 0.001)
+                lng += rng.uniform(-0.001, 0.001)
+                await ws.send(json.dumps({"type": "AGENT_LOCATION_UPDATE", "user_id": user_id,
+                                          "name": f"agente{user_id}", "lat": lat, "lng": lng}))
+                await asyncio.sleep(args.interval)
+
+        sender = asyncio.create_task(gps())
+        try:
+            while not stop.is_set():
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), 1)
+                except asyncio.TimeoutError:
+                    continue
+                stats.received += 1
+                data = json.loads(raw)
+                if data.get("type") == "NEW_PANIC_ALERT" and "victim_id" in data:
+                    started = panic_sent.get(data["victim_id"])
+                    if started:
+                        stats.add("panic_delivery", time.perf_counter() - started)
+        finally:
+            sender.cancel()
+
+
+async def victim(ws_url, http, user_id, args, stats, panic_sent, stop):
+    rng = random.Random(-user_id)
+    lat, lng = random_point(rng)
+    chat_sent = {}
+    incident_id = None
+    async with websockets.connect(ws_url, max_queue=None) as ws:
+        await ws.send(json.dumps({"type": "SUBSCRIBE", "topics": [f"victim:{user_id}"]}))
+
+        async def behave():
+            nonlocal incident_id
+            await asyncio.sleep(rng.uniform(0, args.interval))
+            for tick in itertools.count():
+                if stop.is_set():
+                    return
+                await ws.send(json.dumps({"type": "VICTIM_LOCATION_UPDATE", "user_id": user_id,
+                                          "name": f"vitima{user_id}", "lat": lat, "lng": lng}))
+                if incident_id is None and rng.random() < args.panic_rate:
+                    panic_sent[user_id] = time.perf_counter()
+                    r = await http.post("/api/panic", json={"user_id": user_id, "latitude": lat, "longitude": lng})
+                    if r.status_code == 201:
+                        incident_id = r.json()["incident_id"]
+                    else:
+                        stats.errors += 1
+                elif incident_id is not None and rng.random() < args.chat_rate:
+                    token = f"{user_id}-{tick}"
+                    chat_sent[token] = time.perf_counter()
+                    await ws.send(json.dumps({"type": "SEND_CHAT_MESSAGE", "incident_id": incident_id,
+                                              "sender_name": f"vitima{user_id}", "content": token}))
+                await asyncio.sleep(args.interval)
+
+        sender = asyncio.create_task(behave())
+        try:
+            while not stop.is_set():
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), 1)
+                except asyncio.TimeoutError:
+                    continue
+                stats.received += 1
+                data = json.loads(raw)
+                if data.get("type") == "NEW_CHAT_MESSAGE":
+                    started = chat_sent.pop(data.get("content"), None)
+                    if started:
+                        stats.add("chat", time.perf_counter() - started)
+        finally:
+            sender.cancel()
+
+
+async def dispatcher(ws_url, args, stats, stop):
+    # Faz o papel do painel pedindo DISPATCH_NEAREST de tempos em tempos
+    rng = random.Random(0)
+    async with websockets.connect(ws_url, max_queue=None) as ws:
+        await ws.send(json.dumps({"type": "SUBSCRIBE", "topics": ["role:DASHBOARD"]}))
+        await ws.send(json.dumps({"type": "SET_VIEWPORT", "bbox": {"south": 0, "west": 0, "north": 0, "east": 0}}))
+        while not stop.is_set():
+            lat, lng = random_point(rng)
+            started = time.perf_counter()
+            await ws.send(json.dumps({"type": "DISPATCH_NEAREST", "incident_id": 0, "victim_name": "bench",
+                                      "location": {"lat": lat, "lng": lng}}))
+            while True:
+                data = json.loads(await ws.recv())
+                stats.received += 1
+                if data.get("type") in ("DISPATCH_CONFIRMED", "NO_AGENTS_AVAILABLE"):
+                    stats.add("dispatch", time.perf_counter() - started)
+                    break
+            await asyncio.sleep(args.dispatch_every)
+
+
+async def run(args):
+    base = args.url.rstrip("/")
+    ws_url = base.replace("http", "ws", 1) + "/ws/monitor"
+    stats = Stats()
+    panic_sent = {}
+    stop = asyncio.Event()
+
+    async with httpx.AsyncClient(base_url=base, timeout=30) as http:
+        print("criando usuários de teste...")
+        agent_ids = [await ensure_user(http, f"bench_agent_{i}", "AGENT") for i in range(args.agents)]
+        victim_ids = [await ensure_user(http, f"bench_victim_{i}", "VICTIM") for i in range(args.victims)]
+
+        rss_before = server_rss_kb(args.server_pid) if args.server_pid else None
+        tasks = [asyncio.create_task(agent(ws_url, uid, args, stats, panic_sent, stop)) for uid in agent_ids]
+        tasks += [asyncio.create_task(victim(ws_url, http, uid, args, stats, panic_sent, stop)) for uid in victim_ids]
+        tasks.append(asyncio.create_task(dispatcher(ws_url, args, stats, stop)))
+
+        print(f"rodando {args.duration}s com {args.agents} agentes e {args.victims} vítimas...")
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        if rss_before is not None:
+            connections = args.agents + args.victims + 1
+            delta = server_rss_kb(args.server_pid) - rss_before
+            print(f"memória do servidor: +{delta} kB ({delta / connections:.1f} kB por conexão)")
+        stop.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        stats.errors += sum(1 for r in results if isinstance(r, Exception))
+        stats.report(time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--agents", type=int, default=100)
+    parser.add_argument("--victims", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--interval", type=float, default=10, help="segundos entre GPS (10 = igual aos apps)")
+    parser.add_argument("--panic-rate", type=float, default=0.05, help="chance de pânico por tick de cada vítima")
+    parser.add_argument("--chat-rate", type=float, default=0.3, help="chance de mensagem por tick (com chamado aberto)")
+    parser.add_argument("--dispatch-every", type=float, default=1.0)
+    parser.add_argument("--server-pid", type=int)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Micro-benchmarks dos caminhos quentes (despacho, broadcast, quadro de posições).
+
+Uso (da raiz do projeto):
+    python benchmarks/micro.py                      # roda e imprime a tabela
+    python benchmarks/micro.py --save base.json     # guarda o resultado
+    python benchmarks/micro.py --compare base.json  # falha (exit 1) se piorou mais que --tolerance
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo_index import GridIndex, calculate_distance  # noqa: E402
+from realtime import ConnectionManager  # noqa: E402
+from position_ticker import PositionTicker  # noqa: E402
+from wire import Frame  # noqa: E402
+
+# Área parecida com uma cidade média (~50 km x 50 km)
+CITY = (-16.05, -48.15, -15.60, -47.70)
+
+
+def random_point(rng):
+    south, west, north, east = CITY
+    return rng.uniform(south, north), rng.uniform(west, east)
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6  # µs por operação
+
+
+class FakeSocket:
+    client = None
+
+    def __init__(self, subprotocols=()):
+        self.scope = {"subprotocols": list(subprotocols)}
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, data):
+        pass
+
+    async def send_bytes(self, data):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+
+async def drain(manager):
+    # Espera as tarefas de envio esvaziarem as filas antes da próxima medida
+    while any(conn.outbox for conn in manager.connections.values()):
+        await asyncio.sleep(0.001)
+
+
+def bench_dispatch(rng, agents, repeat):
+    index = GridIndex()
+    positions = {}
+    for agent_id in range(agents):
+        positions[agent_id] = random_point(rng)
+        index.upsert(agent_id, *positions[agent_id])
+    queries = [random_point(rng) for _ in range(repeat)]
+
+    it = iter(queries)
+    grid_us = timed(lambda: index.nearest(*next(it), k=3), repeat)
+
+    it = iter(queries)
+
+    def linear():
+        lat, lng = next(it)
+        sorted(positions, key=lambda a: calculate_distance(lat, lng, *positions[a]))[:3]
+
+    linear_us = timed(linear, min(repeat, 200))
+
+    updates = [(rng.randrange(agents), *random_point(rng)) for _ in range(repeat)]
+    it = iter(updates)
+    upsert_us = timed(lambda: index.upsert(*next(it)), repeat)
+    return {
+        f"dispatch_grid_k3_{agents}": grid_us,
+        f"dispatch_linear_k3_{agents}": linear_us,
+        f"index_upsert_{agents}": upsert_us,
+    }
+
+
+async def bench_broadcast(connections, repeat):
+    manager = ConnectionManager()
+    # Um em cada quatro pede o formato binário
+    sockets = [FakeSocket(["sos.msgpack"] if i % 4 == 0 else []) for i in range(connections)]
+    for i, ws in enumerate(sockets):
+        await manager.connect(ws)
+        # Metade assina um chamado específico, metade fica no modo "recebe tudo"
+        if i % 2:
+            manager.subscribe(ws, [f"incident:{i % 50}"])
+    message = {"type": "NEW_CHAT_MESSAGE", "incident_id": 1, "content": "x" * 80}
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await manager.broadcast(message)
+    fanout_us = (time.perf_counter() - start) / repeat * 1e6
+    # Envio de tudo que ficou na fila (inclui codificar o que faltar)
+    start = time.perf_counter()
+    await drain(manager)
+    send_us = (time.perf_counter() - start) / repeat * 1e6
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await manager.broadcast(message, topics=["incident:1"])
+    topic_us = (time.perf_counter() - start) / repeat * 1e6
+
+    for ws in sockets:
+        manager.disconnect(ws)
+    await asyncio.sleep(0)
+    return {
+        f"broadcast_all_{connections}": fanout_us,
+        f"broadcast_all_send_{connections}": send_us,
+        f"broadcast_topic_{connections}": topic_us,
+    }
+
+
+async def bench_ticker(rng, entities, connections, repeat):
+    manager = ConnectionManager()
+    sockets = [FakeSocket() for _ in range(connections)]
+    for ws in sockets:
+        await manager.connect(ws)
+    ticker = PositionTicker(manager, interval_ms=0)
+    total = 0.0
+    for _ in range(repeat):
+        for entity_id in range(entities):
+            ticker.latest[("agent", entity_id)] = {
+                **dict(zip(("lat", "lng"), random_point(rng))), "name": "x", "topics": ["role:DASHBOARD"]}
+            ticker.dirty.add(("agent", entity_id))
+        start = time.perf_counter()
+        ticker.flush()
+        total += time.perf_counter() - start
+        for conn in manager.connections.values():
+            conn.outbox.clear()
+    for ws in sockets:
+        manager.disconnect(ws)
+    await asyncio.sleep(0)
+    return {f"ticker_flush_{entities}x{connections}": total / repeat * 1e6}
+
+
+def bench_wire(rng, repeat):
+    # Custo (µs/op) e tamanho (bytes, fora da comparação) de um AGENT_MOVED em cada formato
+    lat, lng = random_point(rng)
+    message = {"type": "AGENT_MOVED", "agent_id": 123, "location": {"lat": lat, "lng": lng}, "name": "Viatura 12"}
+    results = {"encode_json_agent_moved": timed(lambda: Frame(message).text(), repeat)}
+    sizes = {"json_agent_moved": len(Frame(message).text().encode())}
+    try:
+        results["encode_msgpack_agent_moved"] = timed(lambda: Frame(message).binary(), repeat)
+        sizes["msgpack_agent_moved"] = len(Frame(message).binary())
+    except AttributeError:  # msgpack não instalado
+        pass
+    return results, sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=5000)
+    parser.add_argument("--connections", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save")
+    parser.add_argument("--compare")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="piora aceitável (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {}
+    results.update(bench_dispatch(rng, args.agents, args.repeat))
+    results.update(asyncio.run(bench_broadcast(args.connections, max(args.repeat // 10, 10))))
+    results.update(asyncio.run(bench_ticker(rng, 500, 50, 20)))
+    wire_us, sizes = bench_wire(rng, args.repeat)
+    results.update(wire_us)
+
+    baseline, base_sizes = {}, {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        base_sizes = baseline.pop("sizes", {})
+
+    regressions = []
+    print(f"{'benchmark':40} {'µs/op':>12} {'base':>12}")
+    for name, value in results.items():
+        base = baseline.get(name)
+        mark = ""
+        if base and value > base * (1 + args.tolerance):
+            mark = "  <-- PIOROU"
+            regressions.append(name)
+        base_text = f"{base:12.2f}" if base else " " * 12
+        print(f"{name:40} {value:12.2f} {base_text}{mark}")
+
+    # Tamanho não é tempo: só informativo, não entra no "PIOROU"
+    print(f"\n{'mensagem':40} {'bytes':>12} {'base':>12}")
+    for name, size in sizes.items():
+        base = base_sizes.get(name)
+        print(f"{name:40} {size:12d} {base if base else '':>12}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({**results, "sizes": sizes}, f, indent=2)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
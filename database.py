@@ -0,0 +1,202 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event, inspect, select, text, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from models import Base, ChatMessage, Incident
+from analytics import rebuild_rollups
+from metrics import SQL_SECONDS
+
+# --- BANCO DE DADOS ---
+# Dois caminhos para o mesmo banco:
+#   engine / SessionLocal             -> rotas síncronas (rodam no threadpool)
+#   async_engine / AsyncSessionLocal  -> rotas async e WebSocket (não travam o loop)
+SQLALCHEMY_DATABASE_URL = os.getenv("SOS_DATABASE_URL", "sqlite:///./banco_de_dados.db")
+
+
+def async_url(url: str) -> str:
+    # sqlite -> aiosqlite, postgresql -> asyncpg
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:"):
+        return url.replace("postgresql:", "postgresql+asyncpg:", 1)
+    if url.startswith("postgres:"):
+        return url.replace("postgres:", "postgresql+asyncpg:", 1)
+    return url
+
+
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+connect_args = {"check_same_thread": False} if IS_SQLITE else {}
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_engine(async_url(SQLALCHEMY_DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+if IS_SQLITE:
+    # WAL deixa leitores e o escritor trabalharem ao mesmo tempo
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    event.listen(engine, "connect", _sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+
+# --- TEMPO DOS COMANDOS SQL (sos_sql_seconds em /metrics) ---
+SQL_VERBS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    verb = statement.lstrip()[:6].upper()
+    SQL_SECONDS.observe(time.perf_counter() - context._metrics_start, verb if verb in SQL_VERBS else "OTHER")
+
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+# --- MIGRAÇÕES LEVES ---
+# create_all só cria tabela que não existe. Para bancos antigos adicionamos
+# aqui as colunas e índices novos e preenchemos o que dá para recuperar.
+# Datas sempre pelas colunas tipadas (select/update do modelo), nunca em SQL
+# cru: no SQLite viram texto e têm que sair no mesmo formato que o ORM grava.
+
+def _backfill_incident_opened_at(conn):
+    rows = conn.execute(select(Incident.id, Incident.created_at).where(Incident.opened_at.is_(None))).fetchall()
+    for incident_id, created_at in rows:
+        try:
+            opened_at = datetime.strptime(created_at, "%d/%m/%Y às %H:%M")
+        except (TypeError, ValueError):
+            continue
+        conn.execute(update(Incident).where(Incident.id == incident_id).values(opened_at=opened_at))
+
+
+def _backfill_incident_closed_at(conn):
+    # Fechados antes de existir closed_at: sem a data nunca iriam para o
+    # arquivo morto. A melhor estimativa que sobrou é a abertura
+    conn.execute(update(Incident)
+                 .where(Incident.status == "CLOSED", Incident.closed_at.is_(None), Incident.opened_at.is_not(None))
+                 .values(closed_at=Incident.opened_at))
+
+
+def _backfill_chat_sent_at(conn):
+    # Mensagens antigas só têm "HH:MM": usamos o dia em que o chamado abriu
+    # (e o dia seguinte se o horário for anterior à abertura)
+    rows = conn.execute(select(ChatMessage.id, ChatMessage.timestamp, Incident.opened_at)
+                        .join(Incident, Incident.id == ChatMessage.incident_id)
+                        .where(ChatMessage.sent_at.is_(None), Incident.opened_at.is_not(None))).fetchall()
+    for message_id, timestamp, opened_at in rows:
+        try:
+            clock = datetime.strptime(timestamp, "%H:%M").time()
+        except (TypeError, ValueError):
+            continue
+        sent_at = datetime.combine(opened_at.date(), clock)
+        if sent_at < opened_at.replace(second=0, microsecond=0):
+            sent_at += timedelta(days=1)
+        conn.execute(update(ChatMessage).where(ChatMessage.id == message_id).values(sent_at=sent_at))
+
+
+BACKFILLS = [_backfill_incident_opened_at, _backfill_incident_closed_at, _backfill_chat_sent_at, rebuild_rollups]
+
+
+def migrate(bind=engine, attempts: int = 5):
+    # Vários workers sobem juntos: se outro estiver migrando ao mesmo tempo
+    # ("already exists", banco travado) espera e refaz, já que tudo é idempotente
+    for attempt in range(attempts):
+        try:
+            _migrate(bind)
+            return
+        except OperationalError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.2 * (attempt + 1))
+
+
+def _migrate(bind):
+    Base.metadata.create_all(bind=bind)
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = column.type.compile(dialect=bind.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {ddl}"))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        for backfill in BACKFILLS:
+            backfill(conn)
+
+
+migrate()
+
+
+def get_db():
+    db = SessionLocal()
+    try: yield db
+    finally: db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# --- ESCRITA AGRUPADA DO CHAT ---
+# Cada mensagem do chat espera no máximo CHAT_FLUSH_MS e entra num commit só
+# com as outras que chegaram junto. Quem chamou add() só segue depois do
+# commit, então a mensagem está gravada antes de ir para os sockets.
+CHAT_FLUSH_MS = int(os.getenv("CHAT_FLUSH_MS", "5"))
+CHAT_MAX_BATCH = int(os.getenv("CHAT_MAX_BATCH", "200"))
+
+
+class ChatWriteBehind:
+    def __init__(self, session_factory=AsyncSessionLocal, flush_ms: int = CHAT_FLUSH_MS, max_batch: int = CHAT_MAX_BATCH):
+        self.session_factory = session_factory
+        self.delay = flush_ms / 1000
+        self.max_batch = max_batch
+        self.pending = []  # [(ChatMessage, Future)]
+        self.timer = None
+
+    async def add(self, message):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((message, future))
+        if len(self.pending) >= self.max_batch:
+            asyncio.create_task(self.flush())
+        elif self.timer is None:
+            self.timer = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.delay)
+        self.timer = None
+        await self.flush()
+
+    async def flush(self):
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        try:
+            async with self.session_factory() as session:
+                session.add_all([message for message, _ in batch])
+                await session.commit()
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for message, future in batch:
+            if not future.done():
+                future.set_result(message)
@@ -0,0 +1,232 @@
+import asyncio
+import glob
+import hashlib
+import os
+import re
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, Request
+from fastapi.staticfiles import StaticFiles
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+
+try:
+    import PIL  # noqa: F401  (só para saber se dá para gerar miniaturas)
+except ImportError:  # pip install pillow para ter miniaturas
+    PIL = None
+
+# --- EVIDÊNCIAS (FOTOS E VÍDEOS DO CHAT) ---
+# O upload é lido do corpo da requisição aos pedaços: cada pedaço vai para o
+# SHA-256 e para um arquivo temporário (escrita numa thread, sem travar o
+# loop). Passou de EVIDENCE_MAX_BYTES, a requisição é cortada com 413.
+# O arquivo final se chama <sha256><ext>, então a mesma foto reenviada é
+# gravada uma vez só e a URL nunca muda de conteúdo (cache "immutable").
+#
+#   uploads/<aa>/<sha256>.jpg                 original
+#   uploads/thumbs/<aa>/<sha256>_thumb.jpg    miniatura (lado maior THUMB_PX)
+#   uploads/thumbs/<aa>/<sha256>_preview.jpg  prévia (lado maior PREVIEW_PX)
+#
+# Miniatura e prévia são feitas por um pool de processos depois da resposta.
+
+UPLOAD_DIR = "uploads"
+EVIDENCE_MAX_BYTES = int(os.getenv("EVIDENCE_MAX_BYTES", str(50 * 1024 * 1024)))
+THUMB_WORKERS = int(os.getenv("EVIDENCE_THUMB_WORKERS", "2"))
+THUMB_PX = 320
+PREVIEW_PX = 1280
+VARIANTS = {"thumb": THUMB_PX, "preview": PREVIEW_PX}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp"}
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+
+SHA_RE = re.compile(r"^[0-9a-f]{64}$")
+EXT_RE = re.compile(r"^\.[a-z0-9]{1,8}$")
+
+_pool = None
+_jobs = set()
+
+
+def _original_glob(sha: str) -> str:
+    return os.path.join(UPLOAD_DIR, sha[:2], f"{sha}.*")
+
+
+def find_original(sha: str):
+    matches = glob.glob(_original_glob(sha))
+    return matches[0] if matches else None
+
+
+def variant_path(sha: str, variant: str) -> str:
+    return os.path.join(UPLOAD_DIR, "thumbs", sha[:2], f"{sha}_{variant}.jpg")
+
+
+def _render_variants(source: str, targets):
+    # Roda em outro processo: abre a imagem uma vez e gera cada tamanho
+    from PIL import Image, ImageOps
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        for path, size in targets:
+            copy = image.copy()
+            copy.thumbnail((size, size))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Nome temporário único: dois envios da mesma foto podem gerar ao mesmo tempo
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+            try:
+                os.chmod(tmp_path, 0o644)  # mkstemp cria 0600; o /uploads precisa ler
+                with os.fdopen(fd, "wb") as f:
+                    copy.convert("RGB").save(f, "JPEG", quality=80, optimize=True)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+
+def schedule_variants(sha: str, path: str):
+    global _pool
+    if PIL is None or os.path.splitext(path)[1] not in IMAGE_EXTENSIONS:
+        return
+    targets = [(variant_path(sha, name), size) for name, size in VARIANTS.items()
+               if not os.path.exists(variant_path(sha, name))]
+    if not targets:
+        return
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=THUMB_WORKERS)
+    job = asyncio.get_running_loop().run_in_executor(_pool, _render_variants, path, targets)
+    _jobs.add(job)
+    job.add_done_callback(_job_done)
+
+
+def _job_done(job):
+    _jobs.discard(job)
+    if not job.cancelled() and job.exception():
+        print(f"Erro ao gerar miniatura: {job.exception()}")
+
+
+def shutdown():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _Upload:
+    # Estado do parser multipart: só o campo "file" interessa
+    def __init__(self):
+        self.headers = {}
+        self.field = b""
+        self.value = b""
+        self.active = False
+        self.found = False
+        self.filename = None
+        self.pending = bytearray()
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self.headers = {}
+
+    def on_header_field(self, data, start, end):
+        self.field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self.value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self.field.lower()] = self.value
+        self.field = self.value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        if options.get(b"name") == b"file" and not self.found:
+            self.active = self.found = True
+            self.filename = options.get(b"filename", b"").decode("utf-8", "replace")
+
+    def on_part_data(self, data, start, end):
+        if self.active:
+            self.pending += data[start:end]
+
+    def on_part_end(self):
+        self.active = False
+
+
+async def receive(request: Request, max_bytes: int = EVIDENCE_MAX_BYTES):
+    # Devolve (sha256, caminho, já_existia)
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=400, detail="Envie multipart/form-data com o campo 'file'")
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > max_bytes + 64 * 1024:  # Folga para os cabeçalhos do multipart
+        raise HTTPException(status_code=413, detail="Arquivo grande demais")
+
+    upload = _Upload()
+    parser = MultipartParser(options[b"boundary"], upload.callbacks())
+    hasher = hashlib.sha256()
+    size = 0
+    os.makedirs(os.path.join(UPLOAD_DIR, ".tmp"), exist_ok=True)
+    tmp_path = os.path.join(UPLOAD_DIR, ".tmp", f"{uuid.uuid4().hex}.part")
+    out = None
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except MultipartParseError:
+                raise HTTPException(status_code=400, detail="multipart inválido")
+            if not upload.pending:
+                continue
+            data = bytes(upload.pending)
+            upload.pending.clear()
+            size += len(data)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail="Arquivo grande demais")
+            hasher.update(data)
+            if out is None:
+                out = await asyncio.to_thread(open, tmp_path, "wb")
+            await asyncio.to_thread(out.write, data)
+        parser.finalize()
+        if not upload.found:
+            raise HTTPException(status_code=400, detail="Campo 'file' não enviado")
+        if out is None:
+            raise HTTPException(status_code=400, detail="Arquivo vazio")
+        await asyncio.to_thread(out.close)
+        out = None
+
+        sha = hasher.hexdigest()
+        existing = find_original(sha)
+        if existing:
+            await asyncio.to_thread(os.remove, tmp_path)
+            return sha, existing, True
+        ext = os.path.splitext(upload.filename or "")[1].lower() or ".png"
+        if not EXT_RE.match(ext):
+            ext = ".bin"
+        final_path = os.path.join(UPLOAD_DIR, sha[:2], f"{sha}{ext}")
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        await asyncio.to_thread(os.replace, tmp_path, final_path)
+        return sha, final_path, False
+    finally:
+        if out is not None:
+            out.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class EvidenceFiles(StaticFiles):
+    # /uploads com Range (vem do FileResponse) e cache forte: nomes por hash
+    # (e os antigos, por uuid) nunca mudam de conteúdo
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        headers = {"Cache-Control": CACHE_IMMUTABLE}
+        stem = os.path.splitext(os.path.basename(full_path))[0]
+        if SHA_RE.match(stem.split("_")[0]):
+            headers["ETag"] = f'"{stem}"'  # ETag forte: o próprio hash
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
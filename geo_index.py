@@ -0,0 +1,148 @@
+import math
+
+# --- ÍNDICE ESPACIAL EM GRADE ---
+# Divide o mapa em células de CELL_DEG graus (~1,1 km na linha do Equador).
+# Cada célula guarda os ids que estão dentro dela, então uma busca só
+# olha as células ao redor do ponto em vez de varrer todo mundo.
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEG = 111.195  # 2 * pi * R / 360
+CELL_DEG = 0.01
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    # Fórmula de Haversine para calcular distância em KM
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat/2) * math.sin(dlat/2) + \
+        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * \
+        math.sin(dlon/2) * math.sin(dlon/2)
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    return EARTH_RADIUS_KM * c
+
+
+class GridIndex:
+    def __init__(self, cell_deg: float = CELL_DEG):
+        self.cell_deg = cell_deg
+        self.cells = {}      # (linha, coluna) -> set(ids)
+        self.positions = {}  # id -> (lat, lng, célula)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def upsert(self, key, lat: float, lng: float):
+        cell = self._cell(lat, lng)
+        old = self.positions.get(key)
+        if old and old[2] != cell:
+            self._discard(key, old[2])
+        if not old or old[2] != cell:
+            self.cells.setdefault(cell, set()).add(key)
+        self.positions[key] = (lat, lng, cell)
+
+    def remove(self, key):
+        old = self.positions.pop(key, None)
+        if old:
+            self._discard(key, old[2])
+
+    def _discard(self, key, cell):
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self.cells[cell]
+
+    def get(self, key):
+        pos = self.positions.get(key)
+        return (pos[0], pos[1]) if pos else None
+
+    def _ring(self, center, r):
+        # Células na "borda" do quadrado de raio r (distância de Chebyshev)
+        row, col = center
+        if r == 0:
+            yield center
+            return
+        for c in range(col - r, col + r + 1):
+            yield (row - r, c)
+            yield (row + r, c)
+        for lin in range(row - r + 1, row + r):
+            yield (lin, col - r)
+            yield (lin, col + r)
+
+    def _min_km_outside(self, lat, r):
+        # Distância mínima garantida até qualquer célula fora do anel r.
+        # A longitude encolhe com o cosseno da latitude, então usamos a
+        # latitude mais "polar" coberta pelo anel para não subestimar.
+        if r <= 0:
+            return 0.0
+        worst_lat = min(89.0, abs(lat) + (r + 1) * self.cell_deg)
+        shrink = math.cos(math.radians(worst_lat))
+        return r * self.cell_deg * KM_PER_DEG * shrink
+
+    def _scan_all(self, lat, lng, max_km=None):
+        found = []
+        for key, (a_lat, a_lng, _) in self.positions.items():
+            dist = calculate_distance(lat, lng, a_lat, a_lng)
+            if max_km is None or dist <= max_km:
+                found.append((dist, key))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def nearest(self, lat: float, lng: float, k: int = 1, max_km: float = None):
+        # Retorna [(distância_km, id), ...] ordenado, com no máximo k itens
+        if not self.positions or k <= 0:
+            return []
+        center = self._cell(lat, lng)
+        found = []
+        seen_cells = 0
+        r = 0
+        while True:
+            for cell in self._ring(center, r):
+                seen_cells += 1
+                for key in self.cells.get(cell, ()):
+                    a_lat, a_lng, _ = self.positions[key]
+                    found.append((calculate_distance(lat, lng, a_lat, a_lng), key))
+            # Grade muito esparsa: varrer tudo sai mais barato que abrir anéis vazios
+            if seen_cells > len(self.positions) * 4 and len(found) < k:
+                return self._scan_all(lat, lng, max_km)[:k]
+            # Quem ainda não foi visto está a pelo menos r células de distância
+            bound = self._min_km_outside(lat, r)
+            found.sort(key=lambda item: item[0])
+            if max_km is not None and bound > max_km:
+                return [item for item in found if item[0] <= max_km][:k]
+            if len(found) >= k and found[k - 1][0] <= bound:
+                return found[:k]
+            if len(found) == len(self.positions):
+                return found[:k]
+            r += 1
+
+    def within_radius(self, lat: float, lng: float, radius_km: float):
+        # Todos os ids dentro do raio, do mais perto para o mais longe
+        if not self.positions:
+            return []
+        shrink = max(math.cos(math.radians(min(89.0, abs(lat) + radius_km / KM_PER_DEG))), 0.01)
+        d_lat = radius_km / KM_PER_DEG
+        d_lng = d_lat / shrink
+        min_row, min_col = self._cell(lat - d_lat, lng - d_lng)
+        max_row, max_col = self._cell(lat + d_lat, lng + d_lng)
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self.cells):
+            # Raio cobre mais células do que as ocupadas: percorre só as ocupadas
+            cells = [c for c in self.cells
+                     if min_row <= c[0] <= max_row and min_col <= c[1] <= max_col]
+        else:
+            cells = [(lin, col) for lin in range(min_row, max_row + 1)
+                     for col in range(min_col, max_col + 1)]
+        found = []
+        for cell in cells:
+            for key in self.cells.get(cell, ()):
+                a_lat, a_lng, _ = self.positions[key]
+                dist = calculate_distance(lat, lng, a_lat, a_lng)
+                if dist <= radius_km:
+                    found.append((dist, key))
+        found.sort(key=lambda item: item[0])
+        return found
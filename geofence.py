@@ -0,0 +1,163 @@
+import os
+
+from geo_index import GridIndex, calculate_distance
+
+# --- MEDIDAS PROTETIVAS (CERCAS VIRTUAIS) ---
+# Cada medida liga um agressor a uma vítima com uma distância mínima, e pode
+# ter zonas fixas (casa, trabalho) com raio próprio. A cada posição nova só
+# o que envolve aquela pessoa é conferido:
+#   vítima se mexeu   -> só as medidas dela (distância até o agressor)
+#   agressor se mexeu -> as medidas dele + as zonas perto dele (GridIndex)
+# Histerese: entra em violação abaixo do raio e só sai acima de
+# raio * (1 + GEOFENCE_HYSTERESIS), para o GPS oscilando na borda não
+# disparar alerta a cada ponto.
+#
+# Eventos gerados (publicados pelo main.py no hub):
+#   {"type": "GEOFENCE_BREACH",  "measure_id", "target": "victim" | "zone:<id>", "distance_m", ...}
+#   {"type": "GEOFENCE_CLEARED", "measure_id", "target", "distance_m", ...}
+# Todo worker aplica esses eventos (apply_event), então o estado "dentro"
+# é o mesmo em todos e o alerta não sai repetido.
+
+GEOFENCE_HYSTERESIS = float(os.getenv("GEOFENCE_HYSTERESIS", "0.2"))
+ZONE_CELL_DEG = 0.01
+
+
+class Measure:
+    __slots__ = ("id", "victim_id", "aggressor_id", "radius_km", "zones")
+
+    def __init__(self, measure_id, victim_id, aggressor_id, min_distance_m):
+        self.id = measure_id
+        self.victim_id = victim_id
+        self.aggressor_id = aggressor_id
+        self.radius_km = min_distance_m / 1000
+        self.zones = {}  # zone_id -> (rótulo, lat, lng, raio_km)
+
+
+class GeofenceEngine:
+    def __init__(self, hysteresis: float = GEOFENCE_HYSTERESIS):
+        self.hysteresis = hysteresis
+        self.measures = {}      # measure_id -> Measure
+        self.by_victim = {}     # victim_id -> {measure_id}
+        self.by_aggressor = {}  # aggressor_id -> {measure_id}
+        self.zone_owner = {}    # zone_id -> measure_id
+        self.zone_index = GridIndex(ZONE_CELL_DEG)
+        self.max_zone_km = 0.0
+        self.victims = {}       # victim_id -> (lat, lng), só de quem tem medida
+        self.aggressors = {}    # aggressor_id -> (lat, lng)
+        self.inside = set()     # (measure_id, alvo) em violação agora
+
+    # --- CADASTRO ---
+    def add_measure(self, measure_id, victim_id, aggressor_id, min_distance_m, zones=()):
+        self.remove_measure(measure_id)
+        measure = Measure(measure_id, victim_id, aggressor_id, min_distance_m)
+        self.measures[measure_id] = measure
+        self.by_victim.setdefault(victim_id, set()).add(measure_id)
+        self.by_aggressor.setdefault(aggressor_id, set()).add(measure_id)
+        for zone in zones:
+            radius_km = zone["radius_m"] / 1000
+            measure.zones[zone["id"]] = (zone.get("label"), zone["lat"], zone["lng"], radius_km)
+            self.zone_owner[zone["id"]] = measure_id
+            self.zone_index.upsert(zone["id"], zone["lat"], zone["lng"])
+            self.max_zone_km = max(self.max_zone_km, radius_km)
+
+    def remove_measure(self, measure_id):
+        measure = self.measures.pop(measure_id, None)
+        if measure is None:
+            return
+        for index, key in ((self.by_victim, measure.victim_id), (self.by_aggressor, measure.aggressor_id)):
+            ids = index.get(key)
+            ids.discard(measure_id)
+            if not ids:
+                del index[key]
+        for zone_id in measure.zones:
+            self.zone_owner.pop(zone_id, None)
+            self.zone_index.remove(zone_id)
+        self.inside = {key for key in self.inside if key[0] != measure_id}
+
+    # --- POSIÇÕES ---
+    def move(self, kind: str, entity_id, lat: float, lng: float):
+        # Guarda a posição de quem tem medida; as outras são ignoradas
+        if kind == "victim" and entity_id in self.by_victim:
+            self.victims[entity_id] = (lat, lng)
+        elif kind == "aggressor" and entity_id in self.by_aggressor:
+            self.aggressors[entity_id] = (lat, lng)
+
+    def check(self, kind: str, entity_id):
+        # Transições (eventos) causadas pela última posição dessa pessoa
+        events = []
+        if kind == "victim":
+            for measure_id in self.by_victim.get(entity_id, ()):
+                events.extend(self._check_pair(self.measures[measure_id]))
+        elif kind == "aggressor":
+            for measure_id in self.by_aggressor.get(entity_id, ()):
+                events.extend(self._check_pair(self.measures[measure_id]))
+            events.extend(self._check_zones(entity_id))
+        return events
+
+    def _check_pair(self, measure):
+        victim = self.victims.get(measure.victim_id)
+        aggressor = self.aggressors.get(measure.aggressor_id)
+        if victim is None or aggressor is None:
+            return []
+        dist = calculate_distance(*victim, *aggressor)
+        event = self._transition(measure, "victim", dist, measure.radius_km)
+        return [event] if event else []
+
+    def _check_zones(self, aggressor_id):
+        position = self.aggressors.get(aggressor_id)
+        if position is None or not self.max_zone_km:
+            return []
+        mine = self.by_aggressor.get(aggressor_id, ())
+        # Zonas perto dele + as que ele já está violando (para detectar a saída)
+        candidates = {zone_id for _, zone_id in
+                      self.zone_index.within_radius(*position, self.max_zone_km * (1 + self.hysteresis))
+                      if self.zone_owner.get(zone_id) in mine}
+        candidates.update(int(target[5:]) for measure_id, target in self.inside
+                          if measure_id in mine and target.startswith("zone:"))
+        events = []
+        for zone_id in candidates:
+            measure = self.measures[self.zone_owner[zone_id]]
+            label, lat, lng, radius_km = measure.zones[zone_id]
+            dist = calculate_distance(*position, lat, lng)
+            event = self._transition(measure, f"zone:{zone_id}", dist, radius_km, label)
+            if event:
+                events.append(event)
+        return events
+
+    def _transition(self, measure, target, dist_km, radius_km, label=None):
+        key = (measure.id, target)
+        if key not in self.inside and dist_km < radius_km:
+            self.inside.add(key)
+            kind = "GEOFENCE_BREACH"
+        elif key in self.inside and dist_km > radius_km * (1 + self.hysteresis):
+            self.inside.discard(key)
+            kind = "GEOFENCE_CLEARED"
+        else:
+            return None
+        event = {
+            "type": kind,
+            "measure_id": measure.id,
+            "victim_id": measure.victim_id,
+            "aggressor_id": measure.aggressor_id,
+            "target": target,
+            "distance_m": round(dist_km * 1000),
+            "limit_m": round(radius_km * 1000),
+            "location": dict(zip(("lat", "lng"), self.aggressors[measure.aggressor_id])),
+        }
+        if label:
+            event["zone_label"] = label
+        return event
+
+    # --- SINCRONIA ENTRE WORKERS ---
+    def apply_event(self, message: dict):
+        kind = message.get("type")
+        if kind == "GEOFENCE_BREACH":
+            self.inside.add((message["measure_id"], message["target"]))
+        elif kind == "GEOFENCE_CLEARED":
+            self.inside.discard((message["measure_id"], message["target"]))
+        elif kind == "MEASURE_UPDATED":
+            if message.get("active", True):
+                self.add_measure(message["measure_id"], message["victim_id"], message["aggressor_id"],
+                                 message["min_distance_m"], message.get("zones", ()))
+            else:
+                self.remove_measure(message["measure_id"])
@@ -0,0 +1,152 @@
+import bisect
+import uuid
+from datetime import datetime
+
+from sqlalchemy import select, desc
+
+from models import Incident, User
+
+# --- FEED DE OCORRÊNCIAS EM MEMÓRIA ---
+# Guarda as FEED_CACHE_SIZE ocorrências mais novas já no formato da API.
+# É mantido pelos próprios eventos NEW_PANIC_ALERT / CASE_CLOSED que passam
+# pelo hub, então o painel atualizando a tela não custa consulta ao banco.
+# Consultas que não cabem no cache (páginas muito antigas) vão ao banco.
+
+FEED_CACHE_SIZE = 500
+FEED_EVENTS = {"NEW_PANIC_ALERT", "CASE_CLOSED", "INCIDENTS_ARCHIVED"}
+
+
+def _row(incident_id, victim_name, status, created_at, lat, lng):
+    return {
+        "id": incident_id,
+        "victim_name": victim_name or "Desconhecido",
+        "status": status,
+        "date": created_at,
+        "location": {"lat": lat, "lng": lng},
+    }
+
+
+def _matches(row, opened_at, status, since, until, bbox):
+    if status and row["status"] != status:
+        return False
+    if since and (opened_at is None or opened_at < since):
+        return False
+    if until and (opened_at is None or opened_at >= until):
+        return False
+    if bbox:
+        south, west, north, east = bbox
+        loc = row["location"]
+        if loc["lat"] is None or not (south <= loc["lat"] <= north and west <= loc["lng"] <= east):
+            return False
+    return True
+
+
+def _query(status=None, since=None, until=None, bbox=None, cursor=None):
+    # Uma consulta só, já com o nome da vítima (sem N+1 em users)
+    stmt = (select(Incident.id, User.full_name, Incident.status, Incident.created_at,
+                   Incident.latitude, Incident.longitude, Incident.opened_at)
+            .outerjoin(User, User.id == Incident.user_id)
+            .order_by(desc(Incident.id)))
+    if cursor:
+        stmt = stmt.where(Incident.id < cursor)
+    if status:
+        stmt = stmt.where(Incident.status == status)
+    if since:
+        stmt = stmt.where(Incident.opened_at >= since)
+    if until:
+        stmt = stmt.where(Incident.opened_at < until)
+    if bbox:
+        south, west, north, east = bbox
+        stmt = stmt.where(Incident.latitude.between(south, north), Incident.longitude.between(west, east))
+    return stmt
+
+
+async def fetch_page(db, limit, **filters):
+    rows = (await db.execute(_query(**filters).limit(limit))).all()
+    page = [_row(*r[:6]) for r in rows]
+    next_cursor = page[-1]["id"] if len(page) == limit else None
+    return page, next_cursor
+
+
+class IncidentFeed:
+    def __init__(self, size: int = FEED_CACHE_SIZE):
+        self.size = size
+        self.ids = []        # ids em ordem crescente
+        self.rows = {}       # id -> (linha da API, opened_at)
+        self.loaded = False
+        self.complete = False  # True = o cache tem TODAS as ocorrências do banco
+        self.loading = 0      # Cargas iniciais consultando o banco agora
+        self.buffered = []    # eventos que chegaram durante essa consulta
+        self.epoch = uuid.uuid4().hex[:8]  # ETag de um processo não vale em outro
+        self.version = 0
+
+    async def ensure_loaded(self, db):
+        if self.loaded:
+            return
+        self.loading += 1
+        try:
+            rows = (await db.execute(_query().limit(self.size + 1))).all()
+        finally:
+            self.loading -= 1
+        if self.loaded:  # Outra requisição carregou enquanto esperávamos
+            return
+        self.complete = len(rows) <= self.size
+        for r in rows[:self.size]:
+            self._put(_row(*r[:6]), r[6])
+        self.loaded = True
+        for message in self.buffered:
+            self.apply_event(message)
+        self.buffered = []
+        self.version += 1
+
+    def _put(self, row, opened_at):
+        if row["id"] not in self.rows:
+            bisect.insort(self.ids, row["id"])
+        self.rows[row["id"]] = (row, opened_at)
+        while len(self.ids) > self.size:
+            del self.rows[self.ids.pop(0)]
+            self.complete = False
+
+    def apply_event(self, message: dict):
+        if not self.loaded:
+            # Antes da carga o evento já está no banco que ela vai ler; só o que
+            # chega durante a consulta pode ter ficado de fora
+            if self.loading and message.get("type") in FEED_EVENTS:
+                self.buffered.append(message)
+            return
+        if message.get("type") == "NEW_PANIC_ALERT" and "victim_id" in message:
+            # (O NEW_PANIC_ALERT do despacho não tem victim_id e não é uma ocorrência nova)
+            opened_at = datetime.fromisoformat(message["opened_at"]) if message.get("opened_at") else None
+            self._put(_row(message["incident_id"], message["victim_name"], "OPEN", message["time"],
+                           message["location"]["lat"], message["location"]["lng"]), opened_at)
+            self.version += 1
+        elif message.get("type") == "CASE_CLOSED":
+            # Fora do cache também muda a versão: a página que vem do banco
+            # mudou e o ETag antigo não pode responder 304
+            if message["incident_id"] in self.rows:
+                row, opened_at = self.rows[message["incident_id"]]
+                self.rows[message["incident_id"]] = (dict(row, status="CLOSED"), opened_at)
+            self.version += 1
+        elif message.get("type") == "INCIDENTS_ARCHIVED":
+            # Saíram do banco para o arquivo morto (ver archive.py)
+            for incident_id in message["incident_ids"]:
+                if self.rows.pop(incident_id, None):
+                    self.ids.remove(incident_id)
+            self.version += 1
+
+    def etag(self, query_string: str) -> str:
+        return f'W/"{self.epoch}-{self.version}-{abs(hash(query_string)):x}"'
+
+    def page(self, limit, status=None, since=None, until=None, bbox=None, cursor=None):
+        # Devolve (linhas, próximo cursor) ou None se a resposta não cabe no cache
+        found = []
+        start = bisect.bisect_left(self.ids, cursor) if cursor else len(self.ids)
+        for i in range(start - 1, -1, -1):
+            row, opened_at = self.rows[self.ids[i]]
+            if _matches(row, opened_at, status, since, until, bbox):
+                found.append(row)
+                if len(found) == limit:
+                    return found, row["id"]
+        if self.complete:
+            return found, None
+        return None
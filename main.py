@@ -1,22 +1,40 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, status, File, UploadFile
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, status, Query, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
-from sqlalchemy import create_engine, desc
-from sqlalchemy.orm import sessionmaker, Session
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import List, Optional
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-import shutil
+import asyncio
 import os
-import uuid
-import math # <--- IMPORTANTE PARA CÁLCULO DE DISTÂNCIA
+import time
 
 # Importando modelos
-from models import Base, Incident, ChatMessage, User
+from models import Incident, ChatMessage, User, IncidentResponder, ProtectiveMeasure, ProtectedZone
+from database import AsyncSessionLocal, get_db, get_async_db, ChatWriteBehind
+import json
+from geo_index import GridIndex
+from realtime import ConnectionManager
+from position_ticker import PositionTicker
+from presence import create_hub
+from incident_feed import IncidentFeed, fetch_page
+from replay import ReplayBuffer
+from trail_store import TrailStore, read_track
+from geofence import GeofenceEngine
+from routing import Router
+import analytics
+import archive
+import evidence
+import metrics
+import outbox
+import sync
+from metrics import Gauge, PANIC_SECONDS, DISPATCH_LOOKUP_SECONDS, WS_MESSAGE_SECONDS
 
 # --- CONFIGURAÇÃO DE SEGURANÇA ---
 SECRET_KEY = "segredo_super_secreto_da_guarda"
@@ -26,17 +44,31 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# --- BANCO DE DADOS ---
-SQLALCHEMY_DATABASE_URL = "sqlite:///./banco_de_dados.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="SOS Guarda Municipal API")
+# --- BANCO DE DADOS (ver database.py) ---
+chat_writer = ChatWriteBehind()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await load_measures() # Antes do hub: as posições que ele reaplica já caem nas medidas
+    await hub.start()
+    routing_task = asyncio.create_task(load_router()) # Até terminar, despacho em linha reta
+    await outbox_worker.start()
+    archive_job.start()
+    replay_buffer.start_seq = hub.seq # Antes disso este processo não viu nada
+    yield
+    await chat_writer.flush()
+    await outbox_worker.stop()
+    await archive_job.stop()
+    await hub.stop()
+    await trail_store.stop()
+    evidence.shutdown()
+
+app = FastAPI(title="SOS Guarda Municipal API", lifespan=lifespan)
 
 # Configurações de Pastas e CORS
 os.makedirs("uploads", exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Range e cache forte nos arquivos enviados (ver evidence.py)
+app.mount("/uploads", evidence.EvidenceFiles(directory="uploads"), name="uploads")
 
 app.add_middleware(
     CORSMiddleware,
@@ -44,13 +76,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
-def get_db():
-    db = SessionLocal()
-    try: yield db
-    finally: db.close()
-
 # --- FUNÇÕES ÚTEIS ---
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -71,37 +99,266 @@ def create_access_token(data: dict):
 active_agents = {}
 active_victims = {} # Guarda: {id: {lat, lng, name}}
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    # Fórmula de Haversine para calcular distância em KM
-    R = 6371 
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat/2) * math.sin(dlat/2) + \
-        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * \
-        math.sin(dlon/2) * math.sin(dlon/2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c 
-
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections[:]:
-            try:
-                await connection.send_json(message)
-            except:
-                self.disconnect(connection)
+# Índice espacial das viaturas (atualizado junto com active_agents)
+agent_index = GridIndex()
+DISPATCH_CANDIDATES = 3 # Quantas viaturas reservas mandamos no ranking
+DISPATCH_ROUTE_POOL = int(os.getenv("DISPATCH_ROUTE_POOL", "10")) # Mais próximas em linha reta que vão para o cálculo de rota
+
+# Tempo de chegada pela malha viária (ver routing.py); sem ROUTING_OSM_PATH fica desligado
+router = Router()
+
+async def load_router():
+    try:
+        await asyncio.to_thread(router.load)
+    except Exception as e:
+        print(f"Erro ao carregar a malha viária ({router.path}): {e}")
 
 manager = ConnectionManager()
+# Com POSITION_TICK_MS > 0 as posições saem agrupadas em POSITIONS_SNAPSHOT
+position_ticker = PositionTicker(manager)
+
+# Eventos e presença passam pelo hub: em memória (padrão) ou compartilhados
+# entre workers (PRESENCE_BACKEND=sqlite). Ver presence.py
+hub = create_hub()
+
+# Feed de /api/incidents mantido pelos próprios eventos (ver incident_feed.py)
+incident_feed = IncidentFeed()
+
+# Histórico de posições em arquivos binários (ver trail_store.py)
+trail_store = TrailStore()
+TRAIL_LEAD_MINUTES = 30 # Quanto antes do pânico o trajeto começa por padrão
+
+# Últimos eventos de cada canal, para quem reconecta (ver replay.py)
+replay_buffer = ReplayBuffer()
+RESYNC_MAX_INCIDENTS = 200
+
+# Medidas protetivas ativas e quem está violando agora (ver geofence.py)
+geofence = GeofenceEngine()
+GEOFENCE_TYPES = {"GEOFENCE_BREACH", "GEOFENCE_CLEARED", "MEASURE_UPDATED"}
+
+async def deliver(message: dict, topics, location, seq):
+    incident_feed.apply_event(message)
+    if message.get("type") in GEOFENCE_TYPES:
+        geofence.apply_event(message)
+    frame = replay_buffer.record(message, topics, location, seq)
+    await manager.broadcast(frame, topics=topics, location=location)
+
+def resume_stream(websocket: WebSocket, data: dict) -> bool:
+    # Síncrono de propósito: assinar, achar o que faltou e enfileirar sem
+    # nenhum await no meio (nada novo entra na fila entre uma coisa e outra).
+    # True = o buraco não cabe no buffer: mandar o RESYNC (send_resync)
+    conn = manager.connections.get(websocket)
+    if conn is None:
+        return False
+    if data.get("topics"):
+        manager.subscribe(websocket, data["topics"])
+    since = data.get("event_seq")
+    if since is None: # Primeira conexão: só informa o ponto de partida
+        missed = []
+    elif data.get("epoch") != hub.epoch:
+        missed = None
+    else:
+        missed = replay_buffer.missed(conn.topics if conn.filtered else None, since)
+    if missed is None:
+        return True
+    for frame, location in missed:
+        if conn.sees(location):
+            conn.enqueue(frame)
+    conn.enqueue({"type": "RESUMED", "epoch": hub.epoch, "event_seq": replay_buffer.last_seq,
+                  "replayed": len(missed)})
+    return False
+
+def topic_ids(topics, prefix: str):
+    # {"incident:7", "victim:5"}, "incident:" -> {7}
+    return {int(t[len(prefix):]) for t in topics or () if t.startswith(prefix) and t[len(prefix):].isdigit()}
+
+async def send_resync(websocket: WebSocket):
+    # Estado atual no lugar dos eventos perdidos: chamados abertos que a conexão
+    # acompanha e o id da última mensagem de cada chat assinado (o app busca
+    # o resto com ?since=). Montado depois de assinar: o que chegar no meio
+    # vem ao vivo e também aparece aqui, e o app ignora o repetido pelo id
+    conn = manager.connections.get(websocket)
+    if conn is None:
+        return
+    topics = conn.topics if conn.filtered else None
+    incident_ids, victim_ids = topic_ids(topics, "incident:"), topic_ids(topics, "victim:")
+    stmt = select(Incident.id).where(Incident.status != "CLOSED")
+    if topics is not None and not topics & {"role:AGENT", "role:DASHBOARD"}:
+        # Vítima (ou app que só segue alguns chamados): só os dela
+        stmt = stmt.where(or_(Incident.id.in_(incident_ids), Incident.user_id.in_(victim_ids)))
+    async with AsyncSessionLocal() as db:
+        open_ids = (await db.scalars(stmt.order_by(Incident.id.desc()).limit(RESYNC_MAX_INCIDENTS))).all()
+        chat = dict((await db.execute(select(ChatMessage.incident_id, func.max(ChatMessage.id))
+                                      .where(ChatMessage.incident_id.in_(incident_ids))
+                                      .group_by(ChatMessage.incident_id))).all()) if incident_ids else {}
+    conn.enqueue({"type": "RESYNC", "epoch": hub.epoch, "event_seq": replay_buffer.last_seq,
+                  "incidents": open_ids, "chat": {str(k): v for k, v in chat.items()}})
+
+async def apply_presence(role: str, user_id, info):
+    # Aplica uma mudança de presença (deste worker ou de outro) no estado local
+    if role == "AGGRESSOR": # Só alimenta as cercas; a posição não vai para o painel
+        if info is None:
+            geofence.aggressors.pop(user_id, None)
+        else:
+            geofence.move("aggressor", user_id, info["lat"], info["lng"])
+        return
+    kind = "agent" if role == "AGENT" else "victim"
+    registry = active_agents if role == "AGENT" else active_victims
+    if info is None:
+        registry.pop(user_id, None)
+        if role == "AGENT":
+            agent_index.remove(user_id)
+        position_ticker.remove(kind, user_id)
+        return
+    registry[user_id] = info
+    if role == "AGENT":
+        agent_index.upsert(user_id, info["lat"], info["lng"])
+    else:
+        geofence.move("victim", user_id, info["lat"], info["lng"])
+    topics = ["role:DASHBOARD", f"watch:{kind}:{user_id}"]
+    if position_ticker.enabled:
+        position_ticker.update(kind, user_id, info["lat"], info["lng"], info["name"], topics)
+    else:
+        location = {"lat": info["lat"], "lng": info["lng"]}
+        await manager.broadcast({
+            "type": "AGENT_MOVED" if role == "AGENT" else "VICTIM_MOVED",
+            f"{kind}_id": user_id,
+            "location": location,
+            "name": info["name"]
+        }, topics=topics, location=location)
+
+hub.bind(deliver, apply_presence, manager.link)
+
+# --- TAREFAS DO OUTBOX (ver outbox.py) ---
+# Gravadas junto com o chamado; rodam aqui depois da resposta à vítima.
+# Novo efeito colateral = novo handler + outbox.add na rota.
+outbox_worker = outbox.OutboxWorker()
+
+@outbox_worker.handler("panic_alert")
+async def send_panic_alert(alert_data: dict, key: str):
+    # A vítima passa a ouvir o canal do próprio chamado (chat, status, fechamento)
+    await hub.link(f"victim:{alert_data['victim_id']}", f"incident:{alert_data['incident_id']}")
+    # Se a tarefa rodar de novo (prazo vencido) sai outro event_seq, mas o
+    # mesmo event_id: os clientes descartam o repetido por ele
+    await hub.publish({**alert_data, "event_id": key}, topics=["role:AGENT", "role:DASHBOARD", f"incident:{alert_data['incident_id']}"])
+
+@outbox_worker.handler("notify_contacts")
+async def notify_contacts(data: dict, key: str):
+    # Lugar do envio de SMS/push para os contatos de confiança (a chave vai
+    # para o provedor, que descarta a repetição)
+    print(f"[{key}] Aviso aos contatos de {data['victim_name']}: chamado {data['incident_id']} aberto")
+
+# --- ARQUIVO MORTO (ver archive.py) ---
+async def incidents_archived(ids):
+    # Todos os workers tiram do feed em memória; o painel pode tirar da lista
+    await hub.publish({"type": "INCIDENTS_ARCHIVED", "incident_ids": ids}, topics=["role:DASHBOARD"])
+
+archive_job = archive.ArchiveJob(incidents_archived)
+
+# --- SYNC OFFLINE (ver sync.py) ---
+async def apply_sync(bundle: sync.SyncBundle) -> dict:
+    # Grava o pacote numa transação e avisa só o estado final: a última
+    # posição, o último status e a última mensagem de cada chamado
+    kind = "agent" if bundle.role == "AGENT" else "victim"
+    registry = active_agents if bundle.role == "AGENT" else active_victims
+    # Trajeto completo, no arquivo de pontos atrasados: montado antes do commit
+    # (recibo gravado = ponto garantido no trajeto), enfileirado depois
+    def trail_records(result):
+        return trail_store.encode(kind, bundle.user_id, [(p.ts, p.lat, p.lng) for p in result.locations], late=True)
+    async with AsyncSessionLocal() as db:
+        result = await sync.store(db, bundle, prepare=trail_records)
+        await sync.prune(db)
+    trail_store.extend(result.prepared)
+    if result.locations and bundle.user_id not in registry:
+        # Conectado ao vivo, a posição atual é mais nova que a do pacote.
+        # Fora isso só desenha no mapa: não vira presença (nem viatura despachável)
+        last = result.locations[-1]
+        location = {"lat": last.lat, "lng": last.lng}
+        await hub.publish({
+            "type": "AGENT_MOVED" if bundle.role == "AGENT" else "VICTIM_MOVED",
+            f"{kind}_id": bundle.user_id,
+            "location": location,
+            "name": bundle.name,
+            "offline_at": last.ts,
+        }, topics=["role:DASHBOARD", f"watch:{kind}:{bundle.user_id}"], location=location)
+    latest_chat = {}
+    for message in result.messages:
+        latest_chat.setdefault(message.incident_id, []).append(message)
+    for incident_id, messages in latest_chat.items():
+        last = max(messages, key=lambda m: (m.sent_at, m.id))
+        # "synced" > 1: o app busca as outras com ?since=
+        await hub.publish({**chat_message_json(last), "type": "NEW_CHAT_MESSAGE", "incident_id": incident_id,
+                           "synced": len(messages)},
+                          topics=["role:DASHBOARD", f"incident:{incident_id}"])
+    latest_status = {}
+    for item in sorted(result.status, key=lambda item: item.ts):
+        latest_status[item.incident_id] = item
+    for incident_id, item in latest_status.items():
+        await hub.publish({"type": "STATUS_UPDATE", "incident_id": incident_id, "new_status": item.new_status},
+                          topics=["role:DASHBOARD", f"incident:{incident_id}"])
+    return result.summary()
+
+async def rank_agents(lat: float, lng: float):
+    # Com a malha carregada ganha quem chega antes pela rua (rio, mão única...);
+    # quem não tem rota vai para o fim, na ordem da linha reta
+    if not router.ready:
+        ranked = agent_index.nearest(lat, lng, k=DISPATCH_CANDIDATES)
+        return [{"agent_id": agent_id, "agent_name": active_agents[agent_id]["name"], "distance": round(dist, 2)}
+                for dist, agent_id in ranked]
+    ranked = agent_index.nearest(lat, lng, k=DISPATCH_ROUTE_POOL)
+    distances = {agent_id: dist for dist, agent_id in ranked}
+    etas = await asyncio.to_thread(router.rank, lat, lng,
+                                   [(agent_id, *agent_index.get(agent_id)) for agent_id in distances],
+                                   DISPATCH_CANDIDATES)
+    # rank só devolve menos de k quando as outras não têm rota
+    routed = {agent_id for _, agent_id in etas}
+    order = etas + [(None, agent_id) for agent_id in distances if agent_id not in routed]
+    return [{
+        "agent_id": agent_id,
+        "agent_name": active_agents[agent_id]["name"],
+        "distance": round(distances[agent_id], 2),
+        "eta_s": round(seconds) if seconds is not None else None,
+    } for seconds, agent_id in order[:DISPATCH_CANDIDATES] if agent_id in active_agents]
+
+def measure_event(measure: ProtectiveMeasure) -> dict:
+    return {
+        "type": "MEASURE_UPDATED",
+        "measure_id": measure.id,
+        "victim_id": measure.victim_id,
+        "aggressor_id": measure.aggressor_id,
+        "min_distance_m": measure.min_distance_m,
+        "active": measure.active,
+        "zones": [{"id": z.id, "label": z.label, "lat": z.latitude, "lng": z.longitude, "radius_m": z.radius_m}
+                  for z in measure.zones],
+    }
+
+async def load_measures():
+    async with AsyncSessionLocal() as db:
+        measures = await db.scalars(select(ProtectiveMeasure).where(ProtectiveMeasure.active == True)
+                                    .options(selectinload(ProtectiveMeasure.zones)))
+        for measure in measures:
+            geofence.apply_event(measure_event(measure))
+
+async def check_geofence(kind: str, entity_id):
+    # Só quem acabou de se mexer é conferido; cada transição vira alerta
+    for event in geofence.check(kind, entity_id):
+        # Sem location: alerta de segurança não passa pelo recorte de mapa
+        await hub.publish(event, topics=["role:DASHBOARD", "role:AGENT", f"victim:{event['victim_id']}"])
+
+# --- MÉTRICAS (ver metrics.py) ---
+# Lidas só quando o Prometheus raspa /metrics
+Gauge("sos_active_agents", "Viaturas com posição conhecida", lambda: len(active_agents))
+Gauge("sos_active_victims", "Vítimas com posição conhecida", lambda: len(active_victims))
+Gauge("sos_ws_connections", "Sockets conectados neste worker", lambda: len(manager.connections))
+Gauge("sos_geofence_measures", "Medidas protetivas ativas", lambda: len(geofence.measures))
+Gauge("sos_geofence_breaches", "Medidas com o agressor dentro do limite agora", lambda: len(geofence.inside))
+Gauge("sos_ws_queued_messages", "Mensagens esperando envio em todas as filas de saída",
+      lambda: sum(len(conn.outbox) for conn in manager.connections.values()))
+
+# Tipos conhecidos viram label; o resto cai em OTHER (o cliente não cria séries à toa)
+WS_MESSAGE_TYPES = {"AGENT_LOCATION_UPDATE", "VICTIM_LOCATION_UPDATE", "DISPATCH_NEAREST", "SEND_CHAT_MESSAGE",
+                    "STATUS_UPDATE", "SUBSCRIBE", "UNSUBSCRIBE", "POSITIONS_ACK", "SET_VIEWPORT", "RESUME",
+                    "AGGRESSOR_LOCATION_UPDATE", "SYNC_BUNDLE"}
 
 # --- SCHEMAS ---
 class UserCreate(BaseModel):
@@ -125,6 +382,18 @@ class PanicAlertSchema(BaseModel):
 class IncidentCloseSchema(BaseModel):
     final_report: str
 
+class ProtectedZoneSchema(BaseModel):
+    label: Optional[str] = None
+    latitude: float
+    longitude: float
+    radius_m: float
+
+class ProtectiveMeasureSchema(BaseModel):
+    victim_id: int
+    aggressor_id: int
+    min_distance_m: float
+    zones: List[ProtectedZoneSchema] = []
+
 # --- ROTAS ---
 
 @app.post("/register", status_code=201)
@@ -147,14 +416,16 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
     return {"access_token": access_token, "token_type": "bearer", "role": user.role, "user_id": user.id, "name": user.full_name}
 
 @app.post("/api/panic", status_code=201)
-async def create_panic_alert(alert: PanicAlertSchema, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == alert.user_id).first()
+async def create_panic_alert(alert: PanicAlertSchema, db: AsyncSession = Depends(get_async_db)):
+    started = time.perf_counter()
+    user = await db.get(User, alert.user_id)
     if not user: raise HTTPException(status_code=404)
 
-    new_incident = Incident(user_id=alert.user_id, latitude=alert.latitude, longitude=alert.longitude, status="OPEN")
+    new_incident = Incident(user_id=alert.user_id, latitude=alert.latitude, longitude=alert.longitude, status="OPEN",
+                            opened_at=datetime.now())
     db.add(new_incident)
-    db.commit()
-    db.refresh(new_incident)
+    await analytics.bump(db, alert.latitude, alert.longitude, new_incident.opened_at, "OPEN")
+    await db.flush() # id do chamado para as tarefas (ainda na mesma transação)
 
     alert_data = {
         "type": "NEW_PANIC_ALERT",
@@ -163,63 +434,261 @@ async def create_panic_alert(alert: PanicAlertSchema, db: Session = Depends(get_
         "victim_name": user.full_name,
         "location": {"lat": new_incident.latitude, "lng": new_incident.longitude},
         "time": new_incident.created_at,
+        "opened_at": new_incident.opened_at.isoformat(),
         "message": f"ALERTA: {user.full_name} precisa de ajuda!"
     }
-    await manager.broadcast(alert_data)
+    # Alerta e avisos saem pelo outbox: a resposta só espera este commit
+    outbox.add(db, "panic_alert", alert_data, f"panic_alert:{new_incident.id}")
+    outbox.add(db, "notify_contacts", {"incident_id": new_incident.id, "victim_id": new_incident.user_id,
+                                       "victim_name": user.full_name}, f"notify_contacts:{new_incident.id}")
+    await db.commit() # expire_on_commit=False: id e created_at já estão no objeto
+    outbox_worker.wake()
+    PANIC_SECONDS.observe(time.perf_counter() - started)
     return {"status": "received", "incident_id": new_incident.id}
 # ... (outros imports)
 
 # ROTA PARA O AGENTE (VÊ TUDO)
+# Paginação por cursor: ?cursor=<id do último item da página anterior>
+# O próximo cursor vem no cabeçalho X-Next-Cursor (o corpo continua sendo a lista)
 @app.get("/api/incidents")
-def get_all_incidents(db: Session = Depends(get_db)):
-    # Pega os últimos 50 chamados do sistema inteiro
-    incidents = db.query(Incident).order_by(desc(Incident.id)).limit(50).all()
-    
-    result = []
-    for inc in incidents:
-        # Busca nome da vítima
-        victim_name = "Desconhecido"
-        if inc.victim:
-             victim_name = inc.victim.full_name
-
-        result.append({
-            "id": inc.id,
-            "victim_name": victim_name, # Manda o nome para o agente saber quem foi
-            "status": inc.status,
-            "date": inc.created_at,
-            "location": {"lat": inc.latitude, "lng": inc.longitude}
-        })
-    return result
-
+async def get_all_incidents(
+    request: Request,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[int] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    bbox: Optional[str] = Query(None, description="sul,oeste,norte,leste"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    box = None
+    if bbox:
+        try:
+            box = tuple(float(v) for v in bbox.split(","))
+        except ValueError:
+            box = ()
+        if len(box) != 4:
+            raise HTTPException(status_code=400, detail="bbox deve ser sul,oeste,norte,leste")
+    filters = {"status": status_filter, "since": since, "until": until, "bbox": box, "cursor": cursor}
+
+    await incident_feed.ensure_loaded(db)
+    etag = incident_feed.etag(str(request.query_params))
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    cached = incident_feed.page(limit, **filters)
+    if cached is not None:
+        rows, next_cursor = cached
+    else:
+        rows, next_cursor = await fetch_page(db, limit, **filters)
+
+    headers = {"ETag": etag}
+    if next_cursor:
+        headers["X-Next-Cursor"] = str(next_cursor)
+    return JSONResponse(rows, headers=headers)
+
+def chat_message_json(m: ChatMessage):
+    return {"id": m.id, "sender_name": m.sender_name, "content": m.content,
+            "timestamp": m.timestamp, "sent_at": m.sent_at.isoformat() if m.sent_at else None}
+
+# Histórico do chat, sempre do mais antigo para o mais novo
+#   ?since=<id>            só o que chegou depois da última mensagem que o app já tem
+#   ?before=<id>&limit=50  página anterior (rolando a conversa para cima)
+# Sem limit o histórico vem em streaming, sem montar a lista inteira na memória
 @app.get("/api/incidents/{incident_id}/chat")
-def get_chat_history(incident_id: int, db: Session = Depends(get_db)):
-    messages = db.query(ChatMessage).filter(ChatMessage.incident_id == incident_id).all()
-    return [{"sender_name": m.sender_name, "content": m.content, "timestamp": m.timestamp} for m in messages]
+async def get_chat_history(
+    incident_id: int,
+    since: Optional[int] = None,
+    before: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+):
+    stmt = select(ChatMessage).where(ChatMessage.incident_id == incident_id)
+    if since:
+        stmt = stmt.where(ChatMessage.id > since)
+    if before:
+        stmt = stmt.where(ChatMessage.id < before)
+
+    if limit:
+        # before pega as N mais novas antes do cursor; since pega as N seguintes
+        order = ChatMessage.id.desc() if before and not since else ChatMessage.id
+        async with AsyncSessionLocal() as db:
+            messages = (await db.scalars(stmt.order_by(order).limit(limit))).all()
+        messages = sorted(messages, key=lambda m: m.id)
+        return [chat_message_json(m) for m in messages]
+
+    async def stream():
+        # Sessão própria: precisa viver até o último pedaço ser enviado
+        async with AsyncSessionLocal() as db:
+            result = await db.stream_scalars(stmt.order_by(ChatMessage.id).execution_options(yield_per=200))
+            yield "["
+            first = True
+            async for m in result:
+                yield ("" if first else ",") + json.dumps(chat_message_json(m), ensure_ascii=False)
+                first = False
+            yield "]"
+
+    return StreamingResponse(stream(), media_type="application/json")
+
+# Ocorrências que já saíram do banco, uma por linha (NDJSON), em ordem de fechamento
+# ?since/?until (data de fechamento), ?user_id (vítima), ?q (texto no chat ou nome), ?limit
+@app.get("/api/archive/incidents")
+async def search_archive(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                         user_id: Optional[int] = None, q: Optional[str] = None,
+                         limit: Optional[int] = Query(None, ge=1)):
+    async def stream():
+        async with AsyncSessionLocal() as db:
+            async for record in archive.search(db, since, until, user_id, q, limit):
+                yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/api/archive/incidents/{incident_id}")
+async def get_archived_incident(incident_id: int, db: AsyncSession = Depends(get_async_db)):
+    record = await archive.get(db, incident_id)
+    if not record: raise HTTPException(status_code=404)
+    return record
+
+# Trajeto da vítima e das viaturas despachadas, de ?since até ?until
+# (padrão: TRAIL_LEAD_MINUTES antes do pânico até o fechamento ou agora)
+# {"incident_id": 7, "tracks": [{"kind": "victim", "id": 5, "points": [[unix, lat, lng], ...]}, ...]}
+@app.get("/api/incidents/{incident_id}/trail")
+async def get_incident_trail(incident_id: int, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                             db: AsyncSession = Depends(get_async_db)):
+    incident = await db.get(Incident, incident_id)
+    if not incident: raise HTTPException(status_code=404)
+    agents = (await db.scalars(select(IncidentResponder.agent_id)
+                               .where(IncidentResponder.incident_id == incident_id))).all()
+    opened_at = incident.opened_at or datetime.now()
+    start = (since or opened_at - timedelta(minutes=TRAIL_LEAD_MINUTES)).timestamp()
+    end = (until or incident.closed_at or datetime.now()).timestamp()
+    tracks = [("victim", incident.user_id)] + [("agent", agent_id) for agent_id in agents]
+    await trail_store.flush() # Inclui o que ainda estava no buffer
+
+    async def stream():
+        yield '{"incident_id":%d,"tracks":[' % incident_id
+        for i, (kind, entity_id) in enumerate(tracks):
+            points = await asyncio.to_thread(read_track, kind, entity_id, start, end)
+            yield ("," if i else "") + json.dumps({"kind": kind, "id": entity_id, "points": points})
+        yield "]}"
+
+    return StreamingResponse(stream(), media_type="application/json")
 
 @app.put("/api/incidents/{incident_id}/close")
-async def close_incident(incident_id: int, data: IncidentCloseSchema, db: Session = Depends(get_db)):
-    incident = db.query(Incident).filter(Incident.id == incident_id).first()
+async def close_incident(incident_id: int, data: IncidentCloseSchema, db: AsyncSession = Depends(get_async_db)):
+    incident = await db.get(Incident, incident_id)
     if not incident: raise HTTPException(status_code=404)
+    if incident.status != "CLOSED":
+        # Move a contagem de OPEN para CLOSED na mesma transação
+        await analytics.bump(db, incident.latitude, incident.longitude, incident.opened_at, incident.status, -1)
+        await analytics.bump(db, incident.latitude, incident.longitude, incident.opened_at, "CLOSED")
+        incident.closed_at = datetime.now()
     incident.status = "CLOSED"
-    db.commit()
+    await db.commit()
     
-    await manager.broadcast({
+    await hub.publish({
         "type": "CASE_CLOSED",
         "incident_id": incident_id,
         "final_report": data.final_report
-    })
+    }, topics=["role:AGENT", "role:DASHBOARD", f"incident:{incident_id}"])
     return {"status": "closed"}
 
+# --- MEDIDAS PROTETIVAS (ver geofence.py) ---
+@app.post("/api/measures", status_code=201)
+async def create_measure(data: ProtectiveMeasureSchema, db: AsyncSession = Depends(get_async_db)):
+    measure = ProtectiveMeasure(victim_id=data.victim_id, aggressor_id=data.aggressor_id,
+                                min_distance_m=data.min_distance_m, active=True,
+                                zones=[ProtectedZone(label=z.label, latitude=z.latitude, longitude=z.longitude,
+                                                     radius_m=z.radius_m) for z in data.zones])
+    db.add(measure)
+    await db.commit()
+    event = measure_event(measure)
+    # Passa pelo hub para todos os workers carregarem a medida
+    await hub.publish(event, topics=["role:DASHBOARD"])
+    return event
+
+@app.get("/api/measures")
+async def list_measures(db: AsyncSession = Depends(get_async_db)):
+    measures = await db.scalars(select(ProtectiveMeasure).where(ProtectiveMeasure.active == True)
+                                .options(selectinload(ProtectiveMeasure.zones)))
+    return [{**measure_event(m), "breaches": sorted(t for i, t in geofence.inside if i == m.id)} for m in measures]
+
+@app.delete("/api/measures/{measure_id}")
+async def revoke_measure(measure_id: int, db: AsyncSession = Depends(get_async_db)):
+    measure = await db.get(ProtectiveMeasure, measure_id, options=[selectinload(ProtectiveMeasure.zones)])
+    if not measure: raise HTTPException(status_code=404)
+    measure.active = False
+    await db.commit()
+    await hub.publish(measure_event(measure), topics=["role:DASHBOARD"])
+    return {"status": "revoked"}
+
+# --- ESTATÍSTICAS (leem só incident_rollups, ver analytics.py) ---
+@app.get("/api/analytics/heatmap")
+async def incidents_heatmap(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                            status_filter: Optional[str] = Query(None, alias="status"),
+                            db: AsyncSession = Depends(get_async_db)):
+    return await analytics.heatmap(db, since, until, status_filter)
+
+@app.get("/api/analytics/trend")
+async def incidents_trend(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                          status_filter: Optional[str] = Query(None, alias="status"),
+                          bucket: str = Query("hour", pattern="^(hour|day)$"),
+                          db: AsyncSession = Depends(get_async_db)):
+    return await analytics.trend(db, since, until, status_filter, bucket)
+
+# Pacote do app ao voltar a conexão (formato em sync.py). Content-Encoding: gzip ou deflate
+@app.post("/api/sync")
+async def sync_bundle(request: Request):
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > sync.SYNC_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Pacote grande demais")
+    compressed = request.headers.get("content-encoding", "").lower() in ("gzip", "deflate")
+    try:
+        bundle = sync.parse(await sync.read_body(request.stream()), compressed)
+    except OverflowError:
+        raise HTTPException(status_code=413, detail="Pacote grande demais")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Pacote inválido: {e}")
+    return await apply_sync(bundle)
+
+# Mesmo formulário de antes (campo "file"), mas lido em streaming e guardado
+# pelo SHA-256: reenviar a mesma foto não ocupa espaço de novo
 @app.post("/api/upload")
-async def upload_evidence(file: UploadFile = File(...)):
-    _, file_extension = os.path.splitext(file.filename)
-    if not file_extension: file_extension = ".png"
-    safe_filename = f"{uuid.uuid4()}{file_extension}"
-    with open(f"uploads/{safe_filename}", "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    return {"url": f"http://127.0.0.1:8000/uploads/{safe_filename}"}
+async def upload_evidence(request: Request):
+    sha, path, duplicate = await evidence.receive(request)
+    evidence.schedule_variants(sha, path)
+    base = str(request.base_url).rstrip("/")
+    return {
+        "url": f"{base}/{path.replace(os.sep, '/')}",
+        "sha256": sha,
+        "size": os.path.getsize(path),
+        "duplicate": duplicate,
+        "thumbnail_url": f"{base}/api/evidence/{sha}/thumb",
+        "preview_url": f"{base}/api/evidence/{sha}/preview",
+    }
+
+# Miniatura/prévia pronta -> redireciona para ela (cacheável para sempre);
+# ainda sendo gerada (ou sem Pillow) -> redireciona para o original
+@app.get("/api/evidence/{sha}/{variant}")
+def evidence_variant(sha: str, variant: str):
+    if not evidence.SHA_RE.match(sha) or variant not in evidence.VARIANTS:
+        raise HTTPException(status_code=404)
+    path = evidence.variant_path(sha, variant)
+    if not os.path.exists(path):
+        path = evidence.find_original(sha)
+        if path is None:
+            raise HTTPException(status_code=404)
+    return RedirectResponse("/" + path.replace(os.sep, "/"), status_code=307, headers={"Cache-Control": "no-cache"})
+
+
 
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
 
+@app.get("/api/ws/stats")
+def websocket_stats():
+    # Fila, descartes e tempo de envio de cada socket conectado
+    return manager.stats()
 
 @app.get("/dashboard", response_class=HTMLResponse)
 async def dashboard():
@@ -229,47 +698,49 @@ async def dashboard():
 
 
 @app.websocket("/ws/monitor")
-async def websocket_endpoint(websocket: WebSocket, db: Session = Depends(get_db)):
+async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     current_user_id = None
     user_role = None # Para saber se removemos de agents ou victims ao sair
     
     try:
         while True:
-            data = await websocket.receive_json()
-            
+            data = await manager.receive(websocket)
+            msg_type = data.get("type")
+            started = time.perf_counter()
+
             # 1. RASTREAMENTO DE AGENTE (JÁ EXISTIA)
             if data.get("type") == "AGENT_LOCATION_UPDATE":
                 current_user_id = data["user_id"]
                 user_role = "AGENT"
-                active_agents[current_user_id] = {
+                manager.subscribe(websocket, ["role:AGENT", f"agent:{current_user_id}"], exclusive=False)
+                trail_store.append("agent", current_user_id, data["lat"], data["lng"])
+                await hub.set_presence("AGENT", current_user_id, {
                     "lat": data["lat"], 
                     "lng": data["lng"], 
                     "name": data["name"]
-                }
-                await manager.broadcast({
-                    "type": "AGENT_MOVED",
-                    "agent_id": current_user_id,
-                    "location": {"lat": data["lat"], "lng": data["lng"]},
-                    "name": data["name"]
                 })
 
             # 2. RASTREAMENTO DE VÍTIMA (NOVO)
             elif data.get("type") == "VICTIM_LOCATION_UPDATE":
                 current_user_id = data["user_id"]
                 user_role = "VICTIM"
-                active_victims[current_user_id] = {
+                manager.subscribe(websocket, ["role:VICTIM", f"victim:{current_user_id}"], exclusive=False)
+                trail_store.append("victim", current_user_id, data["lat"], data["lng"])
+                # Avisa o painel para desenhar a vítima (ícone de pessoa)
+                await hub.set_presence("VICTIM", current_user_id, {
                     "lat": data["lat"], 
                     "lng": data["lng"], 
                     "name": data["name"]
-                }
-                # Avisa o painel para desenhar a vítima (ícone de pessoa)
-                await manager.broadcast({
-                    "type": "VICTIM_MOVED",
-                    "victim_id": current_user_id,
-                    "location": {"lat": data["lat"], "lng": data["lng"]},
-                    "name": data["name"]
                 })
+                await check_geofence("victim", current_user_id)
+
+            # 2b. TORNOZELEIRA DO AGRESSOR (medidas protetivas)
+            # {"type": "AGGRESSOR_LOCATION_UPDATE", "aggressor_id": 9, "lat": .., "lng": ..}
+            elif data.get("type") == "AGGRESSOR_LOCATION_UPDATE":
+                aggressor_id = data["aggressor_id"]
+                await hub.set_presence("AGGRESSOR", aggressor_id, {"lat": data["lat"], "lng": data["lng"]})
+                await check_geofence("aggressor", aggressor_id)
 
             # 3. DESPACHO (MANTENHA IGUAL)
             elif data.get("type") == "DISPATCH_NEAREST":
@@ -277,52 +748,89 @@ async def websocket_endpoint(websocket: WebSocket, db: Session = Depends(get_db)
                 # (Copie a lógica do passo anterior aqui para não perder)
                 victim_lat = data["location"]["lat"]
                 victim_lng = data["location"]["lng"]
-                nearest_agent = None
-                min_dist = float("inf")
-                
-                for agent_id, agent_data in active_agents.items():
-                    dist = calculate_distance(victim_lat, victim_lng, agent_data["lat"], agent_data["lng"])
-                    if dist < min_dist:
-                        min_dist = dist
-                        nearest_agent = agent_data
+                with DISPATCH_LOOKUP_SECONDS.time():
+                    candidates = await rank_agents(victim_lat, victim_lng)
                 
-                if nearest_agent:
-                    await manager.broadcast({
+                if candidates:
+                    nearest_agent = candidates[0]
+                    incident_topic = f"incident:{data['incident_id']}"
+                    await hub.link(f"agent:{nearest_agent['agent_id']}", incident_topic)
+                    await hub.publish({
                         "type": "NEW_PANIC_ALERT",
                         "incident_id": data["incident_id"],
                         "victim_name": data["victim_name"],
                         "location": data["location"],
-                        "target_agent_name": nearest_agent["name"],
+                        "target_agent_name": nearest_agent["agent_name"],
                         "message": "VOCÊ É A VIATURA MAIS PRÓXIMA!"
-                    })
-                    await manager.broadcast({
+                    }, topics=["role:AGENT", "role:DASHBOARD"])
+                    await hub.publish({
                         "type": "DISPATCH_CONFIRMED",
-                        "agent_name": nearest_agent["name"],
-                        "distance": round(min_dist, 2)
-                    })
+                        "agent_name": nearest_agent["agent_name"],
+                        "distance": nearest_agent["distance"],
+                        "candidates": candidates # Reservas em ordem, caso a primeira recuse
+                    }, topics=["role:DASHBOARD", incident_topic])
+                    # Guarda quem foi despachado (o trajeto da ocorrência inclui essa viatura)
+                    async with AsyncSessionLocal() as db:
+                        await db.merge(IncidentResponder(incident_id=data["incident_id"],
+                                                         agent_id=nearest_agent["agent_id"]))
+                        await db.commit()
                 else:
-                    await manager.broadcast({"type": "NO_AGENTS_AVAILABLE"})
+                    await hub.publish({"type": "NO_AGENTS_AVAILABLE"}, topics=["role:DASHBOARD"])
 
             # ... (MANTENHA SEND_CHAT_MESSAGE e STATUS_UPDATE IGUAIS) ...
             elif data.get("type") == "SEND_CHAT_MESSAGE":
                 # ... (Lógica de chat igual) ...
-                session = SessionLocal()
                 msg_time = datetime.now().strftime("%H:%M")
                 new_msg = ChatMessage(incident_id=data["incident_id"], sender_name=data["sender_name"], content=data["content"], timestamp=msg_time)
-                session.add(new_msg)
-                session.commit()
-                session.close()
+                # Entra no próximo commit em lote (ver ChatWriteBehind)
+                await chat_writer.add(new_msg)
+                data["id"] = new_msg.id # O app guarda o último id para pedir só o que falta (?since=)
+                data["sent_at"] = new_msg.sent_at.isoformat()
                 data["timestamp"] = msg_time
                 data["type"] = "NEW_CHAT_MESSAGE"
-                await manager.broadcast(data)
+                # Quem escreve no chat passa a ouvir o chamado
+                manager.subscribe(websocket, [f"incident:{data['incident_id']}"], exclusive=False)
+                await hub.publish(data, topics=["role:DASHBOARD", f"incident:{data['incident_id']}"])
             elif data.get("type") == "STATUS_UPDATE":
-                await manager.broadcast(data)
+                await hub.publish(data, topics=["role:DASHBOARD", f"incident:{data['incident_id']}"])
+
+            # 4. ASSINATURAS (quem manda SUBSCRIBE passa a receber só o que pediu)
+            # Ex.: {"type": "SUBSCRIBE", "topics": ["incident:7", "watch:agent:3"]}
+            elif data.get("type") == "SUBSCRIBE":
+                manager.subscribe(websocket, data.get("topics", []))
+                position_ticker.resync(websocket)
+            elif data.get("type") == "UNSUBSCRIBE":
+                manager.unsubscribe(websocket, data.get("topics", []))
+            elif data.get("type") == "POSITIONS_ACK":
+                # Confirma o último POSITIONS_SNAPSHOT recebido (base dos próximos deltas)
+                position_ticker.ack(websocket, data.get("seq"))
+            elif data.get("type") == "RESUME":
+                # {"type": "RESUME", "topics": [...], "epoch": "...", "event_seq": 123}
+                if resume_stream(websocket, data):
+                    await send_resync(websocket)
+                position_ticker.resync(websocket)
+            elif data.get("type") == "SET_VIEWPORT":
+                # {"type": "SET_VIEWPORT", "bbox": {"south":..,"west":..,"north":..,"east":..}} ou bbox null
+                manager.set_viewport(websocket, data.get("bbox"))
+                position_ticker.resync(websocket)
+            elif data.get("type") == "SYNC_BUNDLE":
+                # {"type": "SYNC_BUNDLE", "bundle": {...}} ou {"type": "SYNC_BUNDLE", "gzip": "<base64>"}
+                try:
+                    reply = await apply_sync(sync.parse_ws(data))
+                except (ValueError, OverflowError) as e:  # Inválido ou grande demais
+                    reply = {"error": str(e)}
+                conn = manager.connections.get(websocket)
+                if conn:
+                    conn.enqueue({"type": "SYNC_RESULT", "request_id": data.get("request_id"), **reply})
+
+            WS_MESSAGE_SECONDS.observe(time.perf_counter() - started,
+                                       msg_type if msg_type in WS_MESSAGE_TYPES else "OTHER")
 
     except WebSocketDisconnect:
         manager.disconnect(websocket)
         # Remove da lista correta ao desconectar
         if current_user_id:
             if user_role == "AGENT" and current_user_id in active_agents:
-                del active_agents[current_user_id]
+                await hub.clear_presence("AGENT", current_user_id)
             elif user_role == "VICTIM" and current_user_id in active_victims:
-                del active_victims[current_user_id]
\ No newline at end of file
+                await hub.clear_presence("VICTIM", current_user_id)
\ No newline at end of file
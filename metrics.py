@@ -0,0 +1,145 @@
+import bisect
+import threading
+import time
+
+# --- MÉTRICAS (formato texto do Prometheus, servido em /metrics) ---
+# Sem dependência externa: cada observação é um bisect e três somas, então
+# dá para deixar ligado com o sistema cheio. Rotas síncronas e os eventos do
+# SQLAlchemy rodam em threads, por isso o lock (barato quando não há disputa).
+# Com vários workers cada processo tem os seus números: o Prometheus deve
+# raspar cada worker (ou somar por instância).
+
+# Segundos: de 0,1 ms (despacho pelo índice) até 5 s (banco travado)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+REGISTRY = []
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # valores dos labels -> [contagem por bucket..., soma, total]
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, seconds: float, *labels):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):  # Acima do último só entra no +Inf (= total)
+                series[i] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def time(self, *labels):
+        # with HISTOGRAMA.time("label"): ...
+        return _Timer(self, labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self.lock:
+            snapshot = {labels: list(series) for labels, series in self.series.items()}
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {series[-1]}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {} if self.labelnames else {(): 0}  # Sem labels já sai zerado
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount: int = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self.lock:
+            snapshot = sorted(self.values.items())
+        for labels, value in snapshot:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge:
+    # O valor é lido só na hora da raspagem (nada custa no caminho quente)
+    def __init__(self, name: str, help: str, read):
+        self.name = name
+        self.help = help
+        self.read = read
+        REGISTRY.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.read()}"
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- MÉTRICAS DO SISTEMA ---
+PANIC_SECONDS = Histogram(
+    "sos_panic_seconds", "POST /api/panic do recebimento até o chamado e suas tarefas estarem gravados")
+DISPATCH_LOOKUP_SECONDS = Histogram(
+    "sos_dispatch_lookup_seconds", "Busca das viaturas mais próximas no índice espacial")
+BROADCAST_SECONDS = Histogram(
+    "sos_broadcast_seconds", "Fan-out de um evento para as filas dos sockets", ["type"])
+WS_MESSAGE_SECONDS = Histogram(
+    "sos_ws_message_seconds", "Tratamento de uma mensagem recebida no /ws/monitor", ["type"])
+SQL_SECONDS = Histogram(
+    "sos_sql_seconds", "Execução de comandos SQL", ["statement"])
+WS_DROPPED = Counter(
+    "sos_ws_dropped_messages_total", "Mensagens descartadas por fila de saída cheia")
+WS_SLOW_DISCONNECTS = Counter(
+    "sos_ws_slow_disconnects_total", "Clientes derrubados por não darem conta das mensagens")
+OUTBOX_JOBS = Counter(
+    "sos_outbox_jobs_total", "Tarefas do outbox executadas (done, retry ou failed)", ["kind", "result"])
+OUTBOX_LAG_SECONDS = Histogram(
+    "sos_outbox_lag_seconds", "Da gravação da tarefa até ela terminar", ["kind"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 15.0, 60.0, 300.0))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Index, Boolean, Text
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime
 
@@ -27,10 +27,17 @@ class Incident(Base):
     latitude = Column(Float)
     longitude = Column(Float)
     created_at = Column(String, default=lambda: datetime.now().strftime("%d/%m/%Y às %H:%M"))
+    opened_at = Column(DateTime, default=datetime.now, index=True) # Mesma data, mas ordenável (filtros)
+    closed_at = Column(DateTime, nullable=True)
 
     victim = relationship("User", back_populates="incidents")
     messages = relationship("ChatMessage", back_populates="incident")
 
+    __table_args__ = (
+        Index("ix_incidents_status_id", "status", "id"),         # Feed filtrado por status
+        Index("ix_incidents_lat_lng", "latitude", "longitude"),  # Filtro por área do mapa
+    )
+
 # 3. Tabela de Chat
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
@@ -39,6 +46,101 @@ class ChatMessage(Base):
     incident_id = Column(Integer, ForeignKey("incidents.id"))
     sender_name = Column(String)
     content = Column(String)
-    timestamp = Column(String)
+    timestamp = Column(String) # "%H:%M", só para exibir
+    sent_at = Column(DateTime, default=datetime.now) # Data completa (ordenação e filtros)
+
+    incident = relationship("Incident", back_populates="messages")
+
+    __table_args__ = (
+        Index("ix_chat_messages_incident_id_id", "incident_id", "id"), # Histórico por chamado, em ordem
+    )
+
+# 4. Contagem de ocorrências por célula do mapa x hora x status
+# Atualizada junto com cada pânico/fechamento (ver analytics.py)
+class IncidentRollup(Base):
+    __tablename__ = "incident_rollups"
+
+    cell_row = Column(Integer, primary_key=True)
+    cell_col = Column(Integer, primary_key=True)
+    hour = Column(DateTime, primary_key=True) # Hora cheia em que o chamado abriu
+    status = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_incident_rollups_hour", "hour"),
+    )
+
+# 5. Viaturas despachadas para cada ocorrência (para montar o trajeto depois)
+class IncidentResponder(Base):
+    __tablename__ = "incident_responders"
+
+    incident_id = Column(Integer, ForeignKey("incidents.id"), primary_key=True)
+    agent_id = Column(Integer, primary_key=True)
+    assigned_at = Column(DateTime, default=datetime.now)
+
+# 6. Medidas protetivas: distância mínima entre agressor e vítima (ver geofence.py)
+class ProtectiveMeasure(Base):
+    __tablename__ = "protective_measures"
+
+    id = Column(Integer, primary_key=True, index=True)
+    victim_id = Column(Integer, ForeignKey("users.id"), index=True)
+    aggressor_id = Column(Integer, index=True) # Id do monitoramento (tornozeleira)
+    min_distance_m = Column(Float, nullable=False)
+    active = Column(Boolean, default=True, index=True)
+    created_at = Column(DateTime, default=datetime.now)
+
+    zones = relationship("ProtectedZone", back_populates="measure", cascade="all, delete-orphan")
+
+# 7. Endereços fixos da medida (casa, trabalho...) que o agressor não pode se aproximar
+class ProtectedZone(Base):
+    __tablename__ = "protected_zones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    measure_id = Column(Integer, ForeignKey("protective_measures.id"), index=True)
+    label = Column(String) # "casa", "trabalho"
+    latitude = Column(Float)
+    longitude = Column(Float)
+    radius_m = Column(Float, nullable=False)
+
+    measure = relationship("ProtectiveMeasure", back_populates="zones")
+
+# 8. Outbox: efeitos colaterais gravados na mesma transação do chamado (ver outbox.py)
+class OutboxJob(Base):
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False) # Qual handler executa
+    idempotency_key = Column(String, unique=True, nullable=False) # Mesma chave = mesma tarefa
+    payload = Column(Text) # JSON
+    status = Column(String, default="PENDING") # PENDING, DONE, FAILED
+    attempts = Column(Integer, default=0)
+    available_at = Column(DateTime, default=datetime.now) # Próxima tentativa
+    locked_by = Column(String, nullable=True)
+    locked_until = Column(DateTime, nullable=True) # Worker que pegou e até quando
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    done_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_outbox_status_available_at", "status", "available_at"), # Fila de pendentes
+    )
+
+# 9. Índice do arquivo morto: onde está cada ocorrência antiga (ver archive.py)
+class ArchivedIncident(Base):
+    __tablename__ = "archived_incidents"
+
+    incident_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, index=True)
+    opened_at = Column(DateTime)
+    closed_at = Column(DateTime, index=True)
+    partition = Column(String, nullable=False) # "2026-01" -> archive/2026-01.jsonl.gz
+    block_offset = Column(Integer, nullable=False) # Byte onde começa o bloco gzip com a ocorrência
+
+# 10. Itens já recebidos pelo sync offline (ver sync.py): reenvio não duplica
+class SyncReceipt(Base):
+    __tablename__ = "sync_receipts"
 
-    incident = relationship("Incident", back_populates="messages")
\ No newline at end of file
+    client_id = Column(String, primary_key=True) # Gerado no aparelho (uuid)
+    device_id = Column(String)
+    kind = Column(String) # location, chat, status
+    received_at = Column(DateTime, default=datetime.now, index=True)
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, or_, select, update
+
+from database import AsyncSessionLocal
+from metrics import OUTBOX_JOBS, OUTBOX_LAG_SECONDS
+from models import OutboxJob
+
+# --- OUTBOX (EFEITOS COLATERAIS FORA DA REQUISIÇÃO) ---
+# Quem cria o chamado grava, na MESMA transação, uma linha em "outbox" para
+# cada coisa que precisa acontecer depois (alerta nos sockets, SMS/push,
+# auditoria...). A rota responde logo após o commit; um pool de tarefas
+# (OUTBOX_WORKERS por processo) executa as linhas:
+#
+#   PENDING --ok--> DONE
+#      |  erro: attempts+1, tenta de novo em 2^attempts s (até OUTBOX_MAX_ATTEMPTS)
+#      +-----------> FAILED
+#
+# Cada linha é "pega" com um UPDATE condicional (locked_by/locked_until), então
+# com vários workers só um executa; se ele morrer, o prazo vence e outro pega.
+# A entrega é "pelo menos uma vez": o handler recebe a idempotency_key para
+# repassar ao provedor (SMS etc.) ou conferir se já fez aquilo.
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+OUTBOX_POLL_S = float(os.getenv("OUTBOX_POLL_S", "1"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_LEASE_S = 60  # Tempo para um handler terminar antes de outro worker assumir
+OUTBOX_KEEP_DONE = timedelta(days=1)
+MAX_BACKOFF_S = 300
+
+
+def add(db, kind: str, payload: dict, key: str):
+    # Só acrescenta na sessão: vai junto com o commit de quem chamou
+    db.add(OutboxJob(kind=kind, idempotency_key=key, payload=json.dumps(payload, default=str)))
+
+
+class OutboxWorker:
+    def __init__(self, session_factory=AsyncSessionLocal, workers: int = OUTBOX_WORKERS):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.worker_id = uuid.uuid4().hex[:12]
+        self.handlers = {}  # kind -> async fn(payload, key)
+        self.queue = asyncio.Queue()
+        self.wakeup = asyncio.Event()
+        self.tasks = []
+        self.last_cleanup = datetime.min
+
+    def handler(self, kind: str):
+        def register(fn):
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    def wake(self):
+        # Chamado depois do commit: não espera o próximo ciclo de OUTBOX_POLL_S
+        self.wakeup.set()
+
+    async def start(self):
+        self.tasks = [asyncio.create_task(self._poll())]
+        self.tasks += [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        # O que ficou pego e não rodou volta para a fila na hora
+        async with self.session_factory() as db:
+            await db.execute(update(OutboxJob)
+                             .where(OutboxJob.locked_by == self.worker_id, OutboxJob.status == "PENDING")
+                             .values(locked_by=None, locked_until=None))
+            await db.commit()
+
+    # --- BUSCA ---
+    async def _poll(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), OUTBOX_POLL_S)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                while self.queue.qsize() < self.workers and await self._claim():
+                    pass
+                await self._cleanup()
+            except Exception as e:
+                print(f"Erro no outbox: {e}")
+
+    async def _claim(self) -> int:
+        now = datetime.now()
+        lease = now + timedelta(seconds=OUTBOX_LEASE_S)
+        free = or_(OutboxJob.locked_until.is_(None), OutboxJob.locked_until < now)
+        async with self.session_factory() as db:
+            ids = (await db.scalars(select(OutboxJob.id)
+                                    .where(OutboxJob.status == "PENDING", OutboxJob.available_at <= now,
+                                           OutboxJob.kind.in_(self.handlers), free)
+                                    .order_by(OutboxJob.available_at)
+                                    .limit(self.workers * 2))).all()  # O resto fica para os outros processos
+            if not ids:
+                return 0
+            # Condicional: o que outro worker pegou entre o SELECT e aqui fica de fora
+            await db.execute(update(OutboxJob)
+                             .where(OutboxJob.id.in_(ids), OutboxJob.status == "PENDING", free)
+                             .values(locked_by=self.worker_id, locked_until=lease))
+            await db.commit()
+            jobs = (await db.scalars(select(OutboxJob)
+                                     .where(OutboxJob.id.in_(ids), OutboxJob.locked_by == self.worker_id,
+                                            OutboxJob.locked_until == lease)
+                                     .order_by(OutboxJob.available_at))).all()
+        for job in jobs:
+            self.queue.put_nowait(job)
+        return len(jobs)
+
+    async def _cleanup(self):
+        now = datetime.now()
+        if now - self.last_cleanup < timedelta(hours=1):
+            return
+        self.last_cleanup = now
+        async with self.session_factory() as db:
+            await db.execute(delete(OutboxJob).where(OutboxJob.status == "DONE",
+                                                     OutboxJob.done_at < now - OUTBOX_KEEP_DONE))
+            await db.commit()
+
+    # --- EXECUÇÃO ---
+    async def _work(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self.handlers[job.kind](json.loads(job.payload), job.idempotency_key)
+            except Exception as e:
+                await self._failed(job, e)
+            else:
+                await self._finish(job, status="DONE", done_at=datetime.now(), locked_by=None, locked_until=None)
+                OUTBOX_JOBS.inc(job.kind, "done")
+                OUTBOX_LAG_SECONDS.observe((datetime.now() - job.created_at).total_seconds(), job.kind)
+            finally:
+                self.queue.task_done()
+                if self.queue.empty():
+                    self.wake()  # Pode ter mais esperando no banco
+
+    async def _failed(self, job, error):
+        attempts = job.attempts + 1
+        values = {"attempts": attempts, "last_error": repr(error)[:500], "locked_by": None, "locked_until": None}
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            print(f"Outbox: tarefa {job.kind} ({job.idempotency_key}) desistiu após {attempts} tentativas: {error}")
+            OUTBOX_JOBS.inc(job.kind, "failed")
+            await self._finish(job, status="FAILED", **values)
+            return
+        OUTBOX_JOBS.inc(job.kind, "retry")
+        delay = min(2 ** attempts, MAX_BACKOFF_S)
+        await self._finish(job, available_at=datetime.now() + timedelta(seconds=delay), **values)
+
+    async def _finish(self, job, **values):
+        try:
+            async with self.session_factory() as db:
+                await db.execute(update(OutboxJob)
+                                 .where(OutboxJob.id == job.id, OutboxJob.locked_by == self.worker_id)
+                                 .values(**values))
+                await db.commit()
+        except Exception as e:
+            # O prazo vence e a tarefa roda de novo (por isso a idempotency_key)
+            print(f"Erro ao gravar o resultado da tarefa {job.id} do outbox: {e}")
@@ -0,0 +1,168 @@
+import asyncio
+import os
+
+from geo_index import calculate_distance
+
+# --- MODO TICK PARA POSIÇÕES ---
+# Em vez de reenviar cada AGENT_LOCATION_UPDATE / VICTIM_LOCATION_UPDATE na
+# hora, juntamos tudo que mudou e mandamos um POSITIONS_SNAPSHOT por intervalo.
+#
+# Protocolo do quadro (um por conexão, "seq" é contínuo por conexão):
+#   {"type": "POSITIONS_SNAPSHOT", "seq": 12, "base": 10,
+#    "agents":  [{"id": 3, "lat": -15.8, "lng": -47.9, "name": "Silva"},   # absoluto
+#                {"id": 4, "dlat": 120, "dlng": -35}],                     # delta
+#    "victims": [...]}
+# O delta é em milionésimos de grau em relação à posição que o cliente tinha
+# no quadro "base" (o último que ele confirmou com POSITIONS_ACK).
+# Quem nunca confirma recebe sempre posições absolutas.
+# Se o cliente perceber um buraco no "seq", manda POSITIONS_ACK com
+# "seq": null e recebe de novo um quadro com todas as posições, absoluto.
+#
+# O primeiro quadro de cada conexão (e depois de RESUME/SUBSCRIBE/
+# SET_VIEWPORT, ver resync) traz tudo que ela enxerga, inclusive quem está
+# parado. Depois disso só vai quem andou MIN_MOVE_METERS desde o último
+# quadro que AQUELA conexão recebeu.
+
+POSITION_TICK_MS = int(os.getenv("POSITION_TICK_MS", "0"))  # 0 = desligado (envio imediato)
+MIN_MOVE_METERS = float(os.getenv("POSITION_MIN_MOVE_METERS", "5"))
+MAX_UNACKED_FRAMES = 64
+E6 = 1_000_000
+
+
+class SubscriberState:
+    def __init__(self):
+        self.seq = 0
+        self.base_seq = None
+        self.base = {}     # chave -> (lat_e6, lng_e6) confirmado pelo cliente
+        self.unacked = {}  # seq -> {chave: (lat_e6, lng_e6)} enviados e ainda sem ACK
+        self.shown = {}    # chave -> (lat, lng, nome) do último quadro enviado
+        self.fresh = True  # Próximo quadro leva todas as posições
+
+    def reset_base(self):
+        self.base_seq = None
+        self.base.clear()
+        self.unacked.clear()
+
+    def reset(self):
+        self.reset_base()
+        self.shown.clear()
+        self.fresh = True
+
+    def moved(self, key, pos, min_move_km):
+        last = self.shown.get(key)
+        if last is None or last[2] != pos["name"]:
+            return True
+        return calculate_distance(last[0], last[1], pos["lat"], pos["lng"]) >= min_move_km
+
+    def ack(self, seq):
+        if seq is None:
+            self.reset()
+            return
+        for sent_seq in sorted(self.unacked):
+            if sent_seq > seq:
+                break
+            self.base.update(self.unacked.pop(sent_seq))
+            self.base_seq = sent_seq
+
+
+class PositionTicker:
+    def __init__(self, manager, interval_ms: int = POSITION_TICK_MS, min_move_m: float = MIN_MOVE_METERS):
+        self.manager = manager
+        self.interval = interval_ms / 1000
+        self.min_move_km = min_move_m / 1000
+        self.latest = {}      # (tipo, id) -> {"lat", "lng", "name", "topics"}
+        self.dirty = set()
+        self.subscribers = {}  # ClientConnection -> SubscriberState
+        self.task = None
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def update(self, kind: str, entity_id, lat: float, lng: float, name: str, topics):
+        key = (kind, entity_id)
+        self.latest[key] = {"lat": lat, "lng": lng, "name": name, "topics": topics}
+        self.dirty.add(key)
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def remove(self, kind: str, entity_id):
+        key = (kind, entity_id)
+        self.latest.pop(key, None)
+        self.dirty.discard(key)
+        for state in self.subscribers.values():
+            state.base.pop(key, None)
+            state.shown.pop(key, None)
+
+    def ack(self, websocket, seq):
+        conn = self.manager.connections.get(websocket)
+        state = self.subscribers.get(conn)
+        if state:
+            state.ack(seq)
+
+    def resync(self, websocket):
+        # O que a conexão enxerga mudou (assinatura, recorte, RESUME): o
+        # próximo quadro manda tudo de novo
+        conn = self.manager.connections.get(websocket)
+        state = self.subscribers.get(conn)
+        if state:
+            state.reset()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        # Esquece conexões que já caíram; as novas ganham estado (e o quadro completo)
+        for conn in [c for c in self.subscribers if c.websocket not in self.manager.connections]:
+            del self.subscribers[conn]
+        for conn in self.manager.connections.values():
+            if conn not in self.subscribers:
+                self.subscribers[conn] = SubscriberState()
+        fresh = {conn for conn, state in self.subscribers.items() if state.fresh}
+        if not self.dirty and not fresh:
+            return
+        changed, self.dirty = self.dirty, set()
+
+        per_conn = {}
+        for key in (self.latest if fresh else changed):
+            pos = self.latest.get(key)
+            if pos is None:
+                continue
+            location = {"lat": pos["lat"], "lng": pos["lng"]}
+            for conn in self.manager.recipients(pos["topics"], location):
+                state = self.subscribers.get(conn)
+                if state is None:
+                    continue
+                if conn in fresh or (key in changed and state.moved(key, pos, self.min_move_km)):
+                    per_conn.setdefault(conn, []).append(key)
+
+        for conn in fresh:
+            self.subscribers[conn].fresh = False
+        for conn, keys in per_conn.items():
+            state = self.subscribers[conn]
+            state.seq += 1
+            frame = {"type": "POSITIONS_SNAPSHOT", "seq": state.seq, "base": state.base_seq,
+                     "agents": [], "victims": []}
+            sent = {}
+            for key in keys:
+                kind, entity_id = key
+                pos = self.latest[key]
+                lat, lng, name = pos["lat"], pos["lng"], pos["name"]
+                lat_e6, lng_e6 = round(lat * E6), round(lng * E6)
+                base = state.base.get(key)
+                renamed = key in state.shown and state.shown[key][2] != name
+                if base is not None and not renamed:
+                    entry = {"id": entity_id, "dlat": lat_e6 - base[0], "dlng": lng_e6 - base[1]}
+                else:
+                    entry = {"id": entity_id, "lat": lat, "lng": lng, "name": name}
+                frame["agents" if kind == "agent" else "victims"].append(entry)
+                sent[key] = (lat_e6, lng_e6)
+                state.shown[key] = (lat, lng, name)
+            state.unacked[state.seq] = sent
+            if len(state.unacked) > MAX_UNACKED_FRAMES:
+                # Descartar só o quadro mais velho deixaria a base daqui diferente
+                # da do cliente: sem base, o próximo quadro vai absoluto
+                state.reset_base()
+            conn.enqueue(frame)
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# --- PRESENÇA E PUB/SUB ENTRE PROCESSOS ---
+# O main.py não fala direto com o ConnectionManager para mandar eventos:
+# ele publica no "hub". O hub decide como o evento chega em cada processo.
+#
+#   InMemoryHub  -> um processo só (padrão, igual a antes)
+#   SqliteHub    -> vários workers do uvicorn (ou máquinas com o mesmo disco)
+#                   compartilhando um arquivo SQLite em modo WAL
+#
+# Cada processo registra três callbacks:
+#   on_message(message, topics, location, seq) -> entregar nos sockets locais
+#   on_presence(role, user_id, info|None)   -> atualizar active_agents/índice
+#   on_link(source_topic, topic)            -> ligar canais nos sockets locais
+#
+# "seq" numera os eventos na ordem em que o hub os aceitou e é o mesmo em
+# todos os processos. Junto com "epoch" (muda quando a numeração recomeça)
+# é o que permite ao app retomar o fluxo depois de cair (ver replay.py).
+
+PRESENCE_BACKEND = os.getenv("PRESENCE_BACKEND", "memory")  # "memory" | "sqlite"
+PRESENCE_DB_PATH = os.getenv("PRESENCE_DB_PATH", "./presence.db")
+PRESENCE_TTL_S = int(os.getenv("PRESENCE_TTL_S", "60"))  # GPS chega a cada 10 s
+PRESENCE_POLL_MS = int(os.getenv("PRESENCE_POLL_MS", "50"))
+EVENT_RETENTION_S = 300
+CLEANUP_EVERY_S = 10
+
+
+class InMemoryHub:
+    def __init__(self):
+        self.on_message = None
+        self.on_presence = None
+        self.on_link = None
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+
+    def bind(self, on_message, on_presence, on_link):
+        self.on_message = on_message
+        self.on_presence = on_presence
+        self.on_link = on_link
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, message: dict, topics=None, location=None):
+        self.seq += 1
+        await self.on_message(message, topics, location, self.seq)
+
+    async def set_presence(self, role: str, user_id, info: dict):
+        await self.on_presence(role, user_id, info)
+
+    async def clear_presence(self, role: str, user_id):
+        await self.on_presence(role, user_id, None)
+
+    async def link(self, source_topic: str, topic: str):
+        self.on_link(source_topic, topic)
+
+
+class SqliteHub(InMemoryHub):
+    # Tabela "presence" guarda a última posição de cada um (sobrevive à queda
+    # de um worker); tabela "events" é um log curto que todos os processos leem.
+    def __init__(self, path: str = PRESENCE_DB_PATH):
+        super().__init__()
+        self.path = path
+        self.worker_id = uuid.uuid4().hex
+        self.last_event_id = 0
+        self.task = None
+        self.db = None
+        self.lock = threading.Lock()  # Uma conexão, várias threads do to_thread
+        self.drain_lock = asyncio.Lock()  # Um _drain por vez: entrega em ordem de seq
+        self.last_cleanup = 0.0
+
+    def _open(self):
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("""CREATE TABLE IF NOT EXISTS presence (
+            role TEXT NOT NULL, user_id TEXT NOT NULL, info TEXT NOT NULL,
+            updated_at REAL NOT NULL, PRIMARY KEY (role, user_id))""")
+        db.execute("""CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT NOT NULL,
+            kind TEXT NOT NULL, payload TEXT NOT NULL, created_at REAL NOT NULL)""")
+        # O id de events é o seq (AUTOINCREMENT nunca reaproveita); o epoch
+        # só muda se o arquivo for apagado
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        db.execute("INSERT OR IGNORE INTO meta VALUES ('epoch', ?)", (uuid.uuid4().hex[:8],))
+        self.epoch = db.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+        return db
+
+    async def start(self):
+        self.db = await asyncio.to_thread(self._open)
+        # Começa do fim do log e recarrega a presença ainda válida
+        # (é assim que um worker novo "herda" quem estava no que caiu)
+        row, rows = await asyncio.to_thread(self._load_state)
+        self.last_event_id = self.seq = row or 0
+        for role, user_id, info in rows:
+            await self.on_presence(role, json.loads(user_id), json.loads(info))
+        self.task = asyncio.create_task(self._poll())
+
+    def _load_state(self):
+        self._expire()
+        with self.lock:
+            last = self.db.execute("SELECT MAX(id) FROM events").fetchone()[0]
+            rows = self.db.execute("SELECT role, user_id, info FROM presence").fetchall()
+        return last, rows
+
+    def _expire(self):
+        # Quem não manda posição há PRESENCE_TTL_S some da presença (ex.: o
+        # worker dele caiu sem avisar). Quem apaga publica a saída para os outros.
+        now = time.time()
+        cutoff = now - PRESENCE_TTL_S
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            expired = self.db.execute("SELECT role, user_id FROM presence WHERE updated_at < ?",
+                                      (cutoff,)).fetchall()
+            self.db.execute("DELETE FROM presence WHERE updated_at < ?", (cutoff,))
+            for role, user_id in expired:
+                payload = {"role": role, "user_id": json.loads(user_id), "info": None}
+                self.db.execute("INSERT INTO events (origin, kind, payload, created_at) VALUES (?, ?, ?, ?)",
+                                (self.worker_id, "presence", json.dumps(payload), now))
+            self.db.execute("DELETE FROM events WHERE created_at < ?", (now - EVENT_RETENTION_S,))
+        self.last_cleanup = now
+        return [(role, json.loads(user_id)) for role, user_id in expired]
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        if self.db:
+            self.db.close()
+
+    def _append(self, kind, payload, presence=None):
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            if presence is not None:
+                role, user_id, info = presence
+                if info is None:
+                    self.db.execute("DELETE FROM presence WHERE role = ? AND user_id = ?", (role, user_id))
+                else:
+                    self.db.execute("INSERT OR REPLACE INTO presence VALUES (?, ?, ?, ?)",
+                                    (role, user_id, json.dumps(info), now))
+            cursor = self.db.execute("INSERT INTO events (origin, kind, payload, created_at) VALUES (?, ?, ?, ?)",
+                                     (self.worker_id, kind, json.dumps(payload), now))
+        return cursor.lastrowid
+
+    async def publish(self, message: dict, topics=None, location=None):
+        # Grava e entrega pelo log, como os eventos dos outros workers: assim os
+        # sockets daqui recebem os seq sempre em ordem (o app guarda o maior
+        # seq visto e, ao retomar, não pediria de novo um menor que chegou depois)
+        await asyncio.to_thread(self._append, "message",
+                                {"message": message, "topics": topics, "location": location})
+        try:
+            await self._drain()
+        except sqlite3.OperationalError:
+            pass  # Já está no log: o próximo ciclo do _poll entrega
+
+    async def set_presence(self, role: str, user_id, info: dict):
+        await self.on_presence(role, user_id, info)
+        await asyncio.to_thread(self._append, "presence", {"role": role, "user_id": user_id, "info": info},
+                                (role, json.dumps(user_id), info))
+
+    async def clear_presence(self, role: str, user_id):
+        await self.on_presence(role, user_id, None)
+        await asyncio.to_thread(self._append, "presence", {"role": role, "user_id": user_id, "info": None},
+                                (role, json.dumps(user_id), None))
+
+    async def link(self, source_topic: str, topic: str):
+        self.on_link(source_topic, topic)
+        await asyncio.to_thread(self._append, "link", {"source": source_topic, "topic": topic})
+
+    def _fetch(self):
+        with self.lock:
+            return self.db.execute(
+                "SELECT id, origin, kind, payload FROM events WHERE id > ? ORDER BY id",
+                (self.last_event_id,)).fetchall()
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(PRESENCE_POLL_MS / 1000)
+            try:
+                await self._drain()
+                if time.time() - self.last_cleanup > CLEANUP_EVERY_S:
+                    for role, user_id in await asyncio.to_thread(self._expire):
+                        await self.on_presence(role, user_id, None)
+            except sqlite3.OperationalError:
+                continue  # Banco ocupado por outro worker: tenta no próximo ciclo
+            except Exception as e:
+                # Sem isso a tarefa morre calada e este worker para de ouvir os outros
+                print(f"Erro ao ler eventos do hub: {e}")
+
+    async def _drain(self):
+        # Entrega, em ordem, tudo que entrou no log depois do último visto
+        async with self.drain_lock:
+            rows = await asyncio.to_thread(self._fetch)
+            for event_id, origin, kind, payload in rows:
+                self.last_event_id = event_id
+                self.seq = max(self.seq, event_id)
+                data = json.loads(payload)
+                try:
+                    if kind == "message":
+                        await self.on_message(data["message"], data["topics"], data["location"], event_id)
+                    elif origin == self.worker_id:
+                        continue  # Presença e canais daqui já foram aplicados na hora
+                    elif kind == "presence":
+                        await self.on_presence(data["role"], data["user_id"], data["info"])
+                    elif kind == "link":
+                        self.on_link(data["source"], data["topic"])
+                except Exception as e:
+                    print(f"Erro ao entregar o evento {event_id} do hub: {e}")
+
+
+def create_hub():
+    if PRESENCE_BACKEND == "sqlite":
+        return SqliteHub()
+    return InMemoryHub()
@@ -0,0 +1,259 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Dict, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+import wire
+from wire import Frame
+from metrics import BROADCAST_SECONDS, WS_DROPPED, WS_SLOW_DISCONNECTS
+
+# --- FILA DE SAÍDA POR CONEXÃO ---
+# Cada socket tem sua própria fila e sua própria tarefa de envio.
+# O broadcast só enfileira, então um celular lento no 3G não segura
+# o alerta de pânico de todo mundo.
+# A fila guarda Frames (wire.py): o evento é codificado uma vez no
+# broadcast e o mesmo texto/bytes serve para todos os destinatários.
+
+OUTBOX_SIZE = int(os.getenv("WS_OUTBOX_SIZE", "256"))
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+# "drop_oldest": descarta primeiro posições velhas, depois a mensagem mais antiga
+# "disconnect": derruba o cliente lento (ele reconecta sozinho)
+SLOW_CLIENT_POLICY = os.getenv("WS_SLOW_CLIENT_POLICY", "drop_oldest")
+# Depois de tantos descartes seguidos o cliente é considerado morto
+MAX_CONSECUTIVE_DROPS = int(os.getenv("WS_MAX_CONSECUTIVE_DROPS", "1000"))
+
+# Mensagens que podem ser descartadas sem perder informação (a próxima substitui)
+DROPPABLE_TYPES = {"AGENT_MOVED", "VICTIM_MOVED"}
+
+
+class ClientConnection:
+    def __init__(self, websocket: WebSocket, manager: "ConnectionManager", binary: bool = False):
+        self.websocket = websocket
+        self.manager = manager
+        self.binary = binary  # True = MessagePack (subprotocolo sos.msgpack)
+        self.outbox = deque()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.closing = False
+        # Assinaturas: enquanto o cliente não mandar SUBSCRIBE/SET_VIEWPORT
+        # ele continua recebendo tudo (compatível com apps antigos)
+        self.filtered = False
+        self.topics = set()
+        self.viewport = None  # (sul, oeste, norte, leste)
+        # Estatísticas
+        self.connected_at = time.time()
+        self.sent = 0
+        self.dropped = 0
+        self.consecutive_drops = 0
+        self.max_queued = 0
+        self.last_send_ms = 0.0
+
+    def sees(self, location):
+        if self.viewport is None or location is None:
+            return True
+        south, west, north, east = self.viewport
+        return south <= location["lat"] <= north and west <= location["lng"] <= east
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        self.closing = True
+        if self.task and self.task is not asyncio.current_task():
+            self.task.cancel()
+
+    def _drop_one(self):
+        # Degrada antes de perder alerta: procura uma posição antiga para jogar fora
+        for i, queued in enumerate(self.outbox):
+            if queued.type in DROPPABLE_TYPES:
+                del self.outbox[i]
+                return
+        self.outbox.popleft()
+
+    def enqueue(self, message) -> bool:
+        if self.closing:
+            return False
+        if not isinstance(message, Frame):
+            message = Frame(message)
+        if len(self.outbox) >= OUTBOX_SIZE:
+            self.dropped += 1
+            self.consecutive_drops += 1
+            WS_DROPPED.inc()
+            if SLOW_CLIENT_POLICY == "disconnect" or self.consecutive_drops > MAX_CONSECUTIVE_DROPS:
+                WS_SLOW_DISCONNECTS.inc()
+                self.manager.disconnect(self.websocket)
+                asyncio.create_task(self._close(1013))  # 1013 = tente mais tarde
+                return False
+            self._drop_one()
+        self.outbox.append(message)
+        self.max_queued = max(self.max_queued, len(self.outbox))
+        self.wakeup.set()
+        return True
+
+    async def _close(self, code):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def run(self):
+        try:
+            while not self.closing:
+                if not self.outbox:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                    continue
+                frame = self.outbox.popleft()
+                start = time.perf_counter()
+                if self.binary:
+                    send = self.websocket.send_bytes(frame.binary())
+                else:
+                    send = self.websocket.send_text(frame.text())
+                await asyncio.wait_for(send, SEND_TIMEOUT)
+                self.last_send_ms = (time.perf_counter() - start) * 1000
+                self.sent += 1
+                self.consecutive_drops = 0
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Envio falhou ou estourou o tempo: o socket não serve mais
+            self.manager.disconnect(self.websocket)
+            await self._close(1011)
+
+    def stats(self):
+        return {
+            "client": f"{self.websocket.client.host}:{self.websocket.client.port}" if self.websocket.client else None,
+            "connected_for_s": round(time.time() - self.connected_at, 1),
+            "topics": sorted(self.topics),
+            "format": "msgpack" if self.binary else "json",
+            "queued": len(self.outbox),
+            "max_queued": self.max_queued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "last_send_ms": round(self.last_send_ms, 2),
+        }
+
+
+class ConnectionManager:
+    def __init__(self):
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+        # Canais: "incident:7", "role:AGENT", "agent:3", "victim:5"...
+        self.topics: Dict[str, Set[ClientConnection]] = {}
+        self.viewers: Set[ClientConnection] = set()  # Quem tem recorte de mapa
+        self.unfiltered: Set[ClientConnection] = set()  # Quem ainda recebe tudo
+
+    @property
+    def active_connections(self):
+        return list(self.connections)
+
+    async def connect(self, websocket: WebSocket):
+        subprotocol = wire.negotiate(websocket)
+        await websocket.accept(subprotocol=subprotocol)
+        conn = ClientConnection(websocket, self, binary=subprotocol == wire.SUBPROTOCOL_MSGPACK)
+        self.connections[websocket] = conn
+        self.unfiltered.add(conn)
+        conn.start()
+
+    async def receive(self, websocket: WebSocket) -> dict:
+        # Aceita JSON (texto) ou MessagePack (binário) de qualquer cliente
+        raw = await websocket.receive()
+        if raw["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(raw.get("code", 1000))
+        return wire.decode(raw)
+
+    def disconnect(self, websocket: WebSocket):
+        conn = self.connections.pop(websocket, None)
+        if conn:
+            conn.stop()
+            self._leave(conn, list(conn.topics))
+            self.viewers.discard(conn)
+            self.unfiltered.discard(conn)
+
+    # --- ASSINATURAS ---
+    def subscribe(self, websocket: WebSocket, topics, exclusive: bool = True):
+        # exclusive=False: entra no canal sem deixar de receber tudo
+        # (usado nas inscrições automáticas, para não quebrar apps antigos)
+        conn = self.connections.get(websocket)
+        if not conn:
+            return
+        if exclusive:
+            conn.filtered = True
+            self.unfiltered.discard(conn)
+        for topic in topics:
+            conn.topics.add(topic)
+            self.topics.setdefault(topic, set()).add(conn)
+
+    def unsubscribe(self, websocket: WebSocket, topics):
+        conn = self.connections.get(websocket)
+        if conn:
+            self._leave(conn, topics)
+
+    def _leave(self, conn, topics):
+        for topic in topics:
+            conn.topics.discard(topic)
+            members = self.topics.get(topic)
+            if members is not None:
+                members.discard(conn)
+                if not members:
+                    del self.topics[topic]
+
+    def set_viewport(self, websocket: WebSocket, bbox):
+        conn = self.connections.get(websocket)
+        if not conn:
+            return
+        conn.filtered = True
+        self.unfiltered.discard(conn)
+        if bbox:
+            conn.viewport = (bbox["south"], bbox["west"], bbox["north"], bbox["east"])
+            self.viewers.add(conn)
+        else:
+            conn.viewport = None
+            self.viewers.discard(conn)
+
+    def link(self, source_topic: str, topic: str):
+        # Todo mundo que está em source_topic passa a ouvir topic também
+        # Ex.: a vítima (victim:5) entra no canal do chamado que abriu (incident:9)
+        for conn in list(self.topics.get(source_topic, ())):
+            self.subscribe(conn.websocket, [topic], exclusive=False)
+
+    def recipients(self, topics, location):
+        if topics is None:
+            return list(self.connections.values())
+        # O recorte de mapa só filtra os canais gerais (role:*); quem assinou um
+        # canal específico (incident:7, watch:agent:3...) recebe de qualquer lugar
+        targets = set()
+        for topic in topics:
+            members = self.topics.get(topic, ())
+            if topic.startswith("role:"):
+                targets.update(conn for conn in members if conn.sees(location))
+            else:
+                targets.update(members)
+        if location is not None:
+            targets.update(conn for conn in self.viewers if conn.sees(location))
+        recipients = [conn for conn in targets if conn.filtered]
+        recipients.extend(self.unfiltered)
+        return recipients
+
+    async def broadcast(self, message: dict, topics=None, location=None):
+        # Não espera nenhum envio: só coloca na fila de cada conexão.
+        # topics=None manda para todos; location filtra pelo recorte de mapa.
+        start = time.perf_counter()
+        frame = message if isinstance(message, Frame) else Frame(message)
+        for conn in self.recipients(topics, location):
+            conn.enqueue(frame)
+        BROADCAST_SECONDS.observe(time.perf_counter() - start, frame.type or "")
+
+    def stats(self):
+        clients = [conn.stats() for conn in self.connections.values()]
+        return {
+            "connections": len(clients),
+            "topics": {topic: len(members) for topic, members in self.topics.items()},
+            "policy": SLOW_CLIENT_POLICY,
+            "outbox_size": OUTBOX_SIZE,
+            "queued_total": sum(c["queued"] for c in clients),
+            "dropped_total": sum(c["dropped"] for c in clients),
+            "clients": clients,
+        }
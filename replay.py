@@ -0,0 +1,77 @@
+import os
+from collections import OrderedDict, deque
+
+from wire import Frame
+
+# --- RETOMADA DO FLUXO DE EVENTOS ---
+# Todo evento publicado pelo hub (alerta, despacho, chat, status, fechamento)
+# sai com "event_seq", um número que só cresce. Cada canal guarda os últimos
+# REPLAY_PER_TOPIC eventos. Ao reconectar o app manda
+#     {"type": "RESUME", "epoch": "...", "event_seq": 123}
+# (depois do SUBSCRIBE) e recebe só o que perdeu, seguido de
+#     {"type": "RESUMED", "epoch": "...", "event_seq": <atual>, "replayed": n}
+# Se o buraco for maior que o buffer (ou o servidor reiniciou) vem o estado
+# atual no lugar dos eventos (ver send_resync em main.py):
+#     {"type": "RESYNC", "epoch": "...", "event_seq": <atual>,
+#      "incidents": [9, 7],          # chamados abertos que a conexão acompanha
+#      "chat": {"9": 120}}           # última mensagem de cada incident:N assinado
+# e o app fecha o que não está mais aberto e busca o chat com ?since=.
+# Posições (AGENT_MOVED, POSITIONS_SNAPSHOT) não entram: a próxima substitui.
+
+REPLAY_PER_TOPIC = int(os.getenv("WS_REPLAY_PER_TOPIC", "256"))
+REPLAY_MAX_TOPICS = int(os.getenv("WS_REPLAY_MAX_TOPICS", "10000"))
+ALL_TOPICS = "*"  # Eventos publicados com topics=None
+
+
+class ReplayBuffer:
+    def __init__(self, per_topic: int = REPLAY_PER_TOPIC, max_topics: int = REPLAY_MAX_TOPICS):
+        self.per_topic = per_topic
+        self.max_topics = max_topics
+        self.rings = OrderedDict()  # canal -> deque[(seq, Frame, location)], mais usado no fim
+        self.evicted = {}   # canal -> maior seq que já saiu do buffer
+        self.forgotten = 0  # maior seq de um canal inteiro que foi descartado
+        self.start_seq = 0  # seq do hub quando o processo subiu (antes disso não há nada)
+        self.last_seq = 0
+
+    def record(self, message: dict, topics, location, seq: int) -> Frame:
+        frame = Frame({**message, "event_seq": seq})
+        self.last_seq = max(self.last_seq, seq)
+        for topic in topics or (ALL_TOPICS,):
+            ring = self.rings.get(topic)
+            if ring is None:
+                ring = self.rings[topic] = deque()
+            else:
+                self.rings.move_to_end(topic)
+            ring.append((seq, frame, location))
+            if len(ring) > self.per_topic:
+                self.evicted[topic] = ring.popleft()[0]
+        while len(self.rings) > self.max_topics:
+            # Canal parado há mais tempo (ex.: chamado antigo) sai inteiro
+            topic, ring = self.rings.popitem(last=False)
+            self.forgotten = max(self.forgotten, ring[-1][0], self.evicted.pop(topic, 0))
+        return frame
+
+    def missed(self, topics, since: int):
+        # Eventos com seq > since nos canais pedidos (None = todos), em ordem.
+        # Devolve None se algum deles pode ter se perdido.
+        if since < self.start_seq:
+            return None
+        if topics is None:
+            topics = list(self.rings)
+        else:
+            topics = [*topics, ALL_TOPICS]
+        found = {}
+        for topic in topics:
+            if since < self.evicted.get(topic, 0):
+                return None
+            ring = self.rings.get(topic)
+            if ring is None:
+                if since < self.forgotten:
+                    return None
+                continue
+            for seq, frame, location in ring:
+                # Sem parar no primeiro antigo: com SqliteHub eventos de outro
+                # worker podem entrar aqui depois de um local mais novo
+                if seq > since:
+                    found[seq] = (frame, location)
+        return [found[seq] for seq in sorted(found)]
@@ -0,0 +1,316 @@
+import bz2
+import gzip
+import heapq
+import os
+import pickle
+import xml.etree.ElementTree as ET
+from array import array
+
+from geo_index import GridIndex, calculate_distance
+
+# --- ROTAS PELA MALHA VIÁRIA (ETA OFFLINE) ---
+# Carrega um recorte do OpenStreetMap (.osm, .osm.gz ou .osm.bz2) uma vez e
+# guarda a malha em arrays (formato CSR: para cada nó, o trecho de
+# "first_out" aponta para as ruas que saem dele). Mão única e rotatórias
+# são respeitadas; o peso de cada rua é o tempo em segundos pela velocidade
+# da via (maxspeed ou o padrão do tipo em SPEED_KMH).
+#
+# Para responder rápido usamos ALT (A* + landmarks + desigualdade
+# triangular): ROUTING_LANDMARKS nós espalhados têm a distância de/para
+# todos os outros pré-calculada, o que dá um limite inferior bom do tempo
+# restante e faz o A* abrir poucos nós.
+#
+# A malha e os landmarks são salvos em "<arquivo>.graph" ao lado do OSM;
+# os outros workers (e o próximo restart) só leem esse arquivo.
+#
+# Sem ROUTING_OSM_PATH o despacho continua pela distância em linha reta.
+
+ROUTING_OSM_PATH = os.getenv("ROUTING_OSM_PATH", "")
+ROUTING_LANDMARKS = int(os.getenv("ROUTING_LANDMARKS", "8"))
+ROUTING_MAX_SNAP_KM = float(os.getenv("ROUTING_MAX_SNAP_KM", "0.5"))  # Longe assim da rua, não dá para rotear
+OFFROAD_KMH = 15  # Do ponto até a rua mais próxima (saída do pátio, estacionamento)
+CACHE_VERSION = 1
+INF = float("inf")
+
+SPEED_KMH = {
+    "motorway": 90, "motorway_link": 50, "trunk": 70, "trunk_link": 40,
+    "primary": 50, "primary_link": 35, "secondary": 45, "secondary_link": 30,
+    "tertiary": 40, "tertiary_link": 25, "unclassified": 30, "residential": 25,
+    "living_street": 10, "service": 15, "road": 25,
+}
+ONEWAY_YES = {"yes", "true", "1"}
+
+
+# --- LEITURA DO OSM ---
+def _open(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+
+def _speed(tags: dict) -> float:
+    raw = tags.get("maxspeed", "").split(" ")[0]
+    if raw.isdigit() and int(raw) > 0:  # maxspeed=0 aparece em dados ruins: vale o padrão do tipo
+        return float(raw) * (1.609 if "mph" in tags["maxspeed"] else 1)
+    return SPEED_KMH[tags["highway"]]
+
+
+def parse_osm(path: str):
+    # Devolve (coordenadas por id OSM, lista de (ids dos nós, km/h, sentido))
+    # sentido: 1 = só ida, -1 = só volta, 0 = mão dupla
+    coords = {}
+    ways = []
+    nodes, tags = [], {}
+    with _open(path) as f:
+        for _, elem in ET.iterparse(f, events=("end",)):
+            if elem.tag == "node":
+                coords[int(elem.get("id"))] = (float(elem.get("lat")), float(elem.get("lon")))
+                tags = {}  # Tags do próprio nó (semáforo etc.) não são da rua
+                elem.clear()
+            elif elem.tag == "nd":
+                nodes.append(int(elem.get("ref")))
+            elif elem.tag == "tag":
+                tags[elem.get("k")] = elem.get("v")
+            elif elem.tag == "way":
+                if tags.get("highway") in SPEED_KMH and tags.get("access") not in ("no", "private"):
+                    oneway = tags.get("oneway", "")
+                    if oneway == "-1":
+                        direction = -1
+                    elif oneway in ONEWAY_YES or tags.get("junction") == "roundabout" \
+                            or tags["highway"] in ("motorway", "motorway_link"):
+                        direction = 1
+                    else:
+                        direction = 0
+                    ways.append((nodes, _speed(tags), direction))
+                nodes, tags = [], {}
+                elem.clear()
+            elif elem.tag == "relation":
+                nodes, tags = [], {}
+                elem.clear()
+    return coords, ways
+
+
+# --- MALHA EM ARRAYS ---
+class RoadGraph:
+    def __init__(self, lat, lng, first_out, head, weight):
+        self.lat = lat              # array("d") por nó
+        self.lng = lng
+        self.first_out = first_out  # array("l"): ruas do nó v em [first_out[v], first_out[v+1])
+        self.head = head            # array("l"): nó de chegada de cada rua
+        self.weight = weight        # array("f"): segundos
+        self.landmarks = []         # [(de_L, para_L)] com array("f") por nó
+        self.snap_index = None
+
+    def __len__(self):
+        return len(self.lat)
+
+    @classmethod
+    def from_osm(cls, path: str):
+        coords, ways = parse_osm(path)
+        index = {}  # id OSM -> índice compacto, só dos nós que estão em alguma rua
+        lat, lng = array("d"), array("d")
+        edges = []  # (origem, destino, segundos)
+        for nodes, kmh, direction in ways:
+            nodes = [n for n in nodes if n in coords]
+            for a, b in zip(nodes, nodes[1:]):
+                for n in (a, b):
+                    if n not in index:
+                        index[n] = len(lat)
+                        lat.append(coords[n][0])
+                        lng.append(coords[n][1])
+                seconds = calculate_distance(*coords[a], *coords[b]) / kmh * 3600
+                if direction >= 0:
+                    edges.append((index[a], index[b], seconds))
+                if direction <= 0:
+                    edges.append((index[b], index[a], seconds))
+        return cls(lat, lng, *_csr(len(lat), edges))
+
+    def reverse(self):
+        edges = [(self.head[e], v, self.weight[e])
+                 for v in range(len(self)) for e in range(self.first_out[v], self.first_out[v + 1])]
+        return _csr(len(self), edges)
+
+    # --- PRÉ-PROCESSAMENTO (LANDMARKS) ---
+    def build_landmarks(self, count: int = ROUTING_LANDMARKS):
+        # Escolha "mais longe primeiro": o próximo landmark é o nó mais
+        # distante (em tempo) dos que já foram escolhidos. O primeiro sai do
+        # centro da malha, que quase sempre cai no maior componente.
+        if not len(self):
+            return
+        rev = self.reverse()
+        center_lat = (min(self.lat) + max(self.lat)) / 2
+        center_lng = (min(self.lng) + max(self.lng)) / 2
+        node = min(range(len(self)), key=lambda v: abs(self.lat[v] - center_lat) + abs(self.lng[v] - center_lng))
+        closest = [INF] * len(self)
+        self.landmarks = []
+        for _ in range(min(count, len(self))):
+            from_l = dijkstra(self.first_out, self.head, self.weight, node)
+            to_l = dijkstra(*rev, node)
+            self.landmarks.append((array("f", from_l), array("f", to_l)))
+            for v in range(len(self)):
+                if from_l[v] < closest[v]:
+                    closest[v] = from_l[v]
+            node = max(range(len(self)), key=lambda v: closest[v] if closest[v] < INF else -1)
+
+    def build_snap_index(self):
+        # Só entram nós que vão e voltam do primeiro landmark: ruas soltas
+        # do recorte (pedaços sem saída) não servem de ponto de partida
+        self.snap_index = GridIndex(0.005)
+        if not self.landmarks:
+            return
+        from_l, to_l = self.landmarks[0]
+        for v in range(len(self)):
+            if from_l[v] < INF and to_l[v] < INF:
+                self.snap_index.upsert(v, self.lat[v], self.lng[v])
+
+    def snap(self, lat: float, lng: float):
+        found = self.snap_index.nearest(lat, lng, k=1, max_km=ROUTING_MAX_SNAP_KM)
+        return (found[0][1], found[0][0]) if found else (None, None)
+
+    # --- CONSULTA ---
+    def eta(self, source: int, target: int, bound: float = INF):
+        # A* com o limite dos landmarks; desiste quando passa de "bound"
+        if source == target:
+            return 0.0
+        h = self._heuristic(target)
+        first_out, head, weight = self.first_out, self.head, self.weight
+        dist = {source: 0.0}
+        heap = [(h(source), 0.0, source)]
+        while heap:
+            f, d, v = heapq.heappop(heap)
+            if f > bound:
+                return None
+            if v == target:
+                return d
+            if d > dist[v]:  # Entrada velha na fila
+                continue
+            for e in range(first_out[v], first_out[v + 1]):
+                w = head[e]
+                nd = d + weight[e]
+                if nd < dist.get(w, INF):
+                    dist[w] = nd
+                    heapq.heappush(heap, (nd + h(w), nd, w))
+        return None
+
+    def _heuristic(self, target: int):
+        # Desigualdade triangular, para cada landmark L:
+        #   t(v, alvo) >= t(L, alvo) - t(L, v)  e  t(v, L) - t(alvo, L)
+        terms = [(from_l, from_l[target], to_l, to_l[target]) for from_l, to_l in self.landmarks
+                 if from_l[target] < INF and to_l[target] < INF]
+
+        def h(v):
+            best = 0.0
+            for from_l, lt, to_l, tl in terms:
+                a = lt - from_l[v]
+                b = to_l[v] - tl
+                if a > best and a < INF:
+                    best = a
+                if b > best and b < INF:
+                    best = b
+            return best
+        return h
+
+    def rank(self, lat: float, lng: float, candidates, k: int):
+        # candidates: [(id, lat, lng)] -> [(segundos, id)] dos k que chegam
+        # antes; quem não tem rota fica de fora
+        target, target_km = self.snap(lat, lng)
+        if target is None:
+            return []
+        snapped = []
+        for key, a_lat, a_lng in candidates:
+            source, source_km = self.snap(a_lat, a_lng)
+            if source is not None:
+                snapped.append((source, (source_km + target_km) / OFFROAD_KMH * 3600, key))
+        if not snapped:
+            return []
+        h = self._heuristic(target)
+        starts = sorted((h(source) + offroad, offroad, source, key) for source, offroad, key in snapped)
+        best = []
+        for lower, offroad, source, key in starts:
+            # Quem nem no melhor caso bate o k-ésimo já achado não precisa de busca
+            if len(best) >= k and lower >= best[k - 1][0]:
+                break
+            seconds = self.eta(source, target, best[k - 1][0] - offroad if len(best) >= k else INF)
+            if seconds is not None:
+                best.append((seconds + offroad, key))
+                best.sort()
+        return best[:k]
+
+
+def _csr(count: int, edges):
+    edges.sort()
+    first_out = array("l", [0]) * (count + 1)
+    head, weight = array("l"), array("f")
+    for tail, to, seconds in edges:
+        first_out[tail + 1] += 1
+        head.append(to)
+        weight.append(seconds)
+    for v in range(count):
+        first_out[v + 1] += first_out[v]
+    return first_out, head, weight
+
+
+def dijkstra(first_out, head, weight, source: int):
+    dist = [INF] * (len(first_out) - 1)
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        d, v = heapq.heappop(heap)
+        if d > dist[v]:
+            continue
+        for e in range(first_out[v], first_out[v + 1]):
+            w = head[e]
+            nd = d + weight[e]
+            if nd < dist[w]:
+                dist[w] = nd
+                heapq.heappush(heap, (nd, w))
+    return dist
+
+
+# --- CARGA (COM CACHE EM DISCO) ---
+def _cache_key(path: str):
+    stat = os.stat(path)
+    return (CACHE_VERSION, stat.st_size, int(stat.st_mtime), ROUTING_LANDMARKS)
+
+
+def load_graph(path: str = ROUTING_OSM_PATH):
+    # Lento na primeira vez (parse + landmarks); rode numa thread
+    cache_path = path + ".graph"
+    key = _cache_key(path)
+    try:
+        with open(cache_path, "rb") as f:
+            cached_key, graph = pickle.load(f)
+        if cached_key == key:
+            graph.build_snap_index()
+            return graph
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+        pass
+    graph = RoadGraph.from_osm(path)
+    graph.build_landmarks()
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump((key, graph), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)  # Troca atômica: outro worker nunca lê pela metade
+    graph.build_snap_index()
+    return graph
+
+
+class Router:
+    # Dono da malha dentro do app: None até terminar de carregar
+    def __init__(self, path: str = ROUTING_OSM_PATH):
+        self.path = path
+        self.graph = None
+
+    @property
+    def ready(self) -> bool:
+        return self.graph is not None
+
+    def load(self):
+        if self.path:
+            self.graph = load_graph(self.path)
+            print(f"Malha viária carregada: {len(self.graph)} nós, {len(self.graph.landmarks)} landmarks")
+
+    def rank(self, lat: float, lng: float, candidates, k: int):
+        return self.graph.rank(lat, lng, candidates, k)
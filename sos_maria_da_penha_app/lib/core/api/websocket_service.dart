@@ -1,5 +1,7 @@
 import 'dart:async';
+import 'dart:collection';
 import 'dart:convert';
+import 'dart:math';
 import 'package:web_socket_channel/web_socket_channel.dart';
 
 class WebSocketService {
@@ -20,6 +22,18 @@ class WebSocketService {
 
   Stream<Map<String, dynamic>> get messages => _controller.stream;
 
+  // 3. Canais assinados: o servidor só manda o que interessa a este aparelho
+  final Set<String> _topics = {};
+
+  // 4. Retomada: último evento visto (event_seq) e a "época" da numeração.
+  // Ao reconectar o servidor reenvia só o que foi perdido nesse meio tempo.
+  String? _epoch;
+  int? _lastSeq;
+  final Set<int> _seen = {}; // Evita processar duas vezes um evento reenviado
+  final Queue<int> _seenOrder = Queue<int>();
+  final Set<String> _seenEvents = {}; // event_id: mesmo evento publicado de novo pelo servidor
+  final Queue<String> _seenEventsOrder = Queue<String>();
+
   // Ajuste o IP conforme necessário (127.0.0.1 para Linux/Web, 10.0.2.2 para Emulador Android)
   final String _url = 'ws://127.0.0.1:8000/ws/monitor';
 
@@ -30,11 +44,31 @@ class WebSocketService {
     try {
       print("Conectando ao WebSocket: $_url");
       _channel = WebSocketChannel.connect(Uri.parse(_url));
+
+      // Reassina os canais e pede os eventos perdidos desde o último visto
+      _channel!.sink.add(jsonEncode({
+        "type": "RESUME",
+        "topics": _topics.toList(),
+        "epoch": _epoch,
+        "event_seq": _lastSeq,
+      }));
       
       _channel!.stream.listen(
         (message) {
-          // Quando chega mensagem, repassa para todos os ouvintes (Broadcast)
           final data = jsonDecode(message);
+          if (data["type"] == "RESUMED" || data["type"] == "RESYNC") {
+            // RESYNC = perdemos mais do que o servidor guarda: vem o estado atual
+            // ("incidents" abertos e "chat" com a última mensagem) e cada tela confere
+            _epoch = data["epoch"];
+            _lastSeq = data["type"] == "RESYNC" || _lastSeq == null
+                ? data["event_seq"]
+                : max(_lastSeq!, data["event_seq"] as int);
+          } else if (data["event_seq"] is int && !_remember(data["event_seq"])) {
+            return; // Já recebido antes (chegou ao vivo e de novo na retomada)
+          } else if (data["event_id"] is String && !_rememberEvent(data["event_id"])) {
+            return; // Alerta repetido pelo outbox (outro event_seq, mesmo event_id)
+          }
+          // Repassa para todos os ouvintes (Broadcast)
           _controller.add(data);
         },
         onError: (error) {
@@ -53,6 +87,21 @@ class WebSocketService {
     }
   }
 
+  bool _remember(int seq) {
+    if (!_seen.add(seq)) return false;
+    _seenOrder.addLast(seq);
+    if (_seenOrder.length > 512) _seen.remove(_seenOrder.removeFirst());
+    if (_lastSeq == null || seq > _lastSeq!) _lastSeq = seq;
+    return true;
+  }
+
+  bool _rememberEvent(String id) {
+    if (!_seenEvents.add(id)) return false;
+    _seenEventsOrder.addLast(id);
+    if (_seenEventsOrder.length > 512) _seenEvents.remove(_seenEventsOrder.removeFirst());
+    return true;
+  }
+
   void _reconnect() {
     // Tenta reconectar após 3 segundos
     Future.delayed(const Duration(seconds: 3), () {
@@ -69,6 +118,11 @@ class WebSocketService {
     }
   }
 
+  void subscribe(List<String> topics) {
+    _topics.addAll(topics);
+    sendMessage({"type": "SUBSCRIBE", "topics": topics});
+  }
+
   void sendStatusUpdate(int incidentId, String status) {
     sendMessage({
       "type": "STATUS_UPDATE",
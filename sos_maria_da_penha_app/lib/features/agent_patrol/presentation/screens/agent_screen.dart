@@ -61,7 +61,12 @@ class _AgentScreenState extends State<AgentScreen> {
         }
       }
       
-      // 2. FECHAMENTO DE CASO
+      // 2. FECHAMENTO DE CASO (ou RESYNC sem o chamado entre os abertos:
+      // o CASE_CLOSED se perdeu enquanto estávamos sem conexão)
+      if (data['type'] == 'RESYNC' && _currentIncident != null &&
+          !(data['incidents'] as List).contains(_currentIncident!['incident_id'])) {
+        _resetPatrol();
+      }
       if (data['type'] == 'CASE_CLOSED') {
         if (_currentIncident != null && data['incident_id'] == _currentIncident!['incident_id']) {
            _resetPatrol();
@@ -97,6 +102,10 @@ class _AgentScreenState extends State<AgentScreen> {
   Future<void> _loadAgentData() async {
     String? name = await _storage.read(key: 'name');
     if (name != null && mounted) setState(() => _agentName = name);
+
+    // Alertas da frota + mensagens direcionadas a esta viatura
+    String? idStr = await _storage.read(key: 'user_id');
+    if (idStr != null) _wsService.subscribe(["role:AGENT", "agent:$idStr"]);
   }
 
   void _resetPatrol() {
@@ -63,7 +63,12 @@ class _ChatScreenState extends State<ChatScreen> {
   // --- 2. CONEXÃO EM TEMPO REAL ---
   void _connectRealTime() {
     _wsService.connect();
+    _wsService.subscribe(["incident:${widget.incidentId}"]);
     _wsService.messages.listen((data) {
+      if (mounted && data['type'] == 'RESYNC') {
+        _catchUp(data['chat']?['${widget.incidentId}']);
+        return;
+      }
       if (mounted && 
           data['type'] == 'NEW_CHAT_MESSAGE' && 
           data['incident_id'] == widget.incidentId) {
@@ -76,6 +81,29 @@ class _ChatScreenState extends State<ChatScreen> {
     });
   }
 
+  // Reconectou tarde demais para o servidor reenviar: busca só o que falta
+  Future<void> _catchUp(int? lastId) async {
+    final int? localId = _messages.isEmpty ? null : _messages.last['id'];
+    if (lastId == null || (localId != null && localId >= lastId)) return;
+    try {
+      final query = localId == null ? '' : '?since=$localId';
+      final response = await http.get(
+        Uri.parse('$baseUrl/api/incidents/${widget.incidentId}/chat$query')
+      );
+      if (response.statusCode == 200 && mounted) {
+        final List<dynamic> data = jsonDecode(response.body);
+        final known = _messages.map((m) => m['id']).toSet();
+        setState(() {
+          _messages.addAll(data.map((e) => Map<String, dynamic>.from(e))
+              .where((m) => !known.contains(m['id'])));
+        });
+        _scrollToBottom();
+      }
+    } catch (e) {
+      print("Erro ao atualizar o chat: $e");
+    }
+  }
+
   // --- 3. ENVIAR IMAGEM (CORRIGIDO PARA LINUX/WEB) ---
   Future<void> _sendImage() async {
     try {
@@ -66,6 +66,18 @@ class _PanicScreenState extends State<PanicScreen> {
     _wsService.messages.listen((data) {
       if (!mounted) return;
 
+      // O CASE_CLOSED se perdeu enquanto estávamos sem conexão
+      if (data['type'] == 'RESYNC' && _currentIncidentId != null &&
+          !(data['incidents'] as List).contains(_currentIncidentId)) {
+        setState(() {
+          _currentIncidentId = null;
+          _isLoading = false;
+          _statusMessage = "Atendimento Finalizado.\nVocê está segura.";
+          _buttonColor = Colors.red;
+        });
+        return;
+      }
+
       if (data['type'] == 'CASE_CLOSED' && 
           _currentIncidentId != null && 
           data['incident_id'] == _currentIncidentId) {
@@ -94,6 +106,10 @@ class _PanicScreenState extends State<PanicScreen> {
   Future<void> _loadUserData() async {
     String? name = await _storage.read(key: 'name');
     if (name != null) setState(() => _userName = name);
+
+    // A vítima só precisa dos eventos dela (o servidor liga o chamado a este canal)
+    String? idStr = await _storage.read(key: 'user_id');
+    if (idStr != null) _wsService.subscribe(["victim:$idStr"]);
   }
 
   Future<void> _activatePanic() async {
@@ -113,6 +129,7 @@ class _PanicScreenState extends State<PanicScreen> {
         );
 
         if (incidentId != null) {
+          _wsService.subscribe(["incident:$incidentId"]);
           setState(() {
             _currentIncidentId = incidentId;
             _isLoading = false;
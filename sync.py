@@ -0,0 +1,207 @@
+import base64
+import json
+import os
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import List, Literal
+
+from pydantic import BaseModel, Field
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from models import ChatMessage, Incident, SyncReceipt
+
+# --- SYNC OFFLINE (PACOTE DO APARELHO) ---
+# Sem sinal, o app guarda posições, mensagens e mudanças de status, cada uma
+# com um client_id (uuid gerado no aparelho). Ao voltar a conexão manda tudo
+# num pacote só, por POST /api/sync ou pelo WebSocket (SYNC_BUNDLE):
+#
+#   {"device_id": "abc", "user_id": 5, "role": "VICTIM", "name": "Maria",
+#    "locations": [{"client_id": "..", "ts": 1767225600.5, "lat": .., "lng": ..}],
+#    "chat":      [{"client_id": "..", "ts": .., "incident_id": 7, "sender_name": "..", "content": ".."}],
+#    "status":    [{"client_id": "..", "ts": .., "incident_id": 7, "new_status": ".."}]}
+#
+# O pacote pode vir comprimido (gzip ou zlib). Tudo é gravado numa transação
+# junto com os client_id em sync_receipts: se o app reenviar o mesmo pacote
+# (caiu antes da resposta), o que já entrou é ignorado. Os recibos duram
+# SYNC_RECEIPT_DAYS: depois disso o app já apagou o pacote (só reenvia o que
+# não teve resposta), então não há mais o que repetir.
+
+SYNC_MAX_BYTES = int(os.getenv("SYNC_MAX_BYTES", str(5 * 1024 * 1024)))  # Depois de descomprimir
+SYNC_MAX_ITEMS = 5000  # Por lista
+MAX_TS = 2 ** 32  # Trajeto guarda o horário em 4 bytes sem sinal
+SYNC_RECEIPT_DAYS = int(os.getenv("SYNC_RECEIPT_DAYS", "7"))
+PRUNE_EVERY_S = 3600
+IN_CHUNK = 500  # Ids por "IN (...)" (limite de variáveis do SQLite)
+
+
+class SyncLocation(BaseModel):
+    client_id: str = Field(min_length=1, max_length=64)
+    ts: float = Field(gt=0, lt=MAX_TS)
+    lat: float = Field(ge=-90, le=90)
+    lng: float = Field(ge=-180, le=180)
+
+
+class SyncChat(BaseModel):
+    client_id: str = Field(min_length=1, max_length=64)
+    ts: float = Field(gt=0, lt=MAX_TS)
+    incident_id: int
+    sender_name: str = Field(max_length=200)
+    content: str = Field(max_length=4000)
+
+
+class SyncStatus(BaseModel):
+    client_id: str = Field(min_length=1, max_length=64)
+    ts: float = Field(gt=0, lt=MAX_TS)
+    incident_id: int
+    new_status: str = Field(max_length=50)
+
+
+class SyncBundle(BaseModel):
+    device_id: str = Field(min_length=1, max_length=64)
+    user_id: int
+    role: Literal["VICTIM", "AGENT"]
+    name: str = ""
+    locations: List[SyncLocation] = Field(default_factory=list, max_length=SYNC_MAX_ITEMS)
+    chat: List[SyncChat] = Field(default_factory=list, max_length=SYNC_MAX_ITEMS)
+    status: List[SyncStatus] = Field(default_factory=list, max_length=SYNC_MAX_ITEMS)
+
+
+class SyncResult:
+    def __init__(self):
+        self.locations = []  # SyncLocation novas, em ordem de ts
+        self.messages = []   # ChatMessage gravadas
+        self.status = []     # SyncStatus novas
+        self.duplicates = 0
+        self.rejected = 0    # Mensagem/status de chamado que não existe
+        self.prepared = None # O que prepare() devolveu (ver store)
+
+    def summary(self) -> dict:
+        return {
+            "accepted": {"locations": len(self.locations), "chat": len(self.messages), "status": len(self.status)},
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+        }
+
+
+# --- LEITURA DO PACOTE ---
+def decompress(data: bytes, max_bytes: int = SYNC_MAX_BYTES) -> bytes:
+    # gzip ou zlib (detecta pelo cabeçalho); para em max_bytes (bomba de compressão)
+    decoder = zlib.decompressobj(wbits=47)
+    try:
+        out = decoder.decompress(data, max_bytes + 1)
+    except zlib.error:
+        raise ValueError("Pacote comprimido inválido")
+    if len(out) > max_bytes or decoder.unconsumed_tail:
+        raise OverflowError("Pacote grande demais")
+    return out
+
+
+def parse(body: bytes, compressed: bool = False) -> SyncBundle:
+    # ValueError (inclusive ValidationError) = pacote inválido
+    if compressed:
+        body = decompress(body)
+    elif len(body) > SYNC_MAX_BYTES:
+        raise OverflowError("Pacote grande demais")
+    return SyncBundle.model_validate(json.loads(body))
+
+
+def parse_ws(data: dict) -> SyncBundle:
+    # {"type": "SYNC_BUNDLE", "bundle": {...}} ou {"type": "SYNC_BUNDLE", "gzip": "<base64>"}
+    if data.get("gzip"):
+        try:
+            raw = base64.b64decode(data["gzip"], validate=True)
+        except (ValueError, TypeError):
+            raise ValueError("gzip deve vir em base64")
+        return parse(raw, compressed=True)
+    return SyncBundle.model_validate(data.get("bundle"))
+
+
+async def read_body(chunks, max_bytes: int = SYNC_MAX_BYTES) -> bytes:
+    # Corpo da requisição aos pedaços: corta em max_bytes mesmo sem
+    # Content-Length (chunked)
+    body = bytearray()
+    async for chunk in chunks:
+        body += chunk
+        if len(body) > max_bytes:
+            raise OverflowError("Pacote grande demais")
+    return bytes(body)
+
+
+# --- GRAVAÇÃO ---
+async def _known(db, model_column, values):
+    found = set()
+    values = list(values)
+    for i in range(0, len(values), IN_CHUNK):
+        found.update(await db.scalars(select(model_column).where(model_column.in_(values[i:i + IN_CHUNK]))))
+    return found
+
+
+async def store(db, bundle: SyncBundle, prepare=None) -> SyncResult:
+    # prepare(result) roda antes do commit: se falhar nada é gravado e o app
+    # pode reenviar. Deve só montar dados (sem efeito fora do banco), que
+    # quem chamou usa depois do commit via result.prepared
+    for attempt in range(2):
+        try:
+            return await _store(db, bundle, prepare)
+        except IntegrityError:
+            # Outro pedido com os mesmos client_id gravou antes: confere de novo
+            await db.rollback()
+            if attempt:
+                raise
+
+
+async def _store(db, bundle: SyncBundle, prepare) -> SyncResult:
+    result = SyncResult()
+    items = [("location", i) for i in bundle.locations] + [("chat", i) for i in bundle.chat] + \
+            [("status", i) for i in bundle.status]
+    seen = await _known(db, SyncReceipt.client_id, {item.client_id for _, item in items})
+    incidents = await _known(db, Incident.id, {item.incident_id for kind, item in items if kind != "location"})
+    now = time.time()
+    for kind, item in items:
+        if item.client_id in seen:
+            result.duplicates += 1
+            continue
+        seen.add(item.client_id)  # Repetido dentro do próprio pacote
+        if kind != "location" and item.incident_id not in incidents:
+            result.rejected += 1
+            continue
+        item.ts = min(item.ts, now)  # Relógio do aparelho adiantado não cria evento no futuro
+        db.add(SyncReceipt(client_id=item.client_id, device_id=bundle.device_id, kind=kind))
+        if kind == "location":
+            result.locations.append(item)
+        elif kind == "chat":
+            sent_at = datetime.fromtimestamp(item.ts)
+            message = ChatMessage(incident_id=item.incident_id, sender_name=item.sender_name, content=item.content,
+                                  timestamp=sent_at.strftime("%H:%M"), sent_at=sent_at)
+            db.add(message)
+            result.messages.append(message)
+        else:
+            result.status.append(item)
+    result.locations.sort(key=lambda item: item.ts)
+    if prepare:
+        result.prepared = prepare(result)  # Se falhar, a sessão fecha sem commit
+    await db.commit()  # expire_on_commit=False: ids das mensagens já estão nos objetos
+    return result
+
+
+_last_prune = 0.0
+
+
+async def prune(db, now: float = None):
+    # Apaga os recibos vencidos (no máximo uma vez por PRUNE_EVERY_S por processo)
+    global _last_prune
+    now = now or time.time()
+    if now - _last_prune < PRUNE_EVERY_S:
+        return 0
+    _last_prune = now
+    cutoff = datetime.fromtimestamp(now) - timedelta(days=SYNC_RECEIPT_DAYS)
+    try:  # O pacote já foi gravado: falha aqui não derruba a resposta
+        result = await db.execute(delete(SyncReceipt).where(SyncReceipt.received_at < cutoff))
+        await db.commit()
+    except Exception as e:
+        print(f"Erro ao apagar recibos antigos do sync: {e}")
+        await db.rollback()
+        return 0
+    return result.rowcount
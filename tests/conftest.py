@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+
+# Antes de importar qualquer módulo do projeto: banco, trajetos, arquivo morto
+# vão para uma pasta temporária (database.py migra ao importar)
+TMP = tempfile.mkdtemp(prefix="sos-tests-")
+os.environ.setdefault("SOS_DATABASE_URL", f"sqlite:///{TMP}/test.db")
+os.environ.setdefault("TRAIL_DIR", os.path.join(TMP, "trails"))
+os.environ.setdefault("ARCHIVE_DIR", os.path.join(TMP, "archive"))
+# app.py (Flask) lê DATABASE_URL: nunca deixar o teste cair no banco do .env
+os.environ["DATABASE_URL"] = f"sqlite:///{TMP}/app.db"
+os.environ.setdefault("JWT_SECRET_KEY", "teste-" + "x" * 32)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from models import Base  # noqa: E402
+
+
+@pytest.fixture
+def engines(tmp_path):
+    # Banco novo por teste: (engine síncrona, fábrica de sessões async)
+    path = tmp_path / "db.sqlite"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(sync_engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    yield sync_engine, async_sessionmaker(async_engine, expire_on_commit=False)
+    sync_engine.dispose()
+    async_engine.sync_engine.dispose()
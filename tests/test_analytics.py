@@ -0,0 +1,46 @@
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import select
+
+import analytics
+from models import Incident, IncidentRollup
+
+
+def test_rebuild_then_bump_merges_into_one_row(engines):
+    sync_engine, session_factory = engines
+    with sync_engine.begin() as conn:
+        conn.execute(Incident.__table__.insert(), [
+            {"latitude": -15.8, "longitude": -47.9, "status": "OPEN", "opened_at": datetime(2026, 1, 30, 9, 15)},
+            {"latitude": -15.8, "longitude": -47.9, "status": "OPEN", "opened_at": datetime(2026, 1, 30, 9, 40)},
+        ])
+        analytics.rebuild_rollups(conn)
+
+    async def close_one():
+        async with session_factory() as db:
+            await analytics.bump(db, -15.8, -47.9, datetime(2026, 1, 30, 9, 15), "OPEN", -1)
+            await analytics.bump(db, -15.8, -47.9, datetime(2026, 1, 30, 9, 15), "CLOSED")
+            await db.commit()
+    asyncio.run(close_one())
+
+    with sync_engine.connect() as conn:
+        rows = conn.execute(select(IncidentRollup.status, IncidentRollup.count)
+                            .order_by(IncidentRollup.status)).all()
+    assert rows == [("CLOSED", 1), ("OPEN", 1)]
+
+
+def test_trend_window_after_rebuild(engines):
+    sync_engine, session_factory = engines
+    with sync_engine.begin() as conn:
+        conn.execute(Incident.__table__.insert(), [
+            {"latitude": -15.8, "longitude": -47.9, "status": "OPEN", "opened_at": datetime(2026, 1, 30, h, 5)}
+            for h in (8, 9, 10)])
+        analytics.rebuild_rollups(conn)
+
+    async def query():
+        async with session_factory() as db:
+            await analytics.bump(db, -15.8, -47.9, datetime(2026, 1, 30, 9, 5), "OPEN")
+            await db.commit()
+            return await analytics.trend(db, since=datetime(2026, 1, 30, 9), until=datetime(2026, 1, 30, 10),
+                                         status="OPEN")
+    assert asyncio.run(query()) == [{"time": "2026-01-30T09:00:00", "count": 2}]
@@ -0,0 +1,78 @@
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("flask_sqlalchemy")
+from app import Ocorrencia, app, create_access_token, db, preparar_banco  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    with app.app_context():
+        Ocorrencia.query.delete()
+        db.session.commit()
+        token = create_access_token(identity=1)
+    client = app.test_client()
+    client.environ_base["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+    return client
+
+
+def _add(total, base=datetime(2026, 1, 1), criado_em=True):
+    with app.app_context():
+        for i in range(total):
+            db.session.add(Ocorrencia(
+                id=i + 1, titulo=f"o{i}", descricao="d", status="nova" if i % 2 else "atribuida",
+                latitude=Decimal(str(-10 + i * 0.001)), longitude=Decimal("-37.0"),
+                criado_em=base + timedelta(minutes=i // 3) if criado_em else None))
+        db.session.commit()
+
+
+def _pages(client, **args):
+    seen, cursor = [], None
+    while True:
+        query = dict(args, **({"cursor": cursor} if cursor else {}))
+        resposta = client.get("/ocorrencias", query_string=query)
+        assert resposta.status_code == 200
+        seen += [o["id"] for o in resposta.json]
+        cursor = resposta.headers.get("X-Next-Cursor")
+        if not cursor:
+            return seen
+
+
+def test_cursor_pages_cover_everything_once(client):
+    _add(250)
+    seen = _pages(client, limit=40, status="nova")
+    assert len(seen) == len(set(seen)) == 125
+    assert seen == sorted(seen, reverse=True)  # mais novas primeiro
+
+
+def test_null_criado_em_does_not_break_the_cursor(client):
+    _add(10, criado_em=False)
+    resposta = client.get("/ocorrencias", query_string={"limit": 5})
+    assert resposta.status_code == 200
+    assert len(resposta.json) == 5
+
+    with app.app_context():
+        preparar_banco()
+        assert Ocorrencia.query.filter(Ocorrencia.criado_em.is_(None)).count() == 0
+    assert sorted(_pages(client, limit=3)) == list(range(1, 11))
+
+
+def test_ndjson_respects_limit(client):
+    _add(30)
+    resposta = client.get("/ocorrencias", query_string={"formato": "ndjson", "limit": 7})
+    linhas = resposta.data.splitlines()
+    assert resposta.mimetype == "application/x-ndjson"
+    assert len(linhas) == 7
+    assert json.loads(linhas[0])["id"] == 30
+
+    tudo = client.get("/ocorrencias", query_string={"formato": "ndjson"}).data.splitlines()
+    assert len(tudo) == 30
+
+
+def test_invalid_filters(client):
+    assert client.get("/ocorrencias", query_string={"bbox": "1,2"}).status_code == 400
+    assert client.get("/ocorrencias", query_string={"cursor": "x"}).status_code == 400
+    assert client.get("/ocorrencias", query_string={"limit": 0}).status_code == 400
@@ -0,0 +1,53 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+import archive
+import database
+from models import ArchivedIncident, ChatMessage, Incident
+
+
+@pytest.fixture(autouse=True)
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path))
+
+
+def test_legacy_closed_incident_is_backfilled_and_archived():
+    with database.engine.begin() as conn:
+        incident_id = conn.execute(Incident.__table__.insert().values(
+            status="CLOSED", latitude=-15.8, longitude=-47.9, opened_at=datetime(2024, 3, 5, 10),
+            closed_at=None)).inserted_primary_key[0]
+        conn.execute(ChatMessage.__table__.insert().values(
+            incident_id=incident_id, sender_name="M", content="socorro", timestamp="10:01",
+            sent_at=datetime(2024, 3, 5, 10, 1)))
+        database._backfill_incident_closed_at(conn)
+
+    ids = archive.archive_batch(datetime(2025, 1, 1))
+    assert incident_id in ids
+    with database.SessionLocal() as db:
+        assert db.get(Incident, incident_id) is None
+        row = db.get(ArchivedIncident, incident_id)
+        assert row.partition == "2024-03"
+
+    async def read():
+        async with database.AsyncSessionLocal() as db:
+            record = await archive.get(db, incident_id)
+            found = [r async for r in archive.search(db, text="socorro")]
+            return record, found
+    record, found = asyncio.run(read())
+    assert record["messages"][0]["content"] == "socorro"
+    assert [r["incident"]["id"] for r in found] == [incident_id]
+
+
+def test_recent_and_open_incidents_stay():
+    with database.engine.begin() as conn:
+        open_id = conn.execute(Incident.__table__.insert().values(
+            status="OPEN", opened_at=datetime(2024, 1, 1))).inserted_primary_key[0]
+        recent_id = conn.execute(Incident.__table__.insert().values(
+            status="CLOSED", opened_at=datetime(2024, 12, 30), closed_at=datetime(2024, 12, 31))).inserted_primary_key[0]
+    archive.archive_batch(datetime(2024, 6, 1))
+    with database.SessionLocal() as db:
+        remaining = set(db.scalars(select(Incident.id)))
+    assert {open_id, recent_id} <= remaining
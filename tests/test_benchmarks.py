@@ -0,0 +1,48 @@
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import micro  # noqa: E402
+
+MICRO = micro.__file__
+SMALL = ["--agents", "200", "--connections", "20", "--repeat", "20", "--tolerance", "100"]
+
+
+def test_hot_path_benchmarks_run():
+    rng = random.Random(1)
+    results = micro.bench_dispatch(rng, 200, 20)
+    results.update(asyncio.run(micro.bench_broadcast(20, 10)))
+    assert set(results) == {"dispatch_grid_k3_200", "dispatch_linear_k3_200", "index_upsert_200",
+                            "broadcast_all_20", "broadcast_all_send_20", "broadcast_topic_20"}
+    assert all(value > 0 for value in results.values())
+
+
+def test_sizes_stay_out_of_the_timings():
+    pytest.importorskip("msgpack")
+    timings, sizes = micro.bench_wire(random.Random(1), 10)
+    assert set(timings) == {"encode_json_agent_moved", "encode_msgpack_agent_moved"}
+    assert set(sizes) == {"json_agent_moved", "msgpack_agent_moved"}
+    assert sizes["msgpack_agent_moved"] < sizes["json_agent_moved"]
+
+
+def test_compare_flags_only_slower_timings(tmp_path):
+    base = tmp_path / "base.json"
+    subprocess.run([sys.executable, MICRO, *SMALL, "--save", str(base)], check=True, capture_output=True)
+    saved = json.loads(base.read_text())
+    assert "sizes" in saved and not any(name.startswith("bytes_") for name in saved)
+
+    # Mensagens menores na base não reprovam; tempos 10⁶x menores sim (folga de 100x para o ruído)
+    saved["sizes"] = {name: 1 for name in saved["sizes"]}
+    base.write_text(json.dumps(saved))
+    assert subprocess.run([sys.executable, MICRO, *SMALL, "--compare", str(base)],
+                          capture_output=True).returncode == 0
+    saved.update({name: value / 1e6 for name, value in saved.items() if name != "sizes"})
+    base.write_text(json.dumps(saved))
+    slower = subprocess.run([sys.executable, MICRO, *SMALL, "--compare", str(base)], capture_output=True, text=True)
+    assert slower.returncode == 1 and "PIOROU" in slower.stdout
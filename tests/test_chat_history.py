@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+import main
+from models import ChatMessage
+
+INCIDENT_ID = 8008
+
+
+@pytest.fixture(scope="module")
+def client():
+    # Sem "with": não sobe o hub nem os workers do lifespan
+    return TestClient(main.app)
+
+
+@pytest.fixture(scope="module")
+def ids():
+    with database.engine.begin() as conn:
+        conn.execute(ChatMessage.__table__.delete().where(ChatMessage.incident_id == INCIDENT_ID))
+        for n in range(12):
+            conn.execute(ChatMessage.__table__.insert().values(
+                incident_id=INCIDENT_ID, sender_name="V", content=f"m{n}", timestamp="10:00",
+                sent_at=datetime(2026, 1, 1, 10, n)))
+        conn.execute(ChatMessage.__table__.insert().values(
+            incident_id=INCIDENT_ID + 1, sender_name="X", content="outro chamado", timestamp="10:00"))
+    with database.SessionLocal() as db:
+        return [m.id for m in db.query(ChatMessage).filter_by(incident_id=INCIDENT_ID).order_by(ChatMessage.id)]
+
+
+def _chat(client, **params):
+    response = client.get(f"/api/incidents/{INCIDENT_ID}/chat", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_streamed_history_in_order(client, ids):
+    messages = _chat(client)
+    assert [m["id"] for m in messages] == ids
+    assert messages[0]["content"] == "m0"
+    assert messages[3]["sent_at"] == "2026-01-01T10:03:00"
+
+
+def test_since_returns_only_newer(client, ids):
+    assert [m["id"] for m in _chat(client, since=ids[8])] == ids[9:]
+    assert [m["id"] for m in _chat(client, since=ids[2], limit=3)] == ids[3:6]
+
+
+def test_before_pages_backwards(client, ids):
+    page = _chat(client, before=ids[10], limit=4)
+    assert [m["id"] for m in page] == ids[6:10]  # As 4 anteriores, ainda em ordem crescente
+    assert [m["id"] for m in _chat(client, before=page[0]["id"], limit=4)] == ids[2:6]
+
+
+def test_empty_history_is_valid_json(client):
+    assert client.get("/api/incidents/999999/chat").json() == []
+    assert client.get(f"/api/incidents/{INCIDENT_ID}/chat", params={"limit": 0}).status_code == 422
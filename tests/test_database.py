@@ -0,0 +1,68 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from database import ChatWriteBehind
+from models import ChatMessage
+
+
+class CountingFactory:
+    # Conta quantas sessões (commits) o ChatWriteBehind abriu
+    def __init__(self, factory):
+        self.factory = factory
+        self.sessions = 0
+
+    def __call__(self):
+        self.sessions += 1
+        return self.factory()
+
+
+def _message(n, incident_id=1):
+    return ChatMessage(incident_id=incident_id, sender_name="V", content=f"m{n}", timestamp="10:00")
+
+
+def _count(sync_engine):
+    with sync_engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(ChatMessage)).scalar()
+
+
+def test_concurrent_messages_share_one_commit(engines):
+    sync_engine, factory = engines
+    counting = CountingFactory(factory)
+
+    async def scenario():
+        writer = ChatWriteBehind(counting, flush_ms=20, max_batch=100)
+        saved = await asyncio.gather(*(writer.add(_message(n)) for n in range(10)))
+        return [message.id for message in saved]
+    ids = asyncio.run(scenario())
+    assert counting.sessions == 1
+    assert len(set(ids)) == 10 and None not in ids
+    assert _count(sync_engine) == 10
+
+
+def test_full_batch_flushes_without_waiting(engines):
+    sync_engine, factory = engines
+    counting = CountingFactory(factory)
+
+    async def scenario():
+        writer = ChatWriteBehind(counting, flush_ms=60_000, max_batch=5)
+        await asyncio.wait_for(asyncio.gather(*(writer.add(_message(n)) for n in range(5))), 5)
+        writer.timer.cancel()
+    asyncio.run(scenario())
+    assert counting.sessions == 1
+    assert _count(sync_engine) == 5
+
+
+def test_failed_commit_reaches_every_caller():
+    class Broken:
+        async def __aenter__(self):
+            raise RuntimeError("banco fora")
+
+        async def __aexit__(self, *exc):
+            return False
+
+    async def scenario():
+        writer = ChatWriteBehind(Broken, flush_ms=1)
+        return await asyncio.gather(*(writer.add(_message(n)) for n in range(3)), return_exceptions=True)
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import io
+import os
+import threading
+
+import pytest
+from starlette.requests import Request
+
+import evidence
+
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(evidence, "UPLOAD_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _photo(path, size=(2000, 1000)):
+    Image.new("RGB", size, (200, 30, 60)).save(path, "JPEG")
+    return str(path)
+
+
+def _request(body: bytes, boundary="xyz"):
+    chunks = [body[i:i + 1000] for i in range(0, len(body), 1000)] or [b""]
+
+    async def receive():
+        if chunks:
+            chunk = chunks.pop(0)
+            return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+        return {"type": "http.disconnect"}
+
+    headers = [
+        (b"content-type", f"multipart/form-data; boundary={boundary}".encode()),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    return Request({"type": "http", "method": "POST", "headers": headers}, receive)
+
+
+def _multipart(data: bytes, filename="foto.JPG", boundary="xyz"):
+    return (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+
+
+def test_render_variants_sizes(uploads):
+    source = _photo(uploads / "src.jpg")
+    sha = "ab" * 32
+    targets = [(evidence.variant_path(sha, name), size) for name, size in evidence.VARIANTS.items()]
+    evidence._render_variants(source, targets)
+    for path, size in targets:
+        with Image.open(path) as image:
+            assert max(image.size) == size
+    assert not [n for n in os.listdir(os.path.dirname(targets[0][0])) if n.endswith(".part")]
+
+
+def test_concurrent_renders_of_same_sha(uploads):
+    # Dois envios da mesma foto geram as mesmas variantes ao mesmo tempo
+    source = _photo(uploads / "src.jpg")
+    sha = "cd" * 32
+    targets = [(evidence.variant_path(sha, name), size) for name, size in evidence.VARIANTS.items()]
+    errors = []
+
+    def render():
+        try:
+            for _ in range(5):
+                evidence._render_variants(source, targets)
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=render) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    for path, _ in targets:
+        with Image.open(path) as image:
+            image.verify()
+    assert not [n for n in os.listdir(os.path.dirname(targets[0][0])) if n.endswith(".part")]
+
+
+def test_receive_dedupes_by_content(uploads):
+    buffer = io.BytesIO()
+    Image.new("RGB", (10, 10)).save(buffer, "JPEG")
+    data = buffer.getvalue()
+    sha = hashlib.sha256(data).hexdigest()
+
+    first = asyncio.run(evidence.receive(_request(_multipart(data))))
+    second = asyncio.run(evidence.receive(_request(_multipart(data, filename="outra.png"))))
+    assert first == (sha, os.path.join(str(uploads), sha[:2], f"{sha}.jpg"), False)
+    assert second == (sha, first[1], True)
+    assert os.listdir(uploads / ".tmp") == []
+
+
+def test_receive_rejects_oversize(uploads):
+    body = _multipart(b"x" * 5000)
+    with pytest.raises(evidence.HTTPException) as info:
+        asyncio.run(evidence.receive(_request(body), max_bytes=1000))
+    assert info.value.status_code == 413
+    assert os.listdir(uploads / ".tmp") == []
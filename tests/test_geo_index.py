@@ -0,0 +1,55 @@
+import random
+
+import pytest
+
+from geo_index import GridIndex, calculate_distance
+
+
+def _brute(points, lat, lng, max_km=None):
+    found = sorted((calculate_distance(lat, lng, *p), key) for key, p in points.items())
+    return [item for item in found if max_km is None or item[0] <= max_km]
+
+
+@pytest.mark.parametrize("center", [(-15.8, -47.9), (64.1, -21.9)])  # Brasília e perto do polo
+def test_nearest_matches_linear_scan(center):
+    rng = random.Random(7)
+    index, points = GridIndex(), {}
+    for key in range(800):
+        points[key] = (center[0] + rng.uniform(-0.3, 0.3), center[1] + rng.uniform(-0.3, 0.3))
+        index.upsert(key, *points[key])
+    for _ in range(50):
+        lat, lng = center[0] + rng.uniform(-0.4, 0.4), center[1] + rng.uniform(-0.4, 0.4)
+        for k in (1, 3, 10):
+            assert [key for _, key in index.nearest(lat, lng, k=k)] == \
+                [key for _, key in _brute(points, lat, lng)[:k]]
+        assert [key for _, key in index.nearest(lat, lng, k=5, max_km=2)] == \
+            [key for _, key in _brute(points, lat, lng, max_km=2)[:5]]
+
+
+def test_sparse_grid_falls_back_to_scan():
+    index = GridIndex()
+    index.upsert("a", -15.0, -47.0)
+    index.upsert("b", -25.0, -49.0)
+    assert [key for _, key in index.nearest(-24.0, -49.0, k=2)] == ["b", "a"]
+
+
+def test_upsert_moves_between_cells_and_remove():
+    index = GridIndex()
+    index.upsert(1, -15.801, -47.901)
+    index.upsert(1, -15.5, -47.5)
+    assert len(index) == 1 and index.get(1) == (-15.5, -47.5)
+    assert sum(len(bucket) for bucket in index.cells.values()) == 1
+    assert index.nearest(-15.8, -47.9, k=1, max_km=1) == []
+    index.remove(1)
+    assert 1 not in index and index.cells == {}
+    assert index.nearest(-15.5, -47.5) == []
+
+
+def test_within_radius_matches_linear_scan():
+    rng = random.Random(3)
+    index, points = GridIndex(), {}
+    for key in range(500):
+        points[key] = (-15.8 + rng.uniform(-0.2, 0.2), -47.9 + rng.uniform(-0.2, 0.2))
+        index.upsert(key, *points[key])
+    for radius in (0.5, 3, 50):
+        assert index.within_radius(-15.8, -47.9, radius) == _brute(points, -15.8, -47.9, max_km=radius)
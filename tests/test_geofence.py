@@ -0,0 +1,73 @@
+from geo_index import KM_PER_DEG
+from geofence import GeofenceEngine
+
+HOME = (-15.80, -47.90)
+
+
+def _north(meters, origin=HOME):
+    # Ponto a tantos metros ao norte (1 grau de latitude ~ KM_PER_DEG km)
+    return origin[0] + meters / 1000 / KM_PER_DEG, origin[1]
+
+
+def _step(engine, kind, entity_id, meters):
+    engine.move(kind, entity_id, *_north(meters))
+    return [(event["type"], event["target"]) for event in engine.check(kind, entity_id)]
+
+
+def _engine():
+    engine = GeofenceEngine(hysteresis=0.2)
+    engine.add_measure(1, victim_id=10, aggressor_id=20, min_distance_m=500,
+                       zones=[{"id": 7, "label": "casa", "lat": HOME[0], "lng": HOME[1], "radius_m": 300}])
+    return engine
+
+
+def test_pair_breach_and_hysteresis():
+    engine = _engine()
+    assert _step(engine, "victim", 10, 0) == []  # Agressor ainda sem posição
+    assert _step(engine, "aggressor", 20, 2000) == []
+    assert _step(engine, "victim", 10, 1600) == [("GEOFENCE_BREACH", "victim")]  # 400 m
+    assert _step(engine, "victim", 10, 1450) == []  # 550 m: ainda dentro da folga (600 m)
+    assert _step(engine, "victim", 10, 1600) == []  # Sem alerta repetido
+    assert _step(engine, "victim", 10, 1350) == [("GEOFENCE_CLEARED", "victim")]  # 650 m
+
+
+def test_zone_breach_and_exit_from_far_away():
+    engine = _engine()
+    assert _step(engine, "aggressor", 20, 250) == [("GEOFENCE_BREACH", "zone:7")]
+    assert engine.check("aggressor", 20) == []
+    # Saiu direto para longe (fora da busca no índice): ainda assim sai da violação
+    assert _step(engine, "aggressor", 20, 50_000) == [("GEOFENCE_CLEARED", "zone:7")]
+
+
+def test_breach_event_payload():
+    engine = _engine()
+    engine.move("aggressor", 20, *_north(100))
+    [event] = engine.check("aggressor", 20)
+    assert event["measure_id"] == 1 and event["victim_id"] == 10 and event["aggressor_id"] == 20
+    assert event["zone_label"] == "casa"
+    assert event["limit_m"] == 300 and 95 <= event["distance_m"] <= 105
+    assert event["location"]["lat"] == _north(100)[0]
+
+
+def test_other_workers_apply_events():
+    first, second = _engine(), _engine()
+    first.move("aggressor", 20, *HOME)
+    for event in first.check("aggressor", 20):
+        second.apply_event(event)
+    assert second.inside == first.inside == {(1, "zone:7")}
+    # O segundo worker não repete o alerta
+    assert _step(second, "aggressor", 20, 10) == []
+
+
+def test_measure_updates_and_strangers():
+    engine = _engine()
+    assert _step(engine, "aggressor", 99, 0) == []  # Sem medida: ignorado
+    assert 99 not in engine.aggressors
+    _step(engine, "aggressor", 20, 0)
+    engine.apply_event({"type": "MEASURE_UPDATED", "measure_id": 1, "active": False})
+    assert engine.inside == set() and engine.measures == {}
+    assert engine.zone_index.positions == {} and engine.by_aggressor == {}
+    engine.apply_event({"type": "MEASURE_UPDATED", "measure_id": 2, "victim_id": 10, "aggressor_id": 20,
+                        "min_distance_m": 1000})
+    engine.move("victim", 10, *HOME)
+    assert _step(engine, "aggressor", 20, 900) == [("GEOFENCE_BREACH", "victim")]
@@ -0,0 +1,70 @@
+import asyncio
+
+from incident_feed import IncidentFeed
+
+
+class FakeDB:
+    # Devolve as linhas de _query() (id, nome, status, created_at, lat, lng, opened_at)
+    def __init__(self, rows, during=None):
+        self.rows = rows
+        self.during = during
+
+    async def execute(self, stmt):
+        if self.during:
+            self.during()
+        rows = self.rows
+
+        class Result:
+            def all(self):
+                return rows
+        return Result()
+
+
+def _rows(ids):
+    return [(i, f"V{i}", "OPEN", "01/01/2026 às 10:00", -15.8, -47.9, None) for i in sorted(ids, reverse=True)]
+
+
+def _alert(incident_id):
+    return {"type": "NEW_PANIC_ALERT", "incident_id": incident_id, "victim_id": 1, "victim_name": "V",
+            "time": "x", "location": {"lat": -15.8, "lng": -47.9}}
+
+
+def test_events_before_load_are_not_buffered():
+    feed = IncidentFeed(size=10)
+    for _ in range(1000):
+        feed.apply_event({"type": "AGENT_MOVED"})
+        feed.apply_event(_alert(1))
+    assert feed.buffered == []
+
+
+def test_events_during_load_are_applied():
+    feed = IncidentFeed(size=10)
+
+    def concurrent_events():
+        feed.apply_event({"type": "CASE_CLOSED", "incident_id": 2})
+        feed.apply_event({"type": "NEW_CHAT_MESSAGE", "incident_id": 2})
+        assert len(feed.buffered) == 1
+
+    asyncio.run(feed.ensure_loaded(FakeDB(_rows([1, 2]), during=concurrent_events)))
+    assert feed.loading == 0 and feed.buffered == []
+    rows, cursor = feed.page(10)
+    assert [(r["id"], r["status"]) for r in rows] == [(2, "CLOSED"), (1, "OPEN")]
+
+
+def test_etag_changes_for_incidents_outside_the_cache():
+    feed = IncidentFeed(size=2)
+    asyncio.run(feed.ensure_loaded(FakeDB(_rows([1, 2, 3]))))
+    assert not feed.complete and 1 not in feed.rows
+    before = feed.etag("cursor=2")
+    feed.apply_event({"type": "CASE_CLOSED", "incident_id": 1})
+    assert feed.etag("cursor=2") != before
+    # Página além do cache: vai ao banco
+    assert feed.page(5, cursor=2) is None
+
+
+def test_archived_incidents_leave_the_cache():
+    feed = IncidentFeed(size=10)
+    asyncio.run(feed.ensure_loaded(FakeDB(_rows([1, 2]))))
+    feed.apply_event(_alert(3))
+    feed.apply_event({"type": "INCIDENTS_ARCHIVED", "incident_ids": [1, 3]})
+    assert [r["id"] for r in feed.page(10)[0]] == [2]
@@ -0,0 +1,57 @@
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # Métricas criadas no teste não ficam no /metrics dos outros
+    monkeypatch.setattr(metrics, "REGISTRY", [])
+    return metrics.REGISTRY
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = metrics.Histogram("t_seconds", "teste", ["type"], buckets=(0.01, 0.1, 1.0))
+    for seconds in (0.005, 0.05, 0.05, 0.5, 3.0):
+        histogram.observe(seconds, "PANIC")
+    histogram.observe(0.01, "CHAT")  # No limite cai no próprio bucket (le = menor ou igual)
+    lines = list(histogram.render())
+    assert lines[:2] == ["# HELP t_seconds teste", "# TYPE t_seconds histogram"]
+    assert 't_seconds_bucket{type="CHAT",le="0.01"} 1' in lines
+    assert [line.split()[-1] for line in lines if line.startswith('t_seconds_bucket{type="PANIC"')] == \
+        ["1", "3", "4", "5"]
+    assert 't_seconds_count{type="PANIC"} 5' in lines
+    total = next(line for line in lines if line.startswith('t_seconds_sum{type="PANIC"}'))
+    assert float(total.split()[-1]) == pytest.approx(3.605)
+
+
+def test_timer_observes_elapsed(registry):
+    histogram = metrics.Histogram("t_timer_seconds", "teste")
+    with histogram.time():
+        pass
+    assert histogram.series[()][-1] == 1
+
+
+def test_counter_and_gauge_render(registry):
+    plain = metrics.Counter("t_total", "sem labels")
+    labelled = metrics.Counter("t_jobs_total", "com labels", ["kind", "result"])
+    labelled.inc("telegram", "done")
+    labelled.inc("telegram", "done", amount=2)
+    metrics.Gauge("t_connections", "conexões", lambda: 7)
+    text = metrics.render()
+    assert "t_total 0\n" in text  # Sem labels já aparece zerado
+    assert 't_jobs_total{kind="telegram",result="done"} 3\n' in text
+    assert "# TYPE t_connections gauge\nt_connections 7\n" in text
+    assert plain.values == {(): 0}
+
+
+def test_metrics_endpoint_includes_sql_timings():
+    from fastapi.testclient import TestClient
+
+    import main
+    client = TestClient(main.app)
+    client.get("/api/incidents/1/chat", params={"limit": 1})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'sos_sql_seconds_count{statement="SELECT"}' in response.text
@@ -0,0 +1,130 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+import outbox
+from models import OutboxJob
+
+
+def _add_jobs(factory, total, kind="alert"):
+    async def add():
+        async with factory() as db:
+            for n in range(total):
+                outbox.add(db, kind, {"n": n}, key=f"{kind}:{n}")
+            await db.commit()
+    return add()
+
+
+async def _jobs(factory):
+    async with factory() as db:
+        return (await db.scalars(select(OutboxJob).order_by(OutboxJob.id))).all()
+
+
+async def _until(factory, done, timeout=10):
+    # Espera todas as tarefas saírem de PENDING (ou a condição "done")
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        jobs = await _jobs(factory)
+        if done(jobs):
+            return jobs
+        await asyncio.sleep(0.02)
+    raise AssertionError("outbox não terminou a tempo")
+
+
+def test_two_workers_run_each_job_once(engines, monkeypatch):
+    _, factory = engines
+    monkeypatch.setattr(outbox, "OUTBOX_POLL_S", 0.01)
+    calls = Counter()
+
+    async def scenario():
+        workers = [outbox.OutboxWorker(factory, workers=3) for _ in range(2)]
+        for worker in workers:
+            @worker.handler("alert")
+            async def alert(payload, key):
+                calls[key] += 1
+                await asyncio.sleep(0.001)
+            await worker.start()
+        await _add_jobs(factory, 40)
+        for worker in workers:
+            worker.wake()
+        jobs = await _until(factory, lambda jobs: all(job.status == "DONE" for job in jobs))
+        for worker in workers:
+            await worker.stop()
+        return jobs
+    jobs = asyncio.run(scenario())
+    assert len(jobs) == 40
+    assert calls == Counter({f"alert:{n}": 1 for n in range(40)})
+    assert all(job.locked_by is None and job.done_at for job in jobs)
+
+
+def test_failures_back_off_then_give_up(engines, monkeypatch):
+    _, factory = engines
+    monkeypatch.setattr(outbox, "OUTBOX_POLL_S", 0.01)
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+
+    async def scenario():
+        worker = outbox.OutboxWorker(factory, workers=1)
+
+        @worker.handler("sms")
+        async def sms(payload, key):
+            raise RuntimeError("provedor fora")
+        await worker.start()
+        await _add_jobs(factory, 1, kind="sms")
+        worker.wake()
+        [job] = await _until(factory, lambda jobs: jobs[0].attempts == 1)
+        assert job.status == "PENDING" and "provedor fora" in job.last_error
+        assert job.available_at > datetime.now() + timedelta(seconds=1)  # Espera 2^1 s
+        # Adianta o relógio da tarefa em vez de esperar o backoff
+        async with factory() as db:
+            await db.execute(update(OutboxJob).values(available_at=datetime.now()))
+            await db.commit()
+        worker.wake()
+        [job] = await _until(factory, lambda jobs: jobs[0].status != "PENDING")
+        await worker.stop()
+        return job
+    job = asyncio.run(scenario())
+    assert job.status == "FAILED" and job.attempts == 2
+
+
+def test_expired_lease_is_claimed_again(engines, monkeypatch):
+    _, factory = engines
+    monkeypatch.setattr(outbox, "OUTBOX_POLL_S", 0.01)
+    calls = []
+
+    async def scenario():
+        await _add_jobs(factory, 1)
+        # Worker que morreu com a tarefa pega e o prazo vencido
+        async with factory() as db:
+            await db.execute(update(OutboxJob).values(locked_by="morto",
+                                                      locked_until=datetime.now() - timedelta(seconds=1)))
+            await db.commit()
+        worker = outbox.OutboxWorker(factory, workers=1)
+
+        @worker.handler("alert")
+        async def alert(payload, key):
+            calls.append(payload)
+        await worker.start()
+        [job] = await _until(factory, lambda jobs: jobs[0].status == "DONE")
+        await worker.stop()
+        return job
+    asyncio.run(scenario())
+    assert calls == [{"n": 0}]
+
+
+def test_stop_releases_claimed_jobs(engines):
+    _, factory = engines
+
+    async def scenario():
+        worker = outbox.OutboxWorker(factory, workers=1)
+
+        @worker.handler("alert")
+        async def alert(payload, key):
+            pass
+        await _add_jobs(factory, 2)
+        assert await worker._claim() == 2  # Pegou, mas nenhum _work rodou
+        await worker.stop()
+        return await _jobs(factory)
+    jobs = asyncio.run(scenario())
+    assert all(job.status == "PENDING" and job.locked_by is None for job in jobs)
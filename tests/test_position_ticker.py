@@ -0,0 +1,124 @@
+import position_ticker
+from position_ticker import E6, PositionTicker
+from realtime import ClientConnection, ConnectionManager
+
+
+class FakeConn:
+    # Só o que o ConnectionManager e o ticker usam de um ClientConnection
+    sees = ClientConnection.sees
+
+    def __init__(self, name):
+        self.websocket = name
+        self.filtered = False
+        self.topics = set()
+        self.viewport = None
+        self.frames = []
+
+    def enqueue(self, frame):
+        self.frames.append(frame)
+
+
+class Client:
+    # Mesma lógica do painel (templates/dashboard.html, resolvePositions)
+    def __init__(self):
+        self.base = {}
+        self.pending = {}
+        self.positions = {}
+
+    def apply(self, frame):
+        for seq in sorted(self.pending):
+            if frame["base"] is not None and seq <= frame["base"]:
+                self.base.update(self.pending.pop(seq))
+        if frame["base"] is None:
+            self.base = {}
+        sent = {}
+        for kind, entries in (("agent", frame["agents"]), ("victim", frame["victims"])):
+            for e in entries:
+                key = (kind, e["id"])
+                if "dlat" in e:
+                    lat, lng = self.base[key][0] + e["dlat"], self.base[key][1] + e["dlng"]
+                else:
+                    lat, lng = round(e["lat"] * E6), round(e["lng"] * E6)
+                sent[key] = (lat, lng)
+                self.positions[key] = (lat, lng)
+        self.pending[frame["seq"]] = sent
+
+
+def _setup():
+    manager = ConnectionManager()
+    ticker = PositionTicker(manager, interval_ms=100, min_move_m=5)
+    return manager, ticker
+
+
+def _connect(manager, name):
+    conn = FakeConn(name)
+    manager.connections[name] = conn
+    manager.unfiltered.add(conn)
+    return conn
+
+
+def _update(ticker, entity_id, lat, lng):
+    key = ("agent", entity_id)
+    ticker.latest[key] = {"lat": lat, "lng": lng, "name": f"A{entity_id}", "topics": ["role:DASHBOARD"]}
+    ticker.dirty.add(key)
+
+
+def test_late_subscriber_sees_stopped_unit():
+    manager, ticker = _setup()
+    early = _connect(manager, "early")
+    _update(ticker, 1, -15.0, -47.0)
+    ticker.flush()
+    _update(ticker, 1, -15.0, -47.00001)  # Menos de 5 m: ninguém recebe de novo
+    ticker.flush()
+    assert len(early.frames) == 1
+
+    late = _connect(manager, "late")
+    ticker.flush()
+    assert [a["id"] for a in late.frames[0]["agents"]] == [1]
+    assert len(early.frames) == 1
+
+
+def test_resync_sends_everything_again():
+    manager, ticker = _setup()
+    conn = _connect(manager, "c")
+    _update(ticker, 1, -15.0, -47.0)
+    _update(ticker, 2, -15.1, -47.0)
+    ticker.flush()
+    ticker.resync("c")
+    ticker.flush()
+    assert sorted(a["id"] for a in conn.frames[-1]["agents"]) == [1, 2]
+    assert all("lat" in a for a in conn.frames[-1]["agents"])
+
+
+def test_client_base_matches_server_after_unacked_cap(monkeypatch):
+    monkeypatch.setattr(position_ticker, "MAX_UNACKED_FRAMES", 4)
+    manager, ticker = _setup()
+    conn = _connect(manager, "c")
+    client = Client()
+    expected = {}
+
+    def move(entity_id, lat):
+        _update(ticker, entity_id, lat, -47.0)
+        expected[("agent", entity_id)] = (round(lat * E6), -47 * E6)
+
+    def tick(ack=False):
+        ticker.flush()
+        frame = conn.frames[-1]
+        client.apply(frame)
+        if ack:
+            ticker.ack("c", frame["seq"])
+        assert client.positions == expected
+
+    move(1, -15.0)
+    move(2, -16.0)
+    tick(ack=True)
+    move(2, -16.01)  # A viatura 2 só anda neste quadro, que passa do limite sem ACK
+    move(1, -15.01)
+    tick()
+    for i in range(6):
+        move(1, -15.02 - i * 0.01)
+        tick()
+    move(1, -15.5)
+    tick(ack=True)
+    move(2, -16.02)  # Delta da 2 tem que partir da mesma base nos dois lados
+    tick()
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+import presence
+from presence import InMemoryHub, SqliteHub
+
+
+class Recorder:
+    def __init__(self, hub):
+        self.seqs = []
+        self.presence = []
+        self.links = []
+        hub.bind(self.message, self.on_presence, self.link)
+
+    async def message(self, message, topics, location, seq):
+        if message.get("boom"):
+            raise RuntimeError("falha no socket")
+        self.seqs.append(seq)
+
+    async def on_presence(self, role, user_id, info):
+        self.presence.append((role, user_id, info))
+
+    def link(self, source, topic):
+        self.links.append((source, topic))
+
+
+async def _hubs(path, n=2):
+    hubs = [SqliteHub(str(path)) for _ in range(n)]
+    recorders = [Recorder(hub) for hub in hubs]
+    for hub in hubs:
+        await hub.start()
+    return hubs, recorders
+
+
+def test_memory_hub_numbers_events():
+    async def run():
+        hub = InMemoryHub()
+        rec = Recorder(hub)
+        await hub.publish({"type": "A"})
+        await hub.publish({"type": "B"})
+        return rec.seqs
+    assert asyncio.run(run()) == [1, 2]
+
+
+def test_local_publish_waits_for_lower_seqs_from_other_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(presence, "PRESENCE_POLL_MS", 60_000)  # Só o publish entrega
+
+    async def run():
+        (a, b), (rec_a, rec_b) = await _hubs(tmp_path / "hub.db")
+        await b.publish({"type": "FROM_B"})
+        await a.publish({"type": "FROM_A"})
+        await b.publish({"type": "FROM_B"})
+        await a.publish({"type": "FROM_A"})
+        for hub in (a, b):
+            await hub.stop()
+        return rec_a.seqs, rec_b.seqs
+    seqs_a, seqs_b = asyncio.run(run())
+    assert seqs_a == [1, 2, 3, 4]
+    assert seqs_b == [1, 2, 3]  # O 4 chegaria no próximo ciclo do _poll
+
+
+def test_poll_survives_errors_and_keeps_fan_out(tmp_path, monkeypatch):
+    monkeypatch.setattr(presence, "PRESENCE_POLL_MS", 10)
+
+    async def run():
+        (a, b), (rec_a, rec_b) = await _hubs(tmp_path / "hub.db")
+        fetch = a._fetch
+        calls = {"n": 0}
+
+        def flaky():
+            calls["n"] += 1
+            if calls["n"] == 1:
+                raise ValueError("erro inesperado")
+            return fetch()
+        a._fetch = flaky
+        await b.publish({"boom": True})
+        await b.publish({"type": "OK"})
+        await b.set_presence("AGENT", 3, {"lat": 1.0, "lng": 2.0})
+        await b.link("agent:3", "incident:9")
+        await asyncio.sleep(0.2)
+        for hub in (a, b):
+            await hub.stop()
+        return rec_a, calls["n"]
+    rec_a, calls = asyncio.run(run())
+    assert calls > 1
+    assert rec_a.seqs == [2]  # O 1 falhou na entrega e não travou o resto
+    assert rec_a.presence == [("AGENT", 3, {"lat": 1.0, "lng": 2.0})]
+    assert rec_a.links == [("agent:3", "incident:9")]
+
+
+def test_new_worker_inherits_presence(tmp_path):
+    async def run():
+        (a,), _ = await _hubs(tmp_path / "hub.db", n=1)
+        await a.set_presence("VICTIM", 5, {"lat": 1.0, "lng": 2.0})
+        (b,), (rec_b,) = await _hubs(tmp_path / "hub.db", n=1)
+        for hub in (a, b):
+            await hub.stop()
+        return rec_b.presence, b.seq
+    inherited, seq = asyncio.run(run())
+    assert inherited == [("VICTIM", 5, {"lat": 1.0, "lng": 2.0})]
+    assert seq == 1
@@ -0,0 +1,146 @@
+import asyncio
+
+import realtime
+from realtime import ConnectionManager
+
+
+class FakeSocket:
+    client = None
+
+    def __init__(self, subprotocols=(), delay=0.0, fail=False):
+        self.scope = {"subprotocols": list(subprotocols)}
+        self.delay = delay
+        self.fail = fail
+        self.sent = []
+        self.closed = None
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, data):
+        if self.fail:
+            raise ConnectionResetError
+        await asyncio.sleep(self.delay)
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        await self.send_text(data)
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+async def _settle():
+    # Deixa as tarefas de envio rodarem (o socket lento continua preso)
+    await asyncio.sleep(0.05)
+
+
+def test_slow_client_does_not_hold_the_others():
+    async def scenario():
+        manager = ConnectionManager()
+        slow, fast = FakeSocket(delay=60), FakeSocket()
+        await manager.connect(slow)
+        await manager.connect(fast)
+        for i in range(3):
+            await manager.broadcast({"type": "PANIC_ALERT", "n": i})
+        await _settle()
+        assert len(fast.sent) == 3
+        assert len(slow.sent) == 0 and len(manager.connections[slow].outbox) == 2
+        manager.disconnect(slow)
+        manager.disconnect(fast)
+    asyncio.run(scenario())
+
+
+def test_full_outbox_drops_positions_before_alerts(monkeypatch):
+    monkeypatch.setattr(realtime, "OUTBOX_SIZE", 3)
+    monkeypatch.setattr(realtime, "SLOW_CLIENT_POLICY", "drop_oldest")
+
+    async def scenario():
+        manager = ConnectionManager()
+        ws = FakeSocket(delay=60)
+        await manager.connect(ws)
+        conn = manager.connections[ws]
+        conn.stop()  # Ninguém esvazia a fila
+        conn.closing = False
+        for message in ({"type": "PANIC_ALERT", "n": 1}, {"type": "AGENT_MOVED", "n": 2},
+                        {"type": "PANIC_ALERT", "n": 3}, {"type": "PANIC_ALERT", "n": 4},
+                        {"type": "PANIC_ALERT", "n": 5}):
+            conn.enqueue(message)
+        # Primeiro sai a posição, depois o alerta mais antigo
+        assert [frame.message["n"] for frame in conn.outbox] == [3, 4, 5]
+        assert conn.dropped == 2
+    asyncio.run(scenario())
+
+
+def test_disconnect_policy_closes_slow_client(monkeypatch):
+    monkeypatch.setattr(realtime, "OUTBOX_SIZE", 2)
+    monkeypatch.setattr(realtime, "SLOW_CLIENT_POLICY", "disconnect")
+
+    async def scenario():
+        manager = ConnectionManager()
+        ws = FakeSocket(delay=60)
+        await manager.connect(ws)
+        for i in range(5):
+            await manager.broadcast({"type": "PANIC_ALERT", "n": i})
+        await _settle()
+        assert ws not in manager.connections
+        assert ws.closed == 1013
+    asyncio.run(scenario())
+
+
+def test_failed_send_disconnects():
+    async def scenario():
+        manager = ConnectionManager()
+        ws = FakeSocket(fail=True)
+        await manager.connect(ws)
+        await manager.broadcast({"type": "PANIC_ALERT"})
+        await _settle()
+        assert ws not in manager.connections
+        assert ws.closed == 1011
+    asyncio.run(scenario())
+
+
+def test_topics_and_viewport_pick_recipients():
+    async def scenario():
+        manager = ConnectionManager()
+        legacy, incident, dashboard, agent = (FakeSocket() for _ in range(4))
+        for ws in (legacy, incident, dashboard, agent):
+            await manager.connect(ws)
+        manager.subscribe(incident, ["incident:7"])
+        manager.subscribe(dashboard, ["role:DASHBOARD"])
+        manager.set_viewport(dashboard, {"south": -16, "west": -48, "north": -15, "east": -47})
+        manager.subscribe(agent, ["agent:3"], exclusive=False)  # Inscrição automática: continua recebendo tudo
+
+        def who(topics, location=None):
+            return {conn.websocket for conn in manager.recipients(topics, location)}
+
+        assert who(None) == {legacy, incident, dashboard, agent}
+        assert who(["incident:7"]) == {legacy, incident, agent}
+        assert who(["role:DASHBOARD"], {"lat": -15.5, "lng": -47.5}) == {legacy, dashboard, agent}
+        assert who(["role:DASHBOARD"], {"lat": -10.0, "lng": -47.5}) == {legacy, agent}
+        # Canal específico não passa pelo recorte; e o recorte sozinho já basta
+        manager.subscribe(dashboard, ["incident:8"])
+        assert dashboard in who(["incident:8"], {"lat": 0.0, "lng": 0.0})
+        assert dashboard in who(["role:AGENT"], {"lat": -15.5, "lng": -47.5})
+        for ws in (legacy, incident, dashboard, agent):
+            manager.disconnect(ws)
+        assert manager.topics == {} and not manager.viewers and not manager.unfiltered
+    asyncio.run(scenario())
+
+
+def test_link_and_unsubscribe():
+    async def scenario():
+        manager = ConnectionManager()
+        victim = FakeSocket()
+        await manager.connect(victim)
+        manager.subscribe(victim, ["victim:5"])
+        manager.link("victim:5", "incident:9")
+        await manager.broadcast({"type": "NEW_CHAT_MESSAGE", "incident_id": 9}, topics=["incident:9"])
+        await manager.broadcast({"type": "NEW_CHAT_MESSAGE", "incident_id": 1}, topics=["incident:1"])
+        manager.unsubscribe(victim, ["incident:9"])
+        await manager.broadcast({"type": "NEW_CHAT_MESSAGE", "incident_id": 9}, topics=["incident:9"])
+        await _settle()
+        assert victim.sent == ['{"type":"NEW_CHAT_MESSAGE","incident_id":9}']
+        assert "incident:9" not in manager.topics
+        manager.disconnect(victim)
+    asyncio.run(scenario())
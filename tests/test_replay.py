@@ -0,0 +1,51 @@
+from replay import ReplayBuffer
+
+
+def _seqs(found):
+    return [frame.message["event_seq"] for frame, _ in found]
+
+
+def _chat(incident_id):
+    return {"type": "NEW_CHAT_MESSAGE", "incident_id": incident_id}
+
+
+def test_missed_events_in_seq_order():
+    buffer = ReplayBuffer()
+    buffer.record(_chat(1), ["incident:1"], None, 1)
+    buffer.record({"type": "NEW_PANIC_ALERT"}, None, {"lat": 1, "lng": 2}, 2)
+    buffer.record(_chat(2), ["incident:2"], None, 3)
+    buffer.record(_chat(1), ["incident:1", "role:DASHBOARD"], None, 5)
+    buffer.record(_chat(1), ["incident:1"], None, 4)  # Outro worker, chegou atrasado
+
+    assert _seqs(buffer.missed(["incident:1"], 1)) == [2, 4, 5]  # Inclui o que foi para todos
+    assert _seqs(buffer.missed(None, 0)) == [1, 2, 3, 4, 5]
+    assert buffer.missed(["incident:1"], 5) == []
+    assert buffer.missed(["incident:1"], 2)[0][1] is None
+    assert buffer.missed(None, 1)[0][1] == {"lat": 1, "lng": 2}
+    assert buffer.last_seq == 5
+
+
+def test_gap_larger_than_ring_needs_resync():
+    buffer = ReplayBuffer(per_topic=3)
+    for seq in range(1, 7):
+        buffer.record(_chat(1), ["incident:1"], None, seq)
+    assert buffer.missed(["incident:1"], 2) is None  # 3 já saiu do buffer
+    assert _seqs(buffer.missed(["incident:1"], 3)) == [4, 5, 6]
+
+
+def test_forgotten_topic_needs_resync():
+    buffer = ReplayBuffer(max_topics=2)
+    buffer.record(_chat(1), ["incident:1"], None, 1)
+    buffer.record(_chat(2), ["incident:2"], None, 2)
+    buffer.record(_chat(3), ["incident:3"], None, 3)  # incident:1 sai inteiro
+    assert "incident:1" not in buffer.rings
+    assert buffer.missed(["incident:1"], 0) is None
+    assert buffer.missed(["incident:1"], 1) == []
+
+
+def test_before_process_start_needs_resync():
+    buffer = ReplayBuffer()
+    buffer.start_seq = 10
+    buffer.record(_chat(1), ["incident:1"], None, 11)
+    assert buffer.missed(["incident:1"], 9) is None
+    assert _seqs(buffer.missed(["incident:1"], 10)) == [11]
@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+import routing
+
+
+def _grid_osm(path, size=8, step=0.002, seed=1):
+    # Malha quadriculada com velocidades e mãos únicas sorteadas
+    rnd = random.Random(seed)
+    lines = ['<?xml version="1.0"?>', "<osm>"]
+    node_id = lambda r, c: r * size + c + 1  # noqa: E731
+    for r in range(size):
+        for c in range(size):
+            lines.append(f'<node id="{node_id(r, c)}" lat="{-10 + r * step}" lon="{-37 + c * step}"/>')
+    way = 1
+    for r in range(size):
+        for c in range(size):
+            for dr, dc in ((0, 1), (1, 0)):
+                if r + dr >= size or c + dc >= size:
+                    continue
+                tags = {"highway": rnd.choice(["residential", "primary", "service"])}
+                if rnd.random() < 0.3:
+                    tags["maxspeed"] = rnd.choice(["30", "60", "20 mph", "0", "none"])
+                if rnd.random() < 0.2:
+                    tags["oneway"] = rnd.choice(["yes", "-1"])
+                lines.append(f'<way id="{way}"><nd ref="{node_id(r, c)}"/><nd ref="{node_id(r + dr, c + dc)}"/>')
+                lines += [f'<tag k="{k}" v="{v}"/>' for k, v in tags.items()]
+                lines.append("</way>")
+                way += 1
+    lines.append("</osm>")
+    path.write_text("\n".join(lines))
+    return str(path)
+
+
+def test_speed_falls_back_on_zero_or_unknown():
+    assert routing._speed({"highway": "primary", "maxspeed": "60"}) == 60
+    assert routing._speed({"highway": "primary", "maxspeed": "20 mph"}) == pytest.approx(32.18)
+    assert routing._speed({"highway": "primary", "maxspeed": "0"}) == routing.SPEED_KMH["primary"]
+    assert routing._speed({"highway": "service", "maxspeed": "none"}) == routing.SPEED_KMH["service"]
+
+
+def test_from_osm_with_zero_maxspeed(tmp_path):
+    path = tmp_path / "zero.osm"
+    path.write_text(
+        '<osm><node id="1" lat="-10" lon="-37"/><node id="2" lat="-10.01" lon="-37"/>'
+        '<way id="1"><nd ref="1"/><nd ref="2"/><tag k="highway" v="residential"/>'
+        '<tag k="maxspeed" v="0"/></way></osm>')
+    graph = routing.RoadGraph.from_osm(str(path))
+    assert len(graph) == 2
+    assert all(0 < w < routing.INF for w in graph.weight)
+
+
+def test_alt_matches_dijkstra(tmp_path):
+    graph = routing.load_graph(_grid_osm(tmp_path / "grid.osm"))
+    assert graph.landmarks
+    rnd = random.Random(2)
+    for _ in range(30):
+        source, target = rnd.randrange(len(graph)), rnd.randrange(len(graph))
+        expected = routing.dijkstra(graph.first_out, graph.head, graph.weight, source)[target]
+        got = graph.eta(source, target)
+        if expected == routing.INF:
+            assert got is None
+        else:
+            assert got == pytest.approx(expected, rel=1e-4)
+
+
+def test_cached_graph_is_reused(tmp_path):
+    path = _grid_osm(tmp_path / "grid.osm")
+    first = routing.load_graph(path)
+    second = routing.load_graph(path)
+    assert list(second.weight) == list(first.weight)
+    assert len(second.landmarks) == len(first.landmarks)
+
+
+def test_rank_orders_by_travel_time(tmp_path):
+    graph = routing.load_graph(_grid_osm(tmp_path / "grid.osm"))
+    target = (-10 + 0.002 * 3, -37 + 0.002 * 3)
+    candidates = [(key, -10 + 0.002 * r, -37 + 0.002 * c)
+                  for key, (r, c) in enumerate([(0, 0), (3, 4), (7, 7), (2, 3), (6, 1)])]
+    ranked = graph.rank(*target, candidates, k=3)
+    assert len(ranked) <= 3
+    assert [s for s, _ in ranked] == sorted(s for s, _ in ranked)
+    # k=len: os k primeiros de uma busca maior são os mesmos
+    full = graph.rank(*target, candidates, k=len(candidates))
+    assert ranked == full[:len(ranked)]
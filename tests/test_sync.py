@@ -0,0 +1,107 @@
+import asyncio
+import gzip
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import func, select
+
+import sync
+from models import ChatMessage, Incident, SyncReceipt
+
+
+def _bundle(incident_id, **extra):
+    now = time.time()
+    data = {
+        "device_id": "dev", "user_id": 5, "role": "VICTIM",
+        "locations": [{"client_id": f"l{i}", "ts": now - 60 + i, "lat": -15.8, "lng": -47.9} for i in range(3)],
+        "chat": [{"client_id": "c1", "ts": now, "incident_id": incident_id, "sender_name": "M", "content": "oi"},
+                 {"client_id": "c2", "ts": now, "incident_id": 999, "sender_name": "M", "content": "x"}],
+        "status": [{"client_id": "s1", "ts": now, "incident_id": incident_id, "new_status": "NO_LOCAL"}],
+    }
+    data.update(extra)
+    return sync.SyncBundle.model_validate(data)
+
+
+@pytest.fixture
+def incident_id(engines):
+    sync_engine, _ = engines
+    with sync_engine.begin() as conn:
+        return conn.execute(Incident.__table__.insert().values(status="OPEN")).inserted_primary_key[0]
+
+
+def test_resent_bundle_is_deduplicated(engines, incident_id):
+    sync_engine, session_factory = engines
+
+    async def run():
+        async with session_factory() as db:
+            first = await sync.store(db, _bundle(incident_id))
+        async with session_factory() as db:
+            second = await sync.store(db, _bundle(incident_id))
+        return first.summary(), second.summary()
+    first, second = asyncio.run(run())
+    assert first == {"accepted": {"locations": 3, "chat": 1, "status": 1}, "duplicates": 0, "rejected": 1}
+    assert second == {"accepted": {"locations": 0, "chat": 0, "status": 0}, "duplicates": 5, "rejected": 1}
+    with sync_engine.connect() as conn:
+        assert conn.scalar(select(func.count()).select_from(ChatMessage)) == 1
+
+
+def test_failed_prepare_commits_nothing(engines, incident_id):
+    sync_engine, session_factory = engines
+
+    def boom(result):
+        raise RuntimeError("trajeto")
+
+    async def run():
+        async with session_factory() as db:
+            with pytest.raises(RuntimeError):
+                await sync.store(db, _bundle(incident_id), prepare=boom)
+    asyncio.run(run())
+    with sync_engine.connect() as conn:
+        assert conn.scalar(select(func.count()).select_from(SyncReceipt)) == 0
+
+
+@pytest.mark.parametrize("ts", [-5, 0, 2 ** 32, 1e12])
+def test_out_of_range_timestamps_are_rejected(ts):
+    with pytest.raises(ValidationError):
+        _bundle(1, locations=[{"client_id": "x", "ts": ts, "lat": 0, "lng": 0}])
+
+
+def test_compressed_bundle_is_capped():
+    body = gzip.compress(json.dumps({"device_id": "d", "user_id": 1, "role": "AGENT"}).encode())
+    assert sync.parse(body, compressed=True).user_id == 1
+    with pytest.raises(OverflowError):
+        sync.decompress(gzip.compress(b" " * 2048), max_bytes=1024)
+
+
+def test_read_body_caps_chunked_streams():
+    async def chunks(n):
+        for _ in range(n):
+            yield b"x" * 100
+
+    assert asyncio.run(sync.read_body(chunks(3), max_bytes=300)) == b"x" * 300
+    with pytest.raises(OverflowError):
+        asyncio.run(sync.read_body(chunks(4), max_bytes=300))
+
+
+def test_prune_removes_expired_receipts(engines, monkeypatch):
+    sync_engine, session_factory = engines
+    now = time.time()
+    with sync_engine.begin() as conn:
+        conn.execute(SyncReceipt.__table__.insert(), [
+            {"client_id": "old", "kind": "location",
+             "received_at": datetime.fromtimestamp(now) - timedelta(days=sync.SYNC_RECEIPT_DAYS + 1)},
+            {"client_id": "new", "kind": "location", "received_at": datetime.fromtimestamp(now)},
+        ])
+    monkeypatch.setattr(sync, "_last_prune", 0.0)
+
+    async def run():
+        async with session_factory() as db:
+            removed = await sync.prune(db, now)
+            again = await sync.prune(db, now + 1)  # Só uma vez por PRUNE_EVERY_S
+            return removed, again
+    assert asyncio.run(run()) == (1, 0)
+    with sync_engine.connect() as conn:
+        assert conn.scalars(select(SyncReceipt.client_id)).all() == ["new"]
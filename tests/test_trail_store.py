@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+
+import pytest
+
+import trail_store
+from trail_store import RECORD, E6
+
+
+@pytest.fixture(autouse=True)
+def trail_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(trail_store, "TRAIL_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _records(points):
+    return b"".join(RECORD.pack(ts, round(lat * E6), round(lng * E6)) for ts, lat, lng in points)
+
+
+DAY = 1_767_225_600  # 2026-01-01 00:00 UTC
+
+
+def test_out_of_order_flushes_keep_main_segment_sorted():
+    path = trail_store.segment_path("agent", 7, trail_store._day(DAY))
+    trail_store.write_records(path, _records([(DAY + 10, -15.8, -47.9), (DAY + 20, -15.8, -47.9)]))
+    trail_store.write_records(path, _records([(DAY + 5, -15.7, -47.9), (DAY + 30, -15.6, -47.9)]))
+
+    main = trail_store.read_segment(path, 0, 2 ** 32)
+    assert [ts for ts, _, _ in main] == [DAY + 10, DAY + 20, DAY + 30]
+    track = trail_store.read_track("agent", 7, DAY, DAY + 100)
+    assert [ts for ts, _, _ in track] == [DAY + 5, DAY + 10, DAY + 20, DAY + 30]
+    # Janela que começa antes do ponto atrasado não perde nada
+    assert [ts for ts, _, _ in trail_store.read_track("agent", 7, DAY + 6, DAY + 25)] == [DAY + 10, DAY + 20]
+
+
+def test_partial_record_is_dropped_before_append():
+    path = trail_store.segment_path("agent", 7, trail_store._day(DAY))
+    trail_store.write_records(path, _records([(DAY + 1, 1.0, 2.0)]))
+    with open(path, "ab") as f:
+        f.write(b"\x01\x02\x03")  # Queda no meio de uma escrita
+    trail_store.write_records(path, _records([(DAY + 2, 1.0, 2.0)]))
+    assert os.path.getsize(path) == 2 * RECORD.size
+    assert [ts for ts, _, _ in trail_store.read_track("agent", 7, DAY, DAY + 10)] == [DAY + 1, DAY + 2]
+
+
+def _writer(trail_dir, offset):
+    trail_store.TRAIL_DIR = trail_dir
+    path = trail_store.segment_path("agent", 1, trail_store._day(DAY))
+    for i in range(50):
+        ts = DAY + i * 2 + offset
+        trail_store.write_records(path, _records([(ts, 1.0, 2.0)]))
+
+
+def test_workers_appending_to_the_same_unit_lose_no_points(trail_dir):
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_writer, args=(str(trail_dir), offset)) for offset in (0, 1)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    path = trail_store.segment_path("agent", 1, trail_store._day(DAY))
+    main = [ts for ts, _, _ in trail_store.read_segment(path, 0, 2 ** 32)]
+    assert main == sorted(main)
+    track = trail_store.read_track("agent", 1, DAY, DAY + 200)
+    assert [ts for ts, _, _ in track] == list(range(DAY, DAY + 100))
+
+
+def test_store_buffers_and_flushes(trail_dir):
+    import asyncio
+
+    async def run():
+        store = trail_store.TrailStore(flush_s=60)
+        store.append("victim", 3, -15.8, -47.9, ts=DAY + 1)
+        store.extend(store.encode("victim", 3, [(DAY + 2, -15.8, -47.9)], late=True))
+        await store.stop()
+    asyncio.run(run())
+    assert [ts for ts, _, _ in trail_store.read_track("victim", 3, DAY, DAY + 10)] == [DAY + 1, DAY + 2]
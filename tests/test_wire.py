@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+import wire
+from wire import Frame
+
+msgpack = pytest.importorskip("msgpack")
+
+
+class FakeSocket:
+    def __init__(self, subprotocols):
+        self.scope = {"subprotocols": subprotocols}
+
+
+def _moved():
+    return {"type": "AGENT_MOVED", "agent_id": 3, "location": {"lat": -15.8, "lng": -47.9}, "name": "Viatura"}
+
+
+def test_short_codes_are_unique():
+    assert len(set(wire.SHORT_KEYS.values())) == len(wire.SHORT_KEYS)
+    assert len(set(wire.SHORT_TYPES.values())) == len(wire.SHORT_TYPES)
+    # Uma chave curta não pode ser também o nome longo de outra
+    assert not set(wire.SHORT_KEYS.values()) & set(wire.SHORT_KEYS)
+
+
+def test_frame_encodes_once():
+    frame = Frame(_moved())
+    assert frame.text() is frame.text()
+    assert frame.binary() is frame.binary()
+    assert json.loads(frame.text()) == _moved()
+    assert " " not in frame.text().replace("Viatura", "")
+
+
+def test_binary_is_short_and_round_trips():
+    frame = Frame(_moved())
+    packed = msgpack.unpackb(frame.binary())
+    assert packed == {"t": 1, "g": 3, "l": {"a": -15.8, "o": -47.9}, "n": "Viatura"}
+    assert len(frame.binary()) < len(frame.text().encode())
+    assert wire.decode({"bytes": frame.binary()}) == _moved()
+
+
+def test_decode_json_and_unknown_keys():
+    assert wire.decode({"text": '{"type":"RESUME","seq":4}'}) == {"type": "RESUME", "seq": 4}
+    message = {"t": 99, "extra": [{"c": "oi"}]}
+    assert wire.decode({"bytes": msgpack.packb(message)}) == {"type": 99, "extra": [{"content": "oi"}]}
+
+
+def test_bundle_passes_untranslated():
+    # O pacote do sync tem formato próprio: "ts", "c"... não podem virar timestamp/content
+    bundle = {"device_id": "d1", "items": [{"ts": 1700000000.5, "c": "x", "t": "chat"}]}
+    raw = msgpack.packb({"t": wire.SHORT_TYPES["SYNC_BUNDLE"], "bundle": bundle})
+    assert wire.decode({"bytes": raw}) == {"type": "SYNC_BUNDLE", "bundle": bundle}
+
+
+def test_negotiate():
+    assert wire.negotiate(FakeSocket(["sos.msgpack"])) == wire.SUBPROTOCOL_MSGPACK
+    assert wire.negotiate(FakeSocket([])) is None
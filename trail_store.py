@@ -0,0 +1,263 @@
+import asyncio
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos (lá roda um worker só)
+    fcntl = None
+
+# --- TRAJETOS (POSIÇÕES AO LONGO DO TEMPO) ---
+# Cada GPS recebido vira um registro binário de tamanho fixo:
+#     (segundos unix uint32, lat * 1e6 int32, lng * 1e6 int32) = 12 bytes
+# gravado só no fim (append) do arquivo da entidade naquele dia:
+#     trails/20260130/agent_7.trk
+# A escrita é agrupada (TRAIL_FLUSH_S) e feita numa thread. A leitura abre
+# o arquivo com mmap e acha o começo da janela por busca binária no tempo.
+# Pontos atrasados (enviados depois, pelo sync offline) vão para um arquivo à
+# parte, "agent_7.late.trk", fora de ordem: o principal continua ordenado
+# para a busca binária e o atrasado, pequeno, é lido inteiro.
+# O principal fica ordenado mesmo com vários workers (ou duas gravações da
+# mesma thread fora de ordem): cada gravação trava o arquivo, olha o último
+# registro e manda para o ".late" o que for mais antigo que ele.
+# Dias com mais de TRAIL_SIMPLIFY_AFTER_DAYS são simplificados com
+# Douglas–Peucker (tolerância TRAIL_SIMPLIFY_M) e marcados com ".simplified".
+
+TRAIL_DIR = os.getenv("TRAIL_DIR", "./trails")
+TRAIL_FLUSH_S = float(os.getenv("TRAIL_FLUSH_S", "5"))
+TRAIL_MAX_BUFFER = 10_000  # Registros pendentes que forçam uma gravação
+TRAIL_SIMPLIFY_AFTER_DAYS = int(os.getenv("TRAIL_SIMPLIFY_AFTER_DAYS", "2"))
+TRAIL_SIMPLIFY_M = float(os.getenv("TRAIL_SIMPLIFY_M", "10"))
+SIMPLIFY_EVERY_S = 3600
+
+RECORD = struct.Struct("<Iii")
+E6 = 1_000_000
+SIMPLIFIED_MARK = ".simplified"
+
+
+def _day(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y%m%d")
+
+
+def segment_path(kind: str, entity_id, day: str, late: bool = False) -> str:
+    return os.path.join(TRAIL_DIR, day, f"{kind}_{entity_id}{'.late' if late else ''}.trk")
+
+
+def _days_between(since: float, until: float):
+    day = int(since // 86400)
+    while day * 86400 <= until:
+        yield _day(day * 86400)
+        day += 1
+
+
+def _lower_bound(buf, count: int, ts: int) -> int:
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if RECORD.unpack_from(buf, mid * RECORD.size)[0] < ts:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def read_segment(path: str, since: float, until: float, ordered: bool = True):
+    # [(ts, lat, lng)] dentro da janela, lido via mmap (ordered=False: varre tudo)
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            count = size // RECORD.size  # Ignora um registro pela metade no fim
+            if count == 0:
+                return []
+            with mmap.mmap(f.fileno(), count * RECORD.size, access=mmap.ACCESS_READ) as buf:
+                start = _lower_bound(buf, count, int(since)) if ordered else 0
+                points = []
+                for ts, lat, lng in RECORD.iter_unpack(buf[start * RECORD.size:count * RECORD.size]):
+                    if ts > until:
+                        if ordered:
+                            break
+                        continue
+                    if ts >= since:
+                        points.append((ts, lat / E6, lng / E6))
+                return points
+    except FileNotFoundError:
+        return []
+
+
+def _late_path(path: str) -> str:
+    return path[:-len(".trk")] + ".late.trk"
+
+
+_write_lock = threading.Lock()  # Sem fcntl a trava é só dentro do processo
+
+
+def _append_unordered(path: str, data: bytes):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def _append(path: str, data: bytes):
+    # O_APPEND: cada write vai inteiro para o fim, mesmo com outro worker escrevendo
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        size = os.fstat(fd).st_size
+        if size % RECORD.size:  # Registro pela metade (queda no meio da escrita)
+            size -= size % RECORD.size
+            os.ftruncate(fd, size)
+        last = RECORD.unpack(os.pread(fd, RECORD.size, size - RECORD.size))[0] if size else 0
+        records = sorted(RECORD.iter_unpack(data))
+        split = next((i for i, r in enumerate(records) if r[0] >= last), len(records))
+        os.write(fd, b"".join(RECORD.pack(*r) for r in records[split:]))
+    finally:
+        os.close(fd)  # Solta a trava
+    return b"".join(RECORD.pack(*r) for r in records[:split])  # Mais antigos que o fim do arquivo
+
+
+def write_records(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _write_lock:
+        if path.endswith(".late.trk"):
+            _append_unordered(path, data)
+            return
+        older = _append(path, data)
+        if older:
+            _append_unordered(_late_path(path), older)
+
+
+def read_track(kind: str, entity_id, since: float, until: float):
+    points = []
+    for day in _days_between(since, until):
+        day_points = read_segment(segment_path(kind, entity_id, day), since, until)
+        late = read_segment(segment_path(kind, entity_id, day, late=True), since, until, ordered=False)
+        if late:
+            day_points = sorted(day_points + late)
+        points.extend(day_points)
+    return points
+
+
+# --- SIMPLIFICAÇÃO (DOUGLAS–PEUCKER) ---
+def _offset_m(lat0, a, b):
+    # Distância em metros de b até a, num plano local (suficiente para poucos km)
+    kx = 111_195 * math.cos(math.radians(lat0))
+    return (b[2] - a[2]) * kx, (b[1] - a[1]) * 111_195
+
+
+def simplify(points, tolerance_m: float):
+    if len(points) < 3:
+        return list(points)
+    lat0 = points[0][1]
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:  # Iterativo: trajeto de um dia inteiro estouraria a recursão
+        first, last = stack.pop()
+        dx, dy = _offset_m(lat0, points[first], points[last])
+        length = math.hypot(dx, dy)
+        worst, worst_i = -1.0, None
+        for i in range(first + 1, last):
+            px, py = _offset_m(lat0, points[first], points[i])
+            if length == 0:
+                dist = math.hypot(px, py)
+            else:
+                dist = abs(dx * py - dy * px) / length
+            if dist > worst:
+                worst, worst_i = dist, i
+        if worst_i is not None and worst > tolerance_m:
+            keep[worst_i] = True
+            stack.append((first, worst_i))
+            stack.append((worst_i, last))
+    return [p for p, k in zip(points, keep) if k]
+
+
+def simplify_old_days(now: float = None, tolerance_m: float = TRAIL_SIMPLIFY_M):
+    # Reescreve cada arquivo dos dias antigos só com os pontos que importam
+    now = now or time.time()
+    cutoff = _day(now - TRAIL_SIMPLIFY_AFTER_DAYS * 86400)
+    if not os.path.isdir(TRAIL_DIR):
+        return
+    for day in sorted(os.listdir(TRAIL_DIR)):
+        folder = os.path.join(TRAIL_DIR, day)
+        if day >= cutoff or not os.path.isdir(folder) or os.path.exists(os.path.join(folder, SIMPLIFIED_MARK)):
+            continue
+        for name in os.listdir(folder):
+            if not name.endswith(".trk"):
+                continue
+            path = os.path.join(folder, name)
+            points = read_segment(path, 0, 2 ** 32, ordered=not name.endswith(".late.trk"))
+            points.sort()
+            kept = simplify(points, tolerance_m)
+            with open(path + ".tmp", "wb") as f:
+                f.write(b"".join(RECORD.pack(ts, round(lat * E6), round(lng * E6)) for ts, lat, lng in kept))
+            os.replace(path + ".tmp", path)
+        open(os.path.join(folder, SIMPLIFIED_MARK), "w").close()
+
+
+class TrailStore:
+    def __init__(self, flush_s: float = TRAIL_FLUSH_S):
+        self.flush_s = flush_s
+        self.pending = {}  # (caminho) -> bytearray com registros prontos
+        self.count = 0
+        self.task = None
+        self.last_simplify = 0.0
+
+    def append(self, kind: str, entity_id, lat: float, lng: float, ts: float = None, late: bool = False):
+        ts = ts or time.time()
+        path = segment_path(kind, entity_id, _day(ts), late)
+        self.pending.setdefault(path, bytearray()).extend(RECORD.pack(int(ts), round(lat * E6), round(lng * E6)))
+        self.count += 1
+        if self.count >= TRAIL_MAX_BUFFER:
+            asyncio.create_task(self.flush())
+        elif self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    @staticmethod
+    def encode(kind: str, entity_id, points, late: bool = False) -> dict:
+        # points: [(ts, lat, lng)] -> {caminho: registros}. Separado de extend para
+        # quem precisa saber que os pontos são válidos antes de confirmar algo (sync)
+        records = {}
+        for ts, lat, lng in points:
+            path = segment_path(kind, entity_id, _day(ts), late)
+            records.setdefault(path, bytearray()).extend(RECORD.pack(int(ts), round(lat * E6), round(lng * E6)))
+        return records
+
+    def extend(self, records: dict):
+        for path, data in records.items():
+            self.pending.setdefault(path, bytearray()).extend(data)
+            self.count += len(data) // RECORD.size
+        if self.count >= TRAIL_MAX_BUFFER:
+            asyncio.create_task(self.flush())
+        elif records and self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_s)
+            await self.flush()
+            if time.time() - self.last_simplify > SIMPLIFY_EVERY_S:
+                self.last_simplify = time.time()
+                await asyncio.to_thread(simplify_old_days)
+
+    async def flush(self):
+        batch, self.pending, self.count = self.pending, {}, 0
+        if batch:
+            await asyncio.to_thread(self._write, batch)
+
+    @staticmethod
+    def _write(batch):
+        for path, data in batch.items():
+            write_records(path, data)
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        await self.flush()
@@ -0,0 +1,109 @@
+import json
+
+try:
+    import msgpack
+except ImportError:  # Sem msgpack o servidor só fala JSON
+    msgpack = None
+
+# --- FORMATO DAS MENSAGENS NO FIO ---
+# Cada evento é codificado uma vez só (Frame) e os mesmos bytes vão para
+# todos os sockets que usam aquele formato.
+#
+# JSON continua sendo o padrão (painel e apps atuais). Um cliente pode pedir
+# o formato binário no handshake com o subprotocolo "sos.msgpack":
+#     new WebSocket(url, ["sos.msgpack"])
+# Nesse modo as mensagens vão em MessagePack com as chaves curtas de
+# SHORT_KEYS e o "type" trocado pelo número de SHORT_TYPES. O cliente pode
+# mandar nos dois formatos: texto é lido como JSON e binário como MessagePack.
+# O conteúdo de OPAQUE_KEYS (pacote do sync, formato próprio em sync.py)
+# passa sem traduzir: vai sempre com as chaves longas.
+
+SUBPROTOCOL_MSGPACK = "sos.msgpack"
+
+SHORT_KEYS = {
+    "type": "t", "location": "l", "lat": "a", "lng": "o", "name": "n",
+    "agent_id": "g", "victim_id": "v", "incident_id": "i", "user_id": "u",
+    "victim_name": "vn", "agent_name": "an", "target_agent_name": "tn",
+    "message": "m", "time": "tm", "opened_at": "oa", "final_report": "r",
+    "sender_name": "s", "content": "c", "timestamp": "ts", "sent_at": "sa",
+    "distance": "d", "candidates": "cs", "status": "st", "topics": "tp", "bbox": "bb",
+    "seq": "q", "base": "b", "agents": "ag", "victims": "vs", "dlat": "da", "dlng": "do",
+    "event_seq": "e", "epoch": "ep", "replayed": "rp",
+    "measure_id": "mi", "aggressor_id": "ai", "target": "tg", "distance_m": "dm", "limit_m": "lm",
+    "incident_ids": "is", "event_id": "ei",
+}
+SHORT_TYPES = {
+    "AGENT_MOVED": 1, "VICTIM_MOVED": 2, "POSITIONS_SNAPSHOT": 3, "NEW_PANIC_ALERT": 4,
+    "DISPATCH_CONFIRMED": 5, "NO_AGENTS_AVAILABLE": 6, "NEW_CHAT_MESSAGE": 7,
+    "STATUS_UPDATE": 8, "CASE_CLOSED": 9, "RESUMED": 10, "RESYNC": 11,
+    "GEOFENCE_BREACH": 12, "GEOFENCE_CLEARED": 13, "MEASURE_UPDATED": 14, "INCIDENTS_ARCHIVED": 15,
+    "SYNC_RESULT": 16,
+    # Do cliente para o servidor
+    "AGENT_LOCATION_UPDATE": 20, "VICTIM_LOCATION_UPDATE": 21, "DISPATCH_NEAREST": 22,
+    "SEND_CHAT_MESSAGE": 23, "SUBSCRIBE": 24, "UNSUBSCRIBE": 25, "POSITIONS_ACK": 26,
+    "SET_VIEWPORT": 27, "RESUME": 28, "AGGRESSOR_LOCATION_UPDATE": 29,
+    "SYNC_BUNDLE": 30,
+}
+OPAQUE_KEYS = {"bundle"}
+LONG_KEYS = {short: long for long, short in SHORT_KEYS.items()}
+LONG_TYPES = {code: name for name, code in SHORT_TYPES.items()}
+
+
+def _shorten(value):
+    if isinstance(value, dict):
+        return {SHORT_KEYS.get(k, k): (SHORT_TYPES.get(v, v) if k == "type" else _shorten(v))
+                for k, v in value.items()}
+    if isinstance(value, list):
+        return [_shorten(v) for v in value]
+    return value
+
+
+def _expand(value):
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            k = LONG_KEYS.get(k, k)
+            if k == "type":
+                out[k] = LONG_TYPES.get(v, v)
+            else:
+                out[k] = v if k in OPAQUE_KEYS else _expand(v)
+        return out
+    if isinstance(value, list):
+        return [_expand(v) for v in value]
+    return value
+
+
+def negotiate(websocket) -> str:
+    # Subprotocolo pedido no handshake -> o que responder no accept()
+    if msgpack is not None and SUBPROTOCOL_MSGPACK in websocket.scope.get("subprotocols", ()):
+        return SUBPROTOCOL_MSGPACK
+    return None
+
+
+def decode(raw: dict) -> dict:
+    # raw é o evento "websocket.receive" do ASGI
+    if raw.get("bytes") is not None:
+        if msgpack is None:
+            raise ValueError("MessagePack indisponível")
+        return _expand(msgpack.unpackb(raw["bytes"]))
+    return json.loads(raw["text"])
+
+
+class Frame:
+    __slots__ = ("message", "type", "_text", "_binary")
+
+    def __init__(self, message: dict):
+        self.message = message
+        self.type = message.get("type")
+        self._text = None
+        self._binary = None
+
+    def text(self) -> str:
+        if self._text is None:
+            self._text = json.dumps(self.message, ensure_ascii=False, separators=(",", ":"))
+        return self._text
+
+    def binary(self) -> bytes:
+        if self._binary is None:
+            self._binary = msgpack.packb(_shorten(self.message))
+        return self._binary